@@ -1,28 +1,47 @@
 from wsgiref.util import request_uri
 
-from quart import Quart,request,g,jsonify
+from quart import Quart,request,g,jsonify,Response
 from quart_schema import QuartSchema, Info, OpenAPIProvider
 import logging
 from services.database_service import DBConnection
 from services.elasticsearch_service import ESConnection
+from services.reference_cache import reference_cache
+from services.uom_cache import uom_cache
+from services.price_cache import price_snapshot
+from services.brand_filters import brand_terms
+from services.lang_fallback import lang_fallback
+from services.brand_statistics import statistics_materializer
+from services.element_previews import element_previews
+from services.request_memo import memo_totals
+from services.single_flight import entity_flight
+from services.response_cache import entity_responses
+from utils.http_cache import http_caching
+from services.export_service import export_settings
+from utils.pagination import cursor_paging
+from services.delta_feed import delta_settings
+from services.tracing import current_trace, tracing
+from services.metrics import metrics
+from services.loop_watchdog import loop_watchdog
 from core.environment import env
 from routes.product_routes import product_bp
 from routes.sku_routes import sku_bp
 from routes.operating_mode_routes import operating_mode_bp
 from routes.category_routes import category_bp
 from routes.assignments_routes import assignments_bp
+from routes.export_routes import export_bp
 from utils.error_handler import register_error_handlers
-from utils.utilities import shop_statistics
-from utils.mapping import unmap_locale,get_epimLang_by_market
+from utils.mapping import get_market_divisions, map_brand
 from quart_compress import Compress
 import time
-from datetime import datetime
-from zoneinfo import ZoneInfo
 import asyncio
 from deepdiff import DeepDiff
 import httpx
 import json
 import os
+from datetime import datetime, timezone
+
+import orjson
+from werkzeug.datastructures import ImmutableMultiDict
 from concurrent.futures import ThreadPoolExecutor
 from quart import send_file
 #class ThreeZeroProvider(OpenAPIProvider):
@@ -67,36 +86,98 @@ async def startup():
     es_cfg = config["elastic_source"]
 
     db_conn = DBConnection(db_cfg["type"], db_cfg["host"], db_cfg["user"], db_cfg["pass"], db_cfg["name"])
+    db_conn.configure_pool(db_cfg)
     db_conn.connect()
 
     es_conn = ESConnection(es_cfg)
     es_conn.connect()
+    reference_cache.configure(config.get("reference_cache"))
+    brand_terms.configure(config.get("brand_filters"))
+    lang_fallback.configure(config.get("lang_fallback"))
+    element_previews.configure(config.get("element_previews"))
+    memo_totals.configure(config.get("request_memo"))
+    entity_flight.configure(config.get("single_flight"))
+    entity_responses.configure(config.get("response_cache"))
+    http_caching.configure(config.get("http_cache"))
+    export_settings.configure(config.get("export"))
+    cursor_paging.configure(config.get("pagination"))
+    delta_settings.configure(config.get("delta_feed"))
+    tracing.configure(config.get("tracing"))
+    metrics.configure(config.get("metrics"))
+    loop_watchdog.configure(config.get("loop_watchdog"))
+    uom_cache.configure(config.get("uom_cache"))
+    await uom_cache.preload(db_conn, get_market_divisions())
+    uom_cache.start_refresh(db_conn)
+    price_snapshot.configure(config.get("price_cache"))
+    await price_snapshot.start(db_conn)
+    statistics_materializer.configure(config.get("statistics"))
+    statistics_materializer.start(es_conn)
     app.db = db_conn
     app.es = es_conn
+    metrics.start(db_conn)
+    loop_watchdog.start()
     await register_error_handlers(app)
 
 @app.after_serving
 async def shutdown():
     global db_conn, es_conn
+    await uom_cache.stop()
+    await price_snapshot.stop()
+    await statistics_materializer.stop()
+    await metrics.stop()
+    await loop_watchdog.stop()
     if db_conn:
         db_conn.disconnect()
-    if es_conn and es_conn.get_client():
-        await es_conn.get_client().close()
+    if es_conn:
+        await es_conn.aclose()
 
 
 @app.before_request
 async def start_timer():
     request.start_time = time.perf_counter()
+    debug = "_trace" in request.args
+    if debug:
+        # not a query parameter of the routes (several reject unknown ones)
+        request.args = ImmutableMultiDict([(k, v) for k, v in request.args.items(multi=True) if k != "_trace"])
+    tracing.start(detailed=debug and tracing.debug)
+    g.trace_debug = debug and tracing.debug
 
 @app.after_request
 async def log_request(response):
     duration = time.perf_counter() - request.start_time
     user = getattr(g, "auth_user", "anonymous")
-    if duration > 0.5:
-        app.logger.warning(f"SLOW {request.method} {request.path} by {user} took {duration:.2f}s")
+    rule = request.url_rule
+    metrics.observe_request(request.method, rule.rule if rule else None, (request.view_args or {}).get("brand"),
+                            response.status_code, duration)
+    trace = current_trace()
+    if trace is not None:
+        response.headers["Server-Timing"] = trace.server_timing(duration)
+        if getattr(g, "trace_debug", False):
+            await append_trace(response, trace)
+    if duration > (tracing.slow_threshold if trace is not None else 0.5):
+        details = f"; {tracing.slow_summary(trace)}" if trace is not None else ""
+        app.logger.warning(f"SLOW {request.method} {request.path} by {user} took {duration:.2f}s{details}")
     return response
 
 
+async def append_trace(response, trace):
+    """`?_trace=1`: the request's ES/DB ledger under "_trace" of a JSON object response."""
+    if (response.mimetype != "application/json" or response.status_code == 304
+            or "Content-Encoding" in response.headers
+            or not isinstance(response.response, response.data_body_class)):
+        return
+    try:
+        body = orjson.loads(await response.get_data())
+    except orjson.JSONDecodeError:
+        return
+    if not isinstance(body, dict):
+        return
+    body["_trace"] = trace.report()
+    response.set_data(orjson.dumps(body))
+    response.headers["Cache-Control"] = "no-store"
+    response.headers.pop("ETag", None)
+
+
 
 
 
@@ -287,11 +368,93 @@ async def health():
     except Exception as e:
         return {"status": "fail", "error": str(e)}, 500
 
+
+@app.route("/health/caches")
+async def cache_stats():
+    """
+    Cache statistics
+
+    Size and hit/miss counters of the process-wide caches (per worker process).
+
+    ---
+    tags:
+      - System
+    responses:
+      200:
+        description: Counters per cache
+    """
+    return {"reference": reference_cache.stats(), "uom": uom_cache.stats(), "prices": price_snapshot.stats(),
+            "brand_terms": brand_terms.stats(), "lang_fallback": lang_fallback.stats(),
+            "statistics": statistics_materializer.stats(), "element_previews": element_previews.stats(),
+            "request_memo": memo_totals.stats(), "single_flight": entity_flight.stats(),
+            "responses": entity_responses.stats(), "http": http_caching.stats(),
+            "export": export_settings.stats(), "pagination": cursor_paging.stats(),
+            "delta_feed": delta_settings.stats(), "tracing": tracing.stats()}
+
+
+@app.route("/health/loop")
+async def loop_stats():
+    """
+    Event loop blocking
+
+    Blocking episodes seen by the loop watchdog (per worker process) and the callsites they were spent
+    in, most blocking first. Empty unless `[loop_watchdog] enabled`.
+
+    ---
+    tags:
+      - System
+    responses:
+      200:
+        description: Episodes and blocking time per callsite
+    """
+    return loop_watchdog.stats()
+
+
+@app.route("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus metrics
+
+    Request latency per route and brand, ES latency and searches per index family, DB query latency and
+    executor queue, cache hits/lookups, in-flight builds and event loop lag. Summed over all worker
+    processes when PROMETHEUS_MULTIPROC_DIR is set.
+
+    ---
+    tags:
+      - System
+    responses:
+      200:
+        description: Prometheus text exposition format
+    """
+    if not metrics.enabled:
+        return {"error": "Metrics are disabled"}, 404
+    body, content_type = await asyncio.to_thread(metrics.exposition)
+    return Response(body, content_type=content_type)
+
+
+@app.route("/health/db-pool")
+async def db_pool_stats():
+    """
+    DB pool saturation
+
+    Busy and queued DB workers (now and peak), queue timeouts, average queue wait and
+    the SQLAlchemy pool status of this worker process.
+
+    ---
+    tags:
+      - System
+    responses:
+      200:
+        description: Pool counters
+    """
+    return db_conn.pool_stats() if db_conn else {"pooled": False}
+
 app.register_blueprint(product_bp)
 app.register_blueprint(sku_bp)
 app.register_blueprint(operating_mode_bp)
 app.register_blueprint(category_bp)
 app.register_blueprint(assignments_bp)
+app.register_blueprint(export_bp)
 
 
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
@@ -318,7 +481,8 @@ async def get_brand_shops(brand: str):
     data, error = await load_static_json(filename)
     if error:
         return jsonify({"error": error}), 500
-    return jsonify(data)
+    modified = datetime.fromtimestamp(os.path.getmtime(os.path.join(STATIC_DIR, filename)), tz=timezone.utc)
+    return http_caching.response(orjson.dumps(data, option=orjson.OPT_SORT_KEYS), last_modified=modified)
 
 #@app.route("/rest/<brand>/statistics")
 async def get_brand_statistics(brand: str):
@@ -330,108 +494,29 @@ async def get_brand_statistics(brand: str):
 
 @app.route("/rest/<brand>/statistics")
 async def get_brand_statistics_dynamic(brand: str):
+    """
+    Brand statistics
 
-    # --- FAST: no script; use case-insensitive wildcard (works on ES 7.10+) ---
-    # If you have a lowercased keyword subfield, prefer `prefix` on that field.
-    brand_lower = brand.lower()
-    proQuery = {
-        "query": {
-            "bool": {
-                "filter": [
-                    {
-                        "nested": {
-                            "path": "hierarchies",
-                            "query": {
-                                "script": {
-                                    "script": {
-                                        "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand.lower()}')",
-                                        "lang": "painless"
-                                    }
-                                }
-                            }
-                        }
-                    }
-                ]
-            }
-        },
-        "_source": [
-            "epimId",
-            "referenceId"
-        ]
-    }
-
-    pro_index = f"systemair_ds_products_eng_glo"
-    pro_response = list(app.es.getScrollObject(pro_index, proQuery, 10000, "1m"))
-
-    products = []
-    for hit in pro_response:
-        src = hit.get("_source", {})
-        reference_id = src.get("referenceId")
-        if reference_id:
-            products.append(reference_id)
-
-    # --- Attributes query (same filters), but run chunks concurrently ---
-    att_index = f"systemair_ds_attributes_eng_glo"
-    CHUNK = 10000
-    chunks = [products[i:i + CHUNK] for i in range(0, len(products), CHUNK)]
-
-    async def fetch_attr_chunk(chunk):
-        q = {
-            "query": {
-                "bool": {
-                    "filter": [
-                        {
-                            "terms": {
-                                "parentId": chunk
-                            }
-                        },
-                        {
-                            "nested": {
-                                "path": "collections",
-                                "query": {
-                                    "term": {
-                                        "collections.collection": f"market-{brand}-COL"
-                                    }
-                                }
-                            }
-                        }
-                    ]
-                }
-            },"_source":["parentId","name","values"]
-        }
-        # getScrollObject is likely sync; run in a worker thread
-        return await asyncio.to_thread(
-            lambda: list(app.es.getScrollObject(att_index, q, 10000, "1m"))
-        )
-
-    # Limit parallelism to avoid hammering ES (tune 4–8 based on cluster)
-    SEMAPHORE = asyncio.Semaphore(10)
-    async def guarded_fetch(chunk):
-        async with SEMAPHORE:
-            return await fetch_attr_chunk(chunk)
-
-    # Run all chunks concurrently
-    att_parts = await asyncio.gather(*(guarded_fetch(c) for c in chunks))
-    att_response = [h for part in att_parts for h in part]
-
-    shops = shop_statistics(att_response)
-
-    langs = []
-    for shop in shops:
-        langsMarket = get_epimLang_by_market(shop)
-        for lang in langsMarket:
-            lang_mapped = unmap_locale(lang)
-            if lang_mapped and lang_mapped not in langs:
-                langs.append(lang_mapped)
-
-    now = datetime.now(ZoneInfo("Europe/Berlin"))
-    result = {
-        "locales": langs,
-        "markets": shops,
-        "published": int(now.timestamp()),
-        "version": now.strftime("%Y.%m.%d")
-    }
-    return result
+    Locales and markets the brand is published in, precomputed by the statistics materializer
+    and served with an ETag and Last-Modified (If-None-Match -> 304).
+
+    ---
+    tags:
+      - System
+    responses:
+      200:
+        description: Locales and markets of the brand
+      304:
+        description: Unchanged since the ETag sent in If-None-Match
+      400:
+        description: Invalid brand
+    """
+    try:
+        map_brand(brand)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    entry = await statistics_materializer.get(app.es, brand)
+    return http_caching.response(entry.payload, entry.etag, entry.last_modified)
 
 if __name__ == "__main__":
     import uvicorn
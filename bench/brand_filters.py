@@ -0,0 +1,79 @@
+"""
+Brand filter: painless prefix script vs. resolved hierarchy `terms` filter.
+
+For every brand and index, checks that both filters select the same documents (total hit
+count plus the sorted epimIds) and compares the query cost reported by ES (`took`, median
+and p95 over --repeat runs), against the cluster configured in config/datastore.ini.
+
+    python -m bench.brand_filters --brands systemair,frico --langs deu_deu,eng_glo --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+
+from core.environment import env
+from queries.hierarchy_queries import brand_filter
+from services.brand_filters import brand_terms
+from services.elasticsearch_service import ESConnection
+
+
+def body(filter_: dict, size: int) -> dict:
+    return {
+        "size": size,
+        "track_total_hits": True,
+        "query": {"bool": {"filter": [filter_]}},
+        "_source": ["epimId"],
+        "sort": [{"epimId": "asc"}],
+    }
+
+
+async def compare(es: ESConnection, index: str, brand: str, args) -> dict:
+    terms = await brand_terms.resolve(es, index, brand)
+    if terms is None:
+        return {"index": index, "brand": brand, "resolved": False}
+    variants = {"script": brand_filter(brand), "terms": brand_filter(brand, terms)}
+
+    results = {}
+    for name, filter_ in variants.items():
+        response = await es.asearch(index, body(filter_, args.sample))
+        ids = [hit["_source"].get("epimId") for hit in response["hits"]["hits"]]
+        took = []
+        for _ in range(args.repeat):
+            # size > 0 keeps the shard request cache out of the timings
+            took.append((await es.asearch(index, body(filter_, 10)))["took"])
+        took.sort()
+        results[name] = {
+            "total": response["hits"]["total"]["value"],
+            "ids": ids,
+            "took_p50_ms": statistics.median(took),
+            "took_p95_ms": took[int(len(took) * 0.95) - 1],
+        }
+
+    return {
+        "index": index,
+        "brand": brand,
+        "resolved": True,
+        "hierarchy_terms": len(terms),
+        "equivalent": results["script"]["total"] == results["terms"]["total"]
+                      and results["script"]["ids"] == results["terms"]["ids"],
+        **{name: {k: v for k, v in r.items() if k != "ids"} for name, r in results.items()},
+    }
+
+
+async def main(args) -> None:
+    es = ESConnection(env.getConfig()["elastic_source"])
+    es.connect()
+    indices = [f"systemair_ds_{kind}_{lang}" for lang in args.langs.split(",") for kind in ("products", "hierarchies")]
+    results = [await compare(es, index, brand, args) for index in indices for brand in args.brands.split(",")]
+    await es.aclose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--brands", default="systemair")
+    parser.add_argument("--langs", default="deu_deu")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--sample", type=int, default=1000, help="sorted epimIds compared per variant")
+    asyncio.run(main(parser.parse_args()))
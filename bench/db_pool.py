@@ -0,0 +1,149 @@
+"""
+Price-heavy SKU pages against DBConnection at several pool sizes.
+
+Every simulated page reads `--page-size` SKUs from the products index of the fake cluster
+(bench.fake_es, a synthetic catalogue of `--products` SKUs) and resolves their prices through
+SkuBuilder.parse_price_async (DB path, no price snapshot), with `--concurrency` pages in flight.
+Runs once per pool size (0 = the single shared connection) and reports page throughput, latency
+and pool saturation.
+
+The database is the offline stand-in of bench.standin (CannedDB: a price row per SKU after
+`--db-latency` ms per query, on the worker threads of the pool size). With --live-db the prices
+come from the database configured in config/datastore.ini instead, for its first `--products`
+product numbers.
+
+    python -m bench.db_pool --pool-sizes 0,1,2,5,10 --pages 500 --concurrency 32 --db-latency 5
+    python -m bench.db_pool --pool-sizes 0,5,10 --pages 500 --live-db
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from bench.fake_es import FakeClient, FakeCluster
+from bench.standin import CannedDB, Latency, _db_key
+from core.environment import env
+from queries.sku_queries import query_price
+from services.database_service import DBConnection
+from services.elasticsearch_service import ESConnection
+from services.sku_builder import SkuBuilder
+
+INDEX = "systemair_ds_products_deu_deu"
+
+
+def catalogue(product_nrs: list) -> dict:
+    """Fake cluster snapshot: one SKU per product number."""
+    return {"indices": {INDEX: [{"_id": str(epim_id), "_source": {"epimId": epim_id, "productNr": nr}}
+                                for epim_id, nr in enumerate(product_nrs, start=1)]}}
+
+
+def price_recording(product_nrs: list, market: str) -> dict:
+    """CannedDB recording: the latest price row of every product number (a few on demand)."""
+    prefix = market.replace("-", "_")
+    rows = {}
+    for row_id, nr in enumerate(product_nrs, start=1):
+        price = None if row_id % 10 == 0 else round(50 + row_id * 0.37, 2)
+        rows[_db_key(query_price(), {"productnr": nr})] = [
+            {"id": row_id, "PRODUCT_NUMBER": nr, f"{prefix}_PRICE": price, f"{prefix}_CURRENCY": "EUR"}]
+    return {"db": rows}
+
+
+def open_db(args, pool_size: int, recording: dict) -> DBConnection:
+    pool = {"pool_size": pool_size, "max_overflow": 0}
+    if not args.live_db:
+        return CannedDB(recording, Latency(args.db_latency, args.db_jitter), pool)
+    db_cfg = env.getConfig()["epim_db"]
+    db = DBConnection(db_cfg["type"], db_cfg["host"], db_cfg["user"], db_cfg["pass"], db_cfg["name"])
+    db.configure_pool({**db_cfg, **pool})
+    db.connect()
+    return db
+
+
+def live_product_nrs(count: int) -> list:
+    db_cfg = env.getConfig()["epim_db"]
+    probe = DBConnection(db_cfg["type"], db_cfg["host"], db_cfg["user"], db_cfg["pass"], db_cfg["name"])
+    probe.configure_pool({"pool_size": 0})
+    probe.connect()
+    rows = probe.execute_query(f"SELECT DISTINCT TOP {int(count)} PRODUCT_NUMBER FROM vmps_ERP_prices")
+    probe.disconnect()
+    return [row["PRODUCT_NUMBER"] for row in rows]
+
+
+async def run_pool(es: ESConnection, db: DBConnection, pool_size: int, products: int, args) -> dict:
+    builder = SkuBuilder(es, db)
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def page(n: int):
+        nonlocal errors
+        offset = (n * args.page_size) % max(products - args.page_size + 1, 1)
+        query = {"query": {"match_all": {}}, "from": offset, "size": args.page_size, "sort": [{"epimId": "asc"}],
+                 "_source": ["productNr"]}
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await es.asearch(INDEX, query)
+                skus = [hit["_source"] for hit in response["hits"]["hits"]]
+                await asyncio.gather(*(builder.parse_price_async(sku, None, args.market) for sku in skus))
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    # warm up pooled connections before measuring
+    await asyncio.gather(*(page(n) for n in range(min(args.concurrency, args.pages))))
+    latencies.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(page(n) for n in range(args.pages)))
+    elapsed = time.perf_counter() - started
+    pool = db.pool_stats()
+    db.disconnect()
+
+    latencies.sort()
+    return {
+        "pool_size": pool_size,
+        "pages": args.pages,
+        "errors": errors,
+        "db_misses": getattr(db, "misses", None),
+        "elapsed_s": round(elapsed, 3),
+        "pages_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2) if latencies else None,
+        "peak_in_use": pool["peak_in_use"],
+        "peak_waiting": pool["peak_waiting"],
+        "avg_queue_wait_ms": pool["avg_queue_wait_ms"],
+        "queue_timeouts": pool["queue_timeouts"],
+    }
+
+
+async def main(args) -> None:
+    if args.live_db:
+        product_nrs = live_product_nrs(args.products)
+    else:
+        product_nrs = [f"{100000 + i}" for i in range(args.products)]
+    cluster = FakeCluster(catalogue(product_nrs))
+    recording = price_recording(product_nrs, args.market)
+
+    results = []
+    for pool_size in (int(size) for size in args.pool_sizes.split(",")):
+        es = ESConnection({})
+        es.aes = FakeClient(cluster, Latency(args.es_latency))
+        results.append(await run_pool(es, open_db(args, pool_size, recording), pool_size, len(product_nrs), args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-sizes", default="0,1,2,5,10")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--market", default="MARKET-005")
+    parser.add_argument("--es-latency", type=float, default=2.0, help="fake cluster round trip in ms")
+    parser.add_argument("--db-latency", type=float, default=5.0, help="stand-in DB query time in ms")
+    parser.add_argument("--db-jitter", type=float, default=1.0, help="+- ms on --db-latency")
+    parser.add_argument("--live-db", action="store_true", help="price from the configured database")
+    asyncio.run(main(parser.parse_args()))
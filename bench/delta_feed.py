@@ -0,0 +1,92 @@
+"""
+Shop SKU delta feed check: on a fixture catalogue served by the fake cluster (bench.fake_es), every kind
+of change must reach the shop SKUs it is shown on. Covered:
+- a changed SKU
+- an attribute change on a reference SKU, with more variants than one resolve page (RESOLVE_CHUNK)
+- a changed text of a reference SKU, reaching its variant
+- a changed image of a SKU
+Documents outside the window, other brands and SKUs outside ECOM NG must not show up.
+
+    python -m bench.delta_feed
+    python -m bench.delta_feed --variants 5000
+
+Exits non-zero when a feed run returns other SKUs than expected.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from bench.fake_es import FakeClient, FakeCluster
+from services.delta_feed import RESOLVE_CHUNK, ShopSkuDelta, delta_settings
+from services.elasticsearch_service import ESConnection
+
+LANG = "deu_che"
+OLD, NEW, SINCE = 1_000_000, 5_000_000, 4_000_000
+
+
+def product(epim_id: int, timestamp: int = OLD, reference: int = None, brand: str = "Systemair AB",
+            shop: bool = True, texts=(), images=()) -> dict:
+    hierarchies = [{"hierarchy": brand}] + ([{"hierarchy": "ECOM NG"}] if shop else [])
+    source = {"epimId": epim_id, "timestamp": timestamp, "hierarchies": hierarchies,
+              "textAssignments": [{"objects": [{"epimId": i} for i in texts]}],
+              "imageAssignments": [{"objects": [{"epimId": i} for i in images]}]}
+    if reference is not None:
+        source["referenceId"] = str(reference)
+    return {"_id": str(epim_id), "_source": source}
+
+
+def scenarios(variants: int) -> list:
+    """(name, snapshot, expected shop SKU ids): one change each, on top of a catalogue of unchanged SKUs."""
+    def catalogue(products=(), attributes=(), elements=()):
+        base = [product(100, reference=900, texts=[7100], images=[8100]), product(900, shop=False, texts=[7900]),
+                product(101, brand="Frico AB", texts=[7101]), product(102, shop=False, images=[8102])]
+        return {"indices": {
+            f"systemair_ds_products_{LANG}": base + list(products),
+            f"systemair_ds_attributes_{LANG}": [{"_id": "a-old", "_source": {"parentId": 100, "timestamp": OLD}}]
+            + list(attributes),
+            f"systemair_ds_elements_{LANG}": [{"_id": "e-old", "_source": {"parentElement": 7100, "timestamp": OLD}}]
+            + list(elements),
+        }}
+
+    many = [product(10_000 + i, reference=901) for i in range(variants)]
+    return [
+        ("sku", catalogue(products=[product(103, timestamp=NEW)]), {"103"}),
+        ("reference attribute", catalogue(products=[product(901, shop=False)] + many,
+                                          attributes=[{"_id": "a", "_source": {"parentId": 901, "timestamp": NEW}}]),
+         {str(10_000 + i) for i in range(variants)}),
+        ("reference text", catalogue(elements=[{"_id": "t", "_source": {"parentElement": 7900, "timestamp": NEW}}]),
+         {"100"}),
+        ("image", catalogue(elements=[{"_id": "i", "_source": {"parentElement": 8100, "timestamp": NEW}}]), {"100"}),
+        ("other brand text", catalogue(elements=[{"_id": "t", "_source": {"parentElement": 7101, "timestamp": NEW}}]),
+         set()),
+        ("not a shop SKU", catalogue(elements=[{"_id": "i", "_source": {"parentElement": 8102, "timestamp": NEW}}]),
+         set()),
+    ]
+
+
+async def run(snapshot: dict) -> list:
+    es = ESConnection({})
+    es.aes = FakeClient(FakeCluster(snapshot))
+    delta = ShopSkuDelta(es, None, LANG, "systemair", None, since=SINCE)
+    return [sku_id async for batch in delta.affected(await delta.high_water()) for sku_id in batch]
+
+
+async def main(args) -> None:
+    delta_settings.overlap = 0
+    results, failed = [], False
+    for name, snapshot, expected in scenarios(args.variants):
+        found = await run(snapshot)
+        ok = set(found) == expected and len(found) == len(set(found))
+        failed |= not ok
+        results.append({"change": name, "expected": len(expected), "found": len(found), "ok": ok})
+    print(json.dumps({"resolve_chunk": RESOLVE_CHUNK, "results": results}, indent=2))
+    if failed:
+        sys.exit("the delta feed missed or added shop SKUs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", type=int, default=2 * RESOLVE_CHUNK + 500,
+                        help="variants of the changed reference SKU")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""
+Throughput benchmark: native async ES transport vs. the thread-offload path.
+
+Runs the same search through ESConnection.asearch with async_transport on and off,
+at a fixed concurrency, against the cluster configured in config/datastore.ini.
+
+    python -m bench.es_transport --index systemair_ds_products_eng_glo --requests 2000 --concurrency 256
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from core.environment import env
+from services.elasticsearch_service import ESConnection
+
+
+async def run_mode(es_cfg: dict, async_transport: bool, index: str, query: dict, requests: int, concurrency: int) -> dict:
+    conn = ESConnection({**es_cfg, "async_transport": str(async_transport).lower()})
+    conn.connect()
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await conn.asearch(index, query)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    # warm up connections before measuring
+    await asyncio.gather(*(one() for _ in range(min(concurrency, requests))))
+    latencies.clear()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    await conn.aclose()
+
+    latencies.sort()
+    return {
+        "mode": "async" if async_transport else "thread-offload",
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2) if latencies else None,
+    }
+
+
+async def main(args) -> None:
+    es_cfg = env.getConfig()["elastic_source"]
+    query = {"size": args.size, "query": {"match_all": {}}}
+    results = []
+    for async_transport in (False, True):
+        results.append(await run_mode(es_cfg, async_transport, args.index, query, args.requests, args.concurrency))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default="systemair_ds_products_eng_glo")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--size", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
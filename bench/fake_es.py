@@ -0,0 +1,893 @@
+"""
+Deterministic Elasticsearch stand-in: a snapshot of documents served through the subset of the API this
+app uses, in-process (FakeClient, in place of ESConnection.aes) or as a local HTTP server.
+
+Supported: _search with bool / term / terms / ids / exists / range / wildcard / prefix / regexp / match_all /
+constant_score / nested queries and the brand prefix script of queries.hierarchy_queries, sort on fields,
+_doc and the langIso fallback script of utils.utilities, collapse, from/size, search_after, _source
+filtering and docvalue_fields; max / min / cardinality / value_count / terms / composite / nested / filter
+aggregations; _msearch, _count, scroll, point in time and _alias. Anything else is answered with a 400, so results
+are never silently wrong. Every round trip waits a configurable latency. Hits keep the snapshot order
+(constant scores), so the same snapshot always gives the same responses.
+
+A snapshot holds the documents the hits of a bench.replay recording point to, fetched in full from the
+cluster of config/datastore.ini, and the names and aliases of the cluster's indices:
+
+    python -m bench.fake_es snapshot --recording recordings/catalogue.json.gz --out recordings/catalogue.snapshot.json.gz
+    python -m bench.fake_es serve --snapshot recordings/catalogue.snapshot.json.gz --port 9200 --latency 3
+"""
+import argparse
+import fnmatch
+import functools
+import itertools
+import re
+from collections import Counter
+from typing import Optional
+
+import orjson
+from elasticsearch.exceptions import HTTP_EXCEPTIONS, TransportError
+
+from bench.standin import Latency, load_recording, save_recording
+
+SHARDS = {"total": 1, "successful": 1, "skipped": 0, "failed": 0}
+
+_BRAND_SCRIPT = re.compile(r"doc\['([\w.]+)'\]\.value\.toLowerCase\(\)\.startsWith\('(.*)'\)$")
+_LANG_SCRIPT = re.compile(r"== '(\w+)'\) return (\d+)")
+_LANG_SCRIPT_OTHER = re.compile(r"else return (\d+);?\s*$")
+
+
+class FakeError(Exception):
+    """An error response: HTTP status, ES error type and reason."""
+
+    def __init__(self, status: int, error_type: str, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.error_type = error_type
+        self.reason = reason
+
+    def body(self) -> dict:
+        return {"error": {"root_cause": [{"type": self.error_type, "reason": self.reason}], "type": self.error_type,
+                          "reason": self.reason}, "status": self.status}
+
+
+def unsupported(what: str) -> FakeError:
+    return FakeError(400, "parsing_exception", f"not supported by the fake cluster: {what}")
+
+
+def _values(source, path: str) -> list:
+    """Leaf values at a dotted path, through lists of objects (as ES flattens them)."""
+    current = [source]
+    for part in path.split("."):
+        found = []
+        for value in current:
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+                if isinstance(value, list):
+                    found.extend(value)
+                else:
+                    found.append(value)
+        current = found
+    return [value for value in current if value is not None]
+
+
+def _norm(value) -> str:
+    """Term comparison key: 12, 12.0 and "12" match, as they do against a keyword or numeric field."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _order_key(value):
+    """Sort key over mixed values: numbers before strings."""
+    number = _number(value)
+    return (0, number, "") if number is not None else (1, 0, str(value))
+
+
+def _wrap(path: str, value) -> dict:
+    for part in reversed(path.split(".")):
+        value = {part: value}
+    return value
+
+
+def _single(spec: dict, what: str):
+    items = [(key, value) for key, value in spec.items() if key not in ("boost", "_name", "case_insensitive")]
+    if len(items) != 1:
+        raise unsupported(f"{what} on {len(items)} fields")
+    return items[0]
+
+
+# ---- queries --------------------------------------------------------------------------------------------
+
+def matches(source: dict, query: Optional[dict], doc_id: Optional[str] = None) -> bool:
+    if not query:
+        return True
+    if len(query) != 1:
+        raise unsupported(f"query with keys {sorted(query)}")
+    kind, spec = next(iter(query.items()))
+    handler = _QUERIES.get(kind)
+    if handler is None:
+        raise unsupported(f"{kind} query")
+    return handler(source, spec, doc_id)
+
+
+def _clauses(spec, key) -> list:
+    value = spec.get(key) or []
+    return value if isinstance(value, list) else [value]
+
+
+def _bool(source, spec, doc_id):
+    required = _clauses(spec, "must") + _clauses(spec, "filter")
+    if not all(matches(source, clause, doc_id) for clause in required):
+        return False
+    if any(matches(source, clause, doc_id) for clause in _clauses(spec, "must_not")):
+        return False
+    should = _clauses(spec, "should")
+    if not should:
+        return True
+    minimum = spec.get("minimum_should_match", 0 if required else 1)
+    if isinstance(minimum, str) and not minimum.lstrip("-").isdigit():
+        raise unsupported(f"minimum_should_match {minimum}")
+    return sum(1 for clause in should if matches(source, clause, doc_id)) >= int(minimum)
+
+
+def _term(source, spec, doc_id):
+    field, value = _single(spec, "term")
+    if isinstance(value, dict):
+        value = value["value"]
+    wanted = _norm(value)
+    return any(_norm(v) == wanted for v in _values(source, field))
+
+
+def _terms(source, spec, doc_id):
+    field, values = _single(spec, "terms")
+    if isinstance(values, dict):
+        raise unsupported("terms lookup")
+    wanted = {_norm(v) for v in values}
+    return any(_norm(v) in wanted for v in _values(source, field))
+
+
+def _ids(source, spec, doc_id):
+    return doc_id is not None and doc_id in {str(v) for v in spec.get("values", [])}
+
+
+def _exists(source, spec, doc_id):
+    return bool(_values(source, spec["field"]))
+
+
+def _range(source, spec, doc_id):
+    field, bounds = _single(spec, "range")
+    checks = {"gt": lambda a, b: a > b, "gte": lambda a, b: a >= b,
+              "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b}
+    unknown = set(bounds) - set(checks) - {"format", "time_zone", "boost"}
+    if unknown:
+        raise unsupported(f"range {sorted(unknown)}")
+
+    def within(value):
+        for op, bound in bounds.items():
+            if op not in checks:
+                continue
+            a, b = _number(value), _number(bound)
+            if a is None or b is None:
+                a, b = str(value), str(bound)
+            if not checks[op](a, b):
+                return False
+        return True
+
+    return any(within(v) for v in _values(source, field))
+
+
+def _pattern_query(kind):
+    def handler(source, spec, doc_id):
+        field, pattern = _single(spec, kind)
+        insensitive = spec.get("case_insensitive", False)
+        if isinstance(pattern, dict):
+            insensitive = pattern.get("case_insensitive", insensitive)
+            pattern = pattern.get("value", pattern.get("wildcard"))
+        if kind == "prefix":
+            pattern = pattern.replace("[", "[[]").replace("*", "[*]").replace("?", "[?]") + "*"
+        if insensitive:
+            return any(fnmatch.fnmatchcase(str(v).lower(), pattern.lower()) for v in _values(source, field))
+        return any(fnmatch.fnmatchcase(str(v), pattern) for v in _values(source, field))
+    return handler
+
+
+def _regexp(source, spec, doc_id):
+    field, pattern = _single(spec, "regexp")
+    flags = 0
+    if isinstance(pattern, dict):
+        flags = re.IGNORECASE if pattern.get("case_insensitive") else 0
+        pattern = pattern["value"]
+    # Lucene regular expressions are anchored at both ends
+    compiled = re.compile(pattern, flags)
+    return any(compiled.fullmatch(str(v)) for v in _values(source, field))
+
+
+def _nested(source, spec, doc_id):
+    path = spec["path"]
+    return any(matches(_wrap(path, item), spec.get("query")) for item in _values(source, path)
+               if isinstance(item, dict))
+
+
+def _script(source, spec, doc_id):
+    script = spec.get("script", {})
+    match = _BRAND_SCRIPT.match(str(script.get("source", "")).strip())
+    if match is None:
+        raise unsupported("script query other than the brand prefix filter")
+    values = _values(source, match.group(1))
+    return bool(values) and str(values[0]).lower().startswith(match.group(2))
+
+
+_QUERIES = {
+    "bool": _bool,
+    "term": _term,
+    "terms": _terms,
+    "ids": _ids,
+    "exists": _exists,
+    "range": _range,
+    "wildcard": _pattern_query("wildcard"),
+    "prefix": _pattern_query("prefix"),
+    "regexp": _regexp,
+    "match_all": lambda source, spec, doc_id: True,
+    "constant_score": lambda source, spec, doc_id: matches(source, spec.get("filter"), doc_id),
+    "nested": _nested,
+    "script": _script,
+}
+
+
+# ---- sorting --------------------------------------------------------------------------------------------
+
+def _lang_ranks(source: str):
+    ranks = {}
+    for lang, rank in _LANG_SCRIPT.findall(source):
+        ranks.setdefault(lang, int(rank))
+    other = _LANG_SCRIPT_OTHER.search(source)
+    if not ranks or other is None:
+        raise unsupported("sort script other than the langIso fallback")
+    return ranks, int(other.group(1))
+
+
+def _sort_specs(sort) -> list:
+    """[(kind, field or ranks, descending)] of a sort clause."""
+    specs = []
+    for item in sort if isinstance(sort, list) else [sort]:
+        if isinstance(item, str):
+            field, order = item, ("desc" if item == "_score" else "asc")
+        else:
+            field, order = _single(item, "sort")
+        if field == "_script":
+            if order.get("type", "number") != "number":
+                raise unsupported("string script sort")
+            specs.append(("script", _lang_ranks(order["script"]["source"]), order.get("order", "asc") == "desc"))
+            continue
+        if isinstance(order, dict):
+            if order.get("missing") not in (None, "_last"):
+                raise unsupported(f"sort missing {order['missing']}")
+            order = order.get("order", "desc" if field == "_score" else "asc")
+        kind = field if field in ("_doc", "_score", "_shard_doc") else "field"
+        specs.append((kind, field, order == "desc"))
+    return specs
+
+
+def _sort_values(doc, specs) -> list:
+    values = []
+    for kind, field, descending in specs:
+        if kind in ("_doc", "_shard_doc"):
+            values.append(doc.position)
+        elif kind == "_score":
+            values.append(1.0)
+        elif kind == "script":
+            ranks, other = field
+            langs = _values(doc.source, "langIso")
+            values.append(float(ranks.get(str(langs[0]).lower(), other) if langs else other))
+        else:
+            found = _values(doc.source, field)
+            # multi-valued fields sort on their min (asc) or max (desc)
+            values.append((max if descending else min)(found, key=_order_key) if found else None)
+    return values
+
+
+def _compare(a: list, b: list, specs) -> int:
+    for x, y, (_, _, descending) in zip(a, b, specs):
+        if x == y:
+            continue
+        # missing values last in either direction
+        if x is None:
+            return 1
+        if y is None:
+            return -1
+        kx, ky = _order_key(x), _order_key(y)
+        if kx == ky:
+            continue
+        result = -1 if kx < ky else 1
+        return -result if descending else result
+    return 0
+
+
+# ---- _source and fields ---------------------------------------------------------------------------------
+
+def _patterns(value) -> list:
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _may_contain(pattern: str, path: str) -> bool:
+    """Whether pattern can match a field below path."""
+    parts, pattern_parts = path.split("."), pattern.split(".")
+    if "*" in pattern_parts[0] and pattern_parts[0].endswith("*"):
+        return True
+    return len(pattern_parts) > len(parts) and all(
+        fnmatch.fnmatchcase(part, pat) for part, pat in zip(parts, pattern_parts))
+
+
+def _filter_source(value, includes: list, excludes: list, prefix: str = ""):
+    if isinstance(value, list):
+        return [_filter_source(item, includes, excludes, prefix) for item in value]
+    if not isinstance(value, dict):
+        return value
+    result = {}
+    for key, item in value.items():
+        path = f"{prefix}{key}"
+        if any(fnmatch.fnmatchcase(path, pattern) for pattern in excludes):
+            continue
+        if not includes or any(fnmatch.fnmatchcase(path, pattern) for pattern in includes):
+            result[key] = _filter_source(item, [], excludes, path + ".") if excludes else item
+        elif any(_may_contain(pattern, path) for pattern in includes) and isinstance(item, (dict, list)):
+            filtered = _filter_source(item, includes, excludes, path + ".")
+            if filtered not in ({}, []):
+                result[key] = filtered
+    return result
+
+
+def _source(source: dict, spec):
+    if spec is None or spec is True:
+        return orjson.loads(orjson.dumps(source))
+    if spec is False:
+        return None
+    if isinstance(spec, dict):
+        includes = _patterns(spec.get("includes", spec.get("include")))
+        excludes = _patterns(spec.get("excludes", spec.get("exclude")))
+    else:
+        includes, excludes = _patterns(spec), []
+    return orjson.loads(orjson.dumps(_filter_source(source, includes, excludes)))
+
+
+# ---- aggregations ---------------------------------------------------------------------------------------
+
+def aggregate(aggs: dict, docs: list) -> dict:
+    """aggs over docs (source dicts; nested objects wrapped in their path)."""
+    return {name: _aggregation(spec, docs) for name, spec in aggs.items()}
+
+
+def _sub_aggs(spec: dict) -> dict:
+    return spec.get("aggs", spec.get("aggregations", {}))
+
+
+def _aggregation(spec: dict, docs: list) -> dict:
+    kinds = [key for key in spec if key not in ("aggs", "aggregations", "meta")]
+    if len(kinds) != 1:
+        raise unsupported(f"aggregation with {kinds}")
+    kind, body = kinds[0], spec[kinds[0]]
+    sub = _sub_aggs(spec)
+
+    if kind in ("max", "min"):
+        numbers = [n for doc in docs for n in map(_number, _values(doc, body["field"])) if n is not None]
+        return {"value": float((max if kind == "max" else min)(numbers)) if numbers else None}
+    if kind == "cardinality":
+        return {"value": len({_norm(v) for doc in docs for v in _values(doc, body["field"])})}
+    if kind == "value_count":
+        return {"value": sum(len(_values(doc, body["field"])) for doc in docs)}
+    if kind == "nested":
+        items = [_wrap(body["path"], item) for doc in docs for item in _values(doc, body["path"])
+                 if isinstance(item, dict)]
+        return {"doc_count": len(items), **aggregate(sub, items)}
+    if kind == "filter":
+        selected = [doc for doc in docs if matches(doc, body)]
+        return {"doc_count": len(selected), **aggregate(sub, selected)}
+    if kind == "terms":
+        return _terms_aggregation(body, sub, docs)
+    if kind == "composite":
+        return _composite_aggregation(body, sub, docs)
+    raise unsupported(f"{kind} aggregation")
+
+
+def _terms_aggregation(body: dict, sub: dict, docs: list) -> dict:
+    groups = {}
+    for doc in docs:
+        for key in {_norm(v): v for v in _values(doc, body["field"])}.values():
+            groups.setdefault(_norm(key), (key, []))[1].append(doc)
+    order = body.get("order", {"_count": "desc"})
+    (by, direction), = (order if isinstance(order, dict) else order[0]).items()
+    if by == "_count":
+        ranked = sorted(groups.values(), key=lambda g: (-len(g[1]) if direction == "desc" else len(g[1]),
+                                                        _order_key(g[0])))
+    elif by in ("_key", "_term"):
+        ranked = sorted(groups.values(), key=lambda g: _order_key(g[0]), reverse=direction == "desc")
+    else:
+        raise unsupported(f"terms order by {by}")
+    size = int(body.get("size", 10))
+    shown = ranked[:size]
+    return {
+        "doc_count_error_upper_bound": 0,
+        "sum_other_doc_count": sum(len(g[1]) for g in ranked[size:]),
+        "buckets": [{"key": key, "doc_count": len(members), **aggregate(sub, members)} for key, members in shown],
+    }
+
+
+def _composite_aggregation(body: dict, sub: dict, docs: list) -> dict:
+    sources = []
+    for source in body["sources"]:
+        name, spec = _single(source, "composite source")
+        kind, options = _single(spec, "composite source")
+        if kind != "terms" or "script" in options:
+            raise unsupported(f"composite {kind} source")
+        sources.append((name, options["field"], options.get("order", "asc") == "desc",
+                        options.get("missing_bucket", False)))
+    groups = {}
+    for doc in docs:
+        per_source = []
+        for name, field, _, missing_bucket in sources:
+            values = list({_norm(v): v for v in _values(doc, field)}.values())
+            per_source.append(values or ([None] if missing_bucket else []))
+        for key in itertools.product(*per_source):
+            groups.setdefault(tuple(_norm(v) if v is not None else None for v in key), (key, []))[1].append(doc)
+
+    def compare(a, b):
+        for x, y, (_, _, descending, _) in zip(a[0], b[0], sources):
+            if x == y:
+                continue
+            if x is None or y is None:
+                return -1 if x is None else 1
+            kx, ky = _order_key(x), _order_key(y)
+            if kx != ky:
+                return (1 if kx > ky else -1) * (-1 if descending else 1)
+        return 0
+
+    ranked = sorted(groups.values(), key=functools.cmp_to_key(compare))
+    after = body.get("after")
+    if after:
+        after_key = tuple(after.get(name) for name, _, _, _ in sources)
+        ranked = [group for group in ranked if compare(group, (after_key, None)) > 0]
+    page = ranked[:int(body.get("size", 10))]
+    buckets = [{"key": {name: value for (name, _, _, _), value in zip(sources, key)}, "doc_count": len(members),
+                **aggregate(sub, members)} for key, members in page]
+    result = {"buckets": buckets}
+    if buckets:
+        result["after_key"] = buckets[-1]["key"]
+    return result
+
+
+# ---- the cluster ----------------------------------------------------------------------------------------
+
+class _Doc:
+    __slots__ = ("index", "id", "source", "position")
+
+    def __init__(self, index: str, doc_id: str, source: dict, position: int):
+        self.index = index
+        self.id = doc_id
+        self.source = source
+        self.position = position
+
+
+class _Index:
+    def __init__(self, name: str, docs: list, offset: int):
+        self.name = name
+        self.docs = [_Doc(name, str(doc["_id"]), doc["_source"], offset + i) for i, doc in enumerate(docs)]
+        self._postings = {}
+
+    def postings(self, field: str) -> dict:
+        """term -> positions of the documents with it (built on first use per field)."""
+        postings = self._postings.get(field)
+        if postings is None:
+            postings = {}
+            for i, doc in enumerate(self.docs):
+                for value in {_norm(v) for v in _values(doc.source, field)}:
+                    postings.setdefault(value, []).append(i)
+            self._postings[field] = postings
+        return postings
+
+    def candidates(self, query: Optional[dict]) -> list:
+        """Documents that can match query: narrowed by its top-level term / terms / ids filters."""
+        narrowed = None
+        for clause in _required_clauses(query):
+            kind, spec = next(iter(clause.items()))
+            if kind == "ids":
+                wanted = {str(v) for v in spec.get("values", [])}
+                positions = {i for i, doc in enumerate(self.docs) if doc.id in wanted}
+            elif kind in ("term", "terms"):
+                try:
+                    field, values = _single(spec, kind)
+                except FakeError:
+                    continue
+                if kind == "term":
+                    values = [values["value"] if isinstance(values, dict) else values]
+                elif isinstance(values, dict):
+                    continue
+                postings = self.postings(field)
+                positions = {i for v in values for i in postings.get(_norm(v), ())}
+            else:
+                continue
+            narrowed = positions if narrowed is None else narrowed & positions
+        if narrowed is None:
+            return self.docs
+        return [self.docs[i] for i in sorted(narrowed)]
+
+
+def _required_clauses(query: Optional[dict]) -> list:
+    if not query or len(query) != 1:
+        return []
+    kind, spec = next(iter(query.items()))
+    if kind == "constant_score":
+        return _required_clauses(spec.get("filter"))
+    if kind == "bool":
+        clauses = []
+        for clause in _clauses(spec, "must") + _clauses(spec, "filter"):
+            clauses.extend(_required_clauses(clause) if "bool" in clause or "constant_score" in clause
+                           else [clause] if len(clause) == 1 else [])
+        return clauses
+    return [query]
+
+
+class FakeCluster:
+    """The indices and aliases of a snapshot, answering the search API (responses as the 7.x REST API returns them)."""
+
+    def __init__(self, snapshot: dict):
+        self.indices = {}
+        offset = 0
+        for name, docs in snapshot.get("indices", {}).items():
+            self.indices[name] = _Index(name, docs, offset)
+            offset += len(docs)
+        self.aliases = {alias: list(targets) for alias, targets in snapshot.get("aliases", {}).items()}
+        self._pits = {}
+        self._scrolls = {}
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def load(cls, path: str) -> "FakeCluster":
+        return cls(load_recording(path))
+
+    def resolve(self, expression) -> list:
+        names = expression if isinstance(expression, (list, tuple)) else str(expression or "_all").split(",")
+        resolved = []
+        for name in (n.strip() for n in names):
+            if name in ("_all", "*"):
+                found = list(self.indices)
+            elif name in self.indices:
+                found = [name]
+            elif name in self.aliases:
+                found = self.aliases[name]
+            elif "*" in name:
+                found = [n for n in self.indices if fnmatch.fnmatchcase(n, name)]
+                found += [t for a, targets in self.aliases.items() if fnmatch.fnmatchcase(a, name) for t in targets]
+            else:
+                raise FakeError(404, "index_not_found_exception", f"no such index [{name}]")
+            resolved.extend(n for n in found if n not in resolved)
+        return resolved
+
+    def _matching(self, names: list, query: Optional[dict]) -> list:
+        return [doc for name in names for doc in self.indices[name].candidates(query)
+                if matches(doc.source, query, doc.id)]
+
+    def search(self, index=None, body: Optional[dict] = None, scroll: Optional[str] = None,
+               size: Optional[int] = None, from_: Optional[int] = None) -> dict:
+        body = dict(body or {})
+        if size is not None:
+            body["size"] = size
+        if from_ is not None:
+            body["from"] = from_
+        unknown = set(body) - {"query", "size", "from", "sort", "search_after", "collapse", "_source", "aggs",
+                               "aggregations", "pit", "track_total_hits", "docvalue_fields", "fields", "timeout"}
+        if unknown:
+            raise unsupported(f"search options {sorted(unknown)}")
+        pit = body.get("pit")
+        if pit is not None:
+            names = self._pits.get(pit.get("id"))
+            if names is None:
+                raise FakeError(404, "search_context_missing_exception", f"No search context found for id [{pit.get('id')}]")
+        else:
+            names = self.resolve(index)
+
+        docs = self._matching(names, body.get("query"))
+        total = len(docs)
+        specs = _sort_specs(body["sort"]) if body.get("sort") else None
+        if specs:
+            keyed = sorted(((_sort_values(doc, specs), doc) for doc in docs),
+                           key=functools.cmp_to_key(lambda a, b: _compare(a[0], b[0], specs)))
+        else:
+            keyed = [(None, doc) for doc in docs]
+        if body.get("search_after") is not None:
+            if not specs:
+                raise unsupported("search_after without sort")
+            after = list(body["search_after"])
+            keyed = [(values, doc) for values, doc in keyed if _compare(values, after, specs) > 0]
+        if body.get("collapse"):
+            field = body["collapse"]["field"]
+            seen, collapsed = set(), []
+            for values, doc in keyed:
+                found = _values(doc.source, field)
+                key = _norm(found[0]) if found else None
+                if key not in seen:
+                    seen.add(key)
+                    collapsed.append((values, doc))
+            keyed = collapsed
+
+        hits = [self._hit(doc, values, body) for values, doc in keyed]
+        response = {"took": 0, "timed_out": False, "_shards": dict(SHARDS),
+                    "hits": {"total": {"value": total, "relation": "eq"}, "max_score": None if specs else 1.0}}
+        aggs = body.get("aggs", body.get("aggregations"))
+        if aggs:
+            response["aggregations"] = aggregate(aggs, [doc.source for doc in docs])
+        page_size = int(body.get("size", 10))
+        if scroll is not None:
+            scroll_id = f"scroll-{next(self._ids)}"
+            self._scrolls[scroll_id] = (hits[page_size:], page_size)
+            response["_scroll_id"] = scroll_id
+            response["hits"]["hits"] = hits[:page_size]
+        else:
+            start = int(body.get("from", 0))
+            response["hits"]["hits"] = hits[start:start + page_size]
+        if pit is not None:
+            response["pit_id"] = pit["id"]
+        return response
+
+    @staticmethod
+    def _hit(doc: _Doc, sort_values, body: dict) -> dict:
+        hit = {"_index": doc.index, "_type": "_doc", "_id": doc.id, "_score": None if sort_values is not None else 1.0}
+        source = _source(doc.source, body.get("_source"))
+        if source is not None:
+            hit["_source"] = source
+        fields = {}
+        for spec in list(body.get("docvalue_fields", [])) + list(body.get("fields", [])):
+            field = spec["field"] if isinstance(spec, dict) else spec
+            values = _values(doc.source, field)
+            if values:
+                fields[field] = values
+        if fields:
+            hit["fields"] = fields
+        if sort_values is not None:
+            hit["sort"] = sort_values
+        return hit
+
+    def scroll(self, scroll_id: str) -> dict:
+        state = self._scrolls.get(scroll_id)
+        if state is None:
+            raise FakeError(404, "search_context_missing_exception", f"No search context found for id [{scroll_id}]")
+        remaining, page_size = state
+        self._scrolls[scroll_id] = (remaining[page_size:], page_size)
+        return {"_scroll_id": scroll_id, "took": 0, "timed_out": False, "_shards": dict(SHARDS),
+                "hits": {"total": {"value": len(remaining), "relation": "eq"}, "hits": remaining[:page_size]}}
+
+    def clear_scroll(self, scroll_ids) -> dict:
+        scroll_ids = [scroll_ids] if isinstance(scroll_ids, str) else list(scroll_ids or [])
+        freed = sum(1 for scroll_id in scroll_ids if self._scrolls.pop(scroll_id, None) is not None)
+        return {"succeeded": True, "num_freed": freed}
+
+    def msearch(self, searches: list, index=None) -> dict:
+        responses = []
+        for header, body in zip(searches[::2], searches[1::2]):
+            try:
+                responses.append({**self.search(header.get("index", index), body), "status": 200})
+            except FakeError as e:
+                responses.append(e.body())
+        return {"took": 0, "responses": responses}
+
+    def count(self, index=None, body: Optional[dict] = None) -> dict:
+        query = (body or {}).get("query")
+        return {"count": len(self._matching(self.resolve(index), query)), "_shards": dict(SHARDS)}
+
+    def get_alias(self, index=None) -> dict:
+        return {name: {"aliases": {alias: {} for alias, targets in self.aliases.items() if name in targets}}
+                for name in self.resolve(index)}
+
+    def open_point_in_time(self, index) -> dict:
+        pit_id = f"pit-{next(self._ids)}"
+        self._pits[pit_id] = self.resolve(index)
+        return {"id": pit_id}
+
+    def close_point_in_time(self, pit_id: str) -> dict:
+        freed = self._pits.pop(pit_id, None) is not None
+        return {"succeeded": True, "num_freed": int(freed)}
+
+
+class FakeClient:
+    """AsyncElasticsearch stand-in over a FakeCluster (assign to ESConnection.aes), with latency per round trip."""
+
+    def __init__(self, cluster: FakeCluster, latency: Optional[Latency] = None):
+        self.cluster = cluster
+        self.latency = latency or Latency()
+
+    async def _call(self, method, *args, **kwargs):
+        await self.latency.wait()
+        try:
+            return method(*args, **kwargs)
+        except FakeError as e:
+            raise HTTP_EXCEPTIONS.get(e.status, TransportError)(e.status, e.error_type, e.body())
+
+    async def search(self, index=None, body=None, scroll=None, size=None, **kwargs):
+        return await self._call(self.cluster.search, index, body, scroll=scroll, size=size)
+
+    async def scroll(self, body=None, scroll_id=None, **kwargs):
+        return await self._call(self.cluster.scroll, scroll_id or (body or {}).get("scroll_id"))
+
+    async def clear_scroll(self, body=None, scroll_id=None, **kwargs):
+        return self.cluster.clear_scroll(scroll_id or (body or {}).get("scroll_id"))
+
+    async def msearch(self, body=None, index=None, **kwargs):
+        return await self._call(self.cluster.msearch, body, index)
+
+    async def count(self, index=None, body=None, **kwargs):
+        return await self._call(self.cluster.count, index, body)
+
+    async def open_point_in_time(self, index=None, keep_alive=None, **kwargs):
+        return await self._call(self.cluster.open_point_in_time, index)
+
+    async def close_point_in_time(self, body=None, **kwargs):
+        return await self._call(self.cluster.close_point_in_time, (body or {}).get("id"))
+
+    async def close(self):
+        pass
+
+
+# ---- HTTP server ----------------------------------------------------------------------------------------
+
+def make_server(cluster: FakeCluster, latency: Optional[Latency] = None):
+    """aiohttp application serving cluster on the REST paths the elasticsearch client uses."""
+    from aiohttp import web
+
+    latency = latency or Latency()
+    headers = {"X-Elastic-Product": "Elasticsearch"}
+
+    def reply(payload: dict, status: int = 200):
+        return web.Response(body=orjson.dumps(payload), status=status, content_type="application/json",
+                            headers=headers)
+
+    async def body_of(request) -> dict:
+        # aiohttp has already decoded the client's gzip (http_compress) bodies
+        raw = await request.read()
+        return orjson.loads(raw) if raw.strip() else {}
+
+    @web.middleware
+    async def round_trip(request, handler):
+        if request.path != "/":
+            await latency.wait()
+        try:
+            return await handler(request)
+        except FakeError as e:
+            return reply(e.body(), e.status)
+
+    async def info(request):
+        return reply({"name": "fake", "cluster_name": "fake", "tagline": "You Know, for Search",
+                      "version": {"number": "7.14.0", "build_flavor": "default"}})
+
+    async def search(request):
+        params = request.query
+        return reply(cluster.search(request.match_info.get("index"), await body_of(request),
+                                    scroll=params.get("scroll"),
+                                    size=int(params["size"]) if "size" in params else None,
+                                    from_=int(params["from"]) if "from" in params else None))
+
+    async def msearch(request):
+        lines = [orjson.loads(line) for line in (await request.read()).splitlines() if line.strip()]
+        return reply(cluster.msearch(lines, request.match_info.get("index")))
+
+    async def count(request):
+        return reply(cluster.count(request.match_info["index"], await body_of(request)))
+
+    async def scroll(request):
+        body = await body_of(request)
+        return reply(cluster.scroll(request.match_info.get("scroll_id") or body.get("scroll_id")))
+
+    async def clear_scroll(request):
+        return reply(cluster.clear_scroll((await body_of(request)).get("scroll_id")))
+
+    async def get_alias(request):
+        return reply(cluster.get_alias(request.match_info.get("index")))
+
+    async def open_pit(request):
+        return reply(cluster.open_point_in_time(request.match_info["index"]))
+
+    async def close_pit(request):
+        return reply(cluster.close_point_in_time((await body_of(request)).get("id")))
+
+    app = web.Application(middlewares=[round_trip], client_max_size=64 * 1024 ** 2)
+    app.router.add_get("/", info)
+    app.router.add_get("/_alias", get_alias)
+    app.router.add_get("/{index}/_alias", get_alias)
+    app.router.add_delete("/_search/scroll", clear_scroll)
+    app.router.add_delete("/_pit", close_pit)
+    for path, handler in (("/_search/scroll", scroll), ("/_search/scroll/{scroll_id}", scroll), ("/_search", search),
+                          ("/_msearch", msearch), ("/{index}/_search", search), ("/{index}/_msearch", msearch),
+                          ("/{index}/_count", count)):
+        app.router.add_get(path, handler)
+        app.router.add_post(path, handler)
+    app.router.add_post("/{index}/_pit", open_pit)
+    return app
+
+
+# ---- snapshots ------------------------------------------------------------------------------------------
+
+def _hit_refs(value, refs: dict) -> None:
+    """(index -> ids) of every hit in a recorded response."""
+    if isinstance(value, dict):
+        if "_index" in value and "_id" in value:
+            refs.setdefault(value["_index"], set()).add(str(value["_id"]))
+        for item in value.values():
+            _hit_refs(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            _hit_refs(item, refs)
+
+
+def take_snapshot(es, recording: dict, batch: int = 500) -> dict:
+    """Full documents of the hits of recording, and the indices and aliases of the cluster, from es (a sync client)."""
+    refs = {}
+    _hit_refs(recording.get("es", {}), refs)
+    indices = {}
+    for index in sorted(refs):
+        ids = sorted(refs[index])
+        docs = []
+        for start in range(0, len(ids), batch):
+            chunk = ids[start:start + batch]
+            response = es.search(index=index, body={"query": {"ids": {"values": chunk}}, "size": len(chunk),
+                                                    "sort": ["_doc"]})
+            docs.extend({"_id": hit["_id"], "_source": hit["_source"]} for hit in response["hits"]["hits"])
+        indices[index] = docs
+    aliases = {}
+    for index, info in sorted(es.indices.get_alias(index="*").items()):
+        # indices the recording has no hits of are kept empty: searching them must not be a 404
+        indices.setdefault(index, [])
+        for alias in info.get("aliases", {}):
+            aliases.setdefault(alias, []).append(index)
+    return {"indices": indices, "aliases": aliases}
+
+
+def main(args) -> None:
+    if args.command == "snapshot":
+        from core.environment import env
+        from services.elasticsearch_service import ESConnection
+
+        es = ESConnection(env.getConfig()["elastic_source"])
+        es.connect()
+        snapshot = take_snapshot(es.es, load_recording(args.recording))
+        save_recording(args.out, snapshot)
+        print(orjson.dumps({"snapshot": args.out, "indices": len(snapshot["indices"]),
+                            "documents": sum(len(docs) for docs in snapshot["indices"].values()),
+                            "aliases": len(snapshot["aliases"])}, option=orjson.OPT_INDENT_2).decode())
+        return
+
+    from aiohttp import web
+
+    cluster = FakeCluster.load(args.snapshot)
+    counts = Counter({name: len(index.docs) for name, index in cluster.indices.items()})
+    print(f"serving {sum(counts.values())} documents of {len(counts)} indices on http://{args.host}:{args.port}")
+    web.run_app(make_server(cluster, Latency(args.latency, args.jitter, args.seed)), host=args.host, port=args.port,
+                print=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot = commands.add_parser("snapshot", help="snapshot the documents a bench.replay recording hits")
+    snapshot.add_argument("--recording", required=True)
+    snapshot.add_argument("--out", required=True, help="snapshot file (.gz to compress)")
+    serve = commands.add_parser("serve", help="serve a snapshot over HTTP")
+    serve.add_argument("--snapshot", required=True)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=9200)
+    serve.add_argument("--latency", type=float, default=0.0, help="ms per request")
+    serve.add_argument("--jitter", type=float, default=0.0, help="+- ms of latency")
+    serve.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
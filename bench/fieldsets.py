@@ -0,0 +1,88 @@
+"""
+Sparse fieldsets: build latency of a minimal SKU payload (`fields=`) against the full payload.
+
+Builds each --ids SKU --repeat times in full and with only --fields, against the cluster and
+database configured in config/datastore.ini, and reports the median / p95 build time, the searches
+sent to ES (msearch bodies counted per search) and the payload size of both.
+
+    python -m bench.fieldsets --ids 123456,123457 --lang deu_deu --market MARKET-005 --fields name,price,active
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import orjson
+
+from core.environment import env
+from models.sku import Sku
+from services.database_service import DBConnection
+from services.elasticsearch_service import ESConnection
+from services.sku_builder import SkuBuilder
+from utils.fieldsets import parse_fields
+
+
+class CountingES(ESConnection):
+    """ESConnection that counts the searches reaching the cluster."""
+
+    searches = 0
+
+    async def asearch_direct(self, index, query):
+        self.searches += 1
+        return await super().asearch_direct(index, query)
+
+    async def amsearch(self, body):
+        self.searches += len(body) // 2
+        return await super().amsearch(body)
+
+
+async def run(es: CountingES, builder: SkuBuilder, fields, args) -> dict:
+    latencies, sizes = [], []
+    searches = es.searches
+    for _ in range(args.repeat):
+        for sku_id in args.ids.split(","):
+            started = time.perf_counter()
+            sku = await builder.build_sku(sku_id, args.lang, args.brand, args.market, fields)
+            latencies.append(time.perf_counter() - started)
+            sizes.append(len(orjson.dumps(sku.model_dump())) if sku else 0)
+    latencies.sort()
+    return {
+        "fields": ",".join(sorted(fields)) if fields else "all",
+        "builds": len(latencies),
+        "es_searches_per_build": round((es.searches - searches) / len(latencies), 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 2),
+        "payload_bytes": round(statistics.mean(sizes)),
+    }
+
+
+async def main(args) -> None:
+    config = env.getConfig()
+    es = CountingES(config["elastic_source"])
+    es.connect()
+    db_cfg = config["epim_db"]
+    db = DBConnection(db_cfg["type"], db_cfg["host"], db_cfg["user"], db_cfg["pass"], db_cfg["name"])
+    db.configure_pool(db_cfg)
+    db.connect()
+    builder = SkuBuilder(es, db)
+    fields = parse_fields(args.fields, Sku)
+
+    # warm up the process-wide caches so both runs see the same state
+    for sku_id in args.ids.split(","):
+        await builder.build_sku(sku_id, args.lang, args.brand, args.market)
+    results = [await run(es, builder, None, args), await run(es, builder, fields, args)]
+    db.disconnect()
+    await es.aclose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", required=True, help="comma separated SKU epimIds")
+    parser.add_argument("--lang", default="deu_deu")
+    parser.add_argument("--brand", default="systemair")
+    parser.add_argument("--market", default="MARKET-005")
+    parser.add_argument("--fields", default="name,price,active")
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,178 @@
+"""
+Language fallback: client-side merge vs. the painless langIso sort + collapse.
+
+Microbenchmark (default): times merge_fallback_hits on synthetic per-index responses for the
+fallback chains of --langs, with --parents collapse keys per chain.
+
+With --fixture, searches a synthetic attribute catalogue served by the fake cluster (bench.fake_es)
+in both modes and checks that the hits are identical, also when one index of the chain rejects the
+per-index search (its langIso without doc values): the run exits non-zero on any difference.
+
+With --ids, additionally searches the attributes of those parent ids in both modes against the
+cluster configured in config/datastore.ini, checks that the hits are identical and reports the
+wall time of each mode.
+
+    python -m bench.lang_fallback --langs deu_che,ukr_ukr,eng_glo --parents 5000
+    python -m bench.lang_fallback --langs deu_che,ukr_ukr,eng_glo --fixture
+    python -m bench.lang_fallback --langs deu_che,ukr_ukr,eng_glo --ids 123456,234567 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+from elasticsearch.exceptions import RequestError
+
+from bench.fake_es import FakeClient, FakeCluster
+from core.environment import env
+from queries.sku_queries import query_attributes
+from services.elasticsearch_service import ESConnection
+from services.lang_fallback import lang_fallback
+from utils.mapping import get_fallback_chain
+from utils.utilities import merge_fallback_hits
+
+
+def synthetic_responses(chain: list, parents: int, seed: int = 1) -> list:
+    """Per-index responses: every parent has an attribute in the first index, about half of them
+    also in each later one."""
+    rnd = random.Random(seed)
+    responses = []
+    for position, lang in enumerate(chain):
+        hits = [
+            {"_index": f"systemair_ds_attributes_{lang}",
+             "_source": {"parentId": parent, "values": [{"value": f"{parent}-{lang}"}]},
+             "fields": {"langIso": [lang.upper()], "attributeParentId": [f"attr_{parent}"]}}
+            for parent in range(parents) if position == 0 or rnd.random() < 0.5
+        ]
+        responses.append({"hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}})
+    return responses
+
+
+def microbench(lang: str, parents: int, repeat: int) -> dict:
+    chain = get_fallback_chain(lang)
+    responses = synthetic_responses(chain, parents)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        merged = merge_fallback_hits(responses, chain, "attributeParentId", 10000)
+        timings.append(time.perf_counter() - started)
+    return {
+        "lang": lang,
+        "chain": chain,
+        "hits_in": sum(len(r["hits"]["hits"]) for r in responses),
+        "hits_out": len(merged),
+        "merge_p50_ms": round(statistics.median(timings) * 1000, 3),
+        "merge_max_ms": round(max(timings) * 1000, 3),
+    }
+
+
+def fixture_snapshot(langs: list, parents: int, seed: int = 1) -> dict:
+    """Attribute documents of `parents` products in every index of the chains of langs: each attribute
+    is in a random subset of them (the parent's first attribute in all), a few without values."""
+    rnd = random.Random(seed)
+    names = list(dict.fromkeys(chain_lang for lang in langs for chain_lang in get_fallback_chain(lang)))
+    indices = {f"systemair_ds_attributes_{name}": [] for name in names}
+    for parent in range(1, parents + 1):
+        for attribute in range(rnd.randint(1, 6)):
+            for name in names:
+                if attribute and rnd.random() < 0.5:
+                    continue
+                values = [] if rnd.random() < 0.05 else [{"value": f"{parent}.{attribute}-{name}"}]
+                indices[f"systemair_ds_attributes_{name}"].append({
+                    "_id": f"{name}-{parent}-{attribute}",
+                    "_source": {"parentId": parent, "parentType": "product", "langIso": name.upper(),
+                                "attributeParentId": f"attr_{parent}_{attribute}", "values": values}})
+    return {"indices": indices}
+
+
+class RejectingClient(FakeClient):
+    """FakeClient rejecting searches with docvalue_fields on `rejected` (as ES does for a field without
+    doc values), so LangFallbackSearch has to fall back to the script search."""
+
+    def __init__(self, cluster: FakeCluster, rejected: str):
+        super().__init__(cluster)
+        self.rejected = rejected
+
+    async def search(self, index=None, body=None, **kwargs):
+        if index == self.rejected and (body or {}).get("docvalue_fields"):
+            raise RequestError(400, "illegal_argument_exception", {"error": {"reason": "no doc values for [langIso]"}})
+        return await super().search(index=index, body=body, **kwargs)
+
+    async def msearch(self, body=None, index=None, **kwargs):
+        responses = []
+        for header, query in zip(body[::2], body[1::2]):
+            try:
+                responses.append({**await self.search(index=header.get("index"), body=query), "status": 200})
+            except RequestError as e:
+                responses.append({"error": {"type": e.error}, "status": e.status_code})
+        return {"took": 0, "responses": responses}
+
+
+async def fixture(lang: str, snapshot: dict, ids: list, reject: bool) -> dict:
+    cluster = FakeCluster(snapshot)
+    rejected = f"systemair_ds_attributes_{get_fallback_chain(lang)[-1]}"
+    es = ESConnection({})
+    # the per-index searches go out as one _msearch, as with the default [elastic_source] msearch_batching
+    es.msearch_batching = True
+    es.aes = RejectingClient(cluster, rejected) if reject else FakeClient(cluster)
+    hits, counters = {}, {}
+    for mode in ("script", "merge"):
+        lang_fallback.mode = mode
+        before = lang_fallback.stats()
+        response = await lang_fallback.search(es, query_attributes(ids), lang)
+        hits[mode] = [(hit["_index"], hit["_id"]) for hit in response["hits"]["hits"]]
+        counters[mode] = {key: lang_fallback.stats()[key] - before[key] for key in ("merged", "script_searches",
+                                                                                      "rejected")}
+    return {"lang": lang, "rejected_index": rejected if reject else None, "hits": len(hits["script"]),
+            "merge": counters["merge"], "identical": hits["script"] == hits["merge"]}
+
+
+async def live(es: ESConnection, lang: str, ids: list, repeat: int) -> dict:
+    result = {"lang": lang}
+    hits = {}
+    for mode in ("script", "merge"):
+        lang_fallback.mode = mode
+        script_searches = lang_fallback.script_searches
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await lang_fallback.search(es, query_attributes(ids), lang)
+            timings.append(time.perf_counter() - started)
+        hits[mode] = [(hit["_index"], hit["_id"]) for hit in response["hits"]["hits"]]
+        result[mode] = {"hits": len(hits[mode]), "p50_ms": round(statistics.median(timings) * 1000, 2),
+                        "script_searches": lang_fallback.script_searches - script_searches}
+    result["identical"] = hits["script"] == hits["merge"]
+    return result
+
+
+async def main(args) -> None:
+    langs = args.langs.split(",")
+    results = {"microbench": [microbench(lang, args.parents, args.repeat) for lang in langs]}
+    if args.fixture:
+        snapshot = fixture_snapshot(langs, args.parents)
+        ids = list(range(1, args.parents + 1, 3))
+        results["fixture"] = [await fixture(lang, snapshot, ids, reject)
+                              for lang in langs for reject in (False, True)]
+    if args.ids:
+        es = ESConnection(env.getConfig()["elastic_source"])
+        es.connect()
+        ids = [i.strip() for i in args.ids.split(",") if i.strip()]
+        results["live"] = [await live(es, lang, ids, args.repeat) for lang in langs]
+        await es.aclose()
+    print(json.dumps(results, indent=2))
+    if not all(result["identical"] for result in results.get("fixture", [])):
+        sys.exit("merge and script searches returned different hits")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--langs", default="deu_che,ukr_ukr,eng_glo")
+    parser.add_argument("--parents", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fixture", action="store_true",
+                        help="compare both modes on a synthetic catalogue in the fake cluster")
+    parser.add_argument("--ids", help="comma separated parent ids for the live comparison")
+    asyncio.run(main(parser.parse_args()))
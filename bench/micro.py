@@ -0,0 +1,236 @@
+"""
+Microbenchmarks of the pure-Python transforms every request runs, on synthetic fixtures shaped like
+the catalogue's documents (sizes in --scale multiples of a typical request):
+
+    parse_piped_value             attribute values with and without a trailing "[unit]"
+    inject_fallback_sort          the attribute query of a SKU, per fallback chain
+    shop_statistics               market-NNN / market-NNN-expired attributes of a brand's reference SKUs
+    clean_and_serialize_rows      an operating mode table with header rows and empty sections
+    transform_xml_to_json         rich text elements (<FT> paragraphs with inline tags)
+    technical_rows                SkuBuilder's technical section matching (definitions x attribute hits)
+
+Each benchmark runs --repeat times, as many calls per repeat as fill --min-time, and reports the
+best and the median time per call. bench/micro_thresholds.json holds a generous upper bound per
+benchmark in microseconds at --scale 1 (about four times a developer machine); --check fails the run
+when a median goes over it, --baseline / --max-regression compare with the JSON of an earlier run like bench.replay:
+
+    python -m bench.micro --output results/micro-$(git rev-parse --short HEAD).json
+    python -m bench.micro --check --baseline results/micro-previous.json --max-regression 25
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from bench.replay import git_commit
+from queries.sku_queries import query_sku_attributes
+from services.category_builder import CategoryBuilder
+from services.operating_mode_builder import OperatingModeBuilder
+from services.sku_builder import _technical_rows
+from utils.utilities import inject_fallback_sort, parse_piped_value, shop_statistics
+
+THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_thresholds.json")
+LANGS = ["deu_che", "deu_deu", "eng_glo", "ita_che", "ukr_ukr"]
+UNITS = ["mm", "kg", "m³/h", "Pa", "W", "dB(A)", "°C"]
+
+
+def piped_values(count: int, rnd: random.Random) -> list:
+    values = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            values.append(f"{rnd.randint(1, 999)}|{rnd.randint(1, 99)} | {rnd.randint(1, 9)}  [{rnd.choice(UNITS)}]")
+        elif kind == 1:
+            values.append(f"Galvanised steel, {rnd.randint(1, 9)} mm")
+        elif kind == 2:
+            values.append(rnd.randint(1, 5000))
+        else:
+            values.append(f"{rnd.randint(100, 9999)} [{rnd.choice(UNITS)}]")
+    return values
+
+
+def statistics_hits(parents: int, markets: int, rnd: random.Random) -> list:
+    """market flags of `parents` reference SKUs: most listed in a few markets, some of them expired."""
+    hits = []
+    for parent in range(parents):
+        for market in rnd.sample(range(1, markets + 1), k=min(markets, rnd.randint(1, 6))):
+            name = f"market-{market:03d}"
+            hits.append({"_source": {"name": name, "parentId": parent, "values": [{"value": rnd.choice([1, 1, 0])}]}})
+            hits.append({"_source": {"name": f"{name}-expired", "parentId": parent,
+                                     "values": [{"value": rnd.choice([0, 0, 0, 1, None])}]}})
+    rnd.shuffle(hits)
+    return hits
+
+
+def table_rows(sections: int, rows_per_section: int, rnd: random.Random) -> list:
+    rows = [{"tr": [{"th": "Parameter"}, {"th": "Value"}, {"th": "Unit"}]}]
+    for section in range(sections):
+        rows.append({"tr": [{"th": f"Section {section}"}, {"th": ""}, {"th": ""}]})
+        # about one section in four has no data: its header is dropped
+        filled = rows_per_section if rnd.random() < 0.75 else 0
+        for row in range(filled):
+            rows.append({"tr": [{"td": f"Parameter {section}.{row}"}, {"td": str(rnd.randint(1, 9999))},
+                                {"td": rnd.choice(UNITS)}]})
+    return rows
+
+
+def rich_text(paragraphs: int, rnd: random.Random) -> str:
+    fragments = []
+    for i in range(paragraphs):
+        if i % 5 == 4:
+            fragments.append("<FT></FT>")
+            continue
+        words = " ".join(rnd.choice(["supply", "air", "unit", "with", "EC", "fans", "and", "heat", "recovery"])
+                         for _ in range(rnd.randint(8, 30)))
+        fragments.append(f"<FT>{words} <b>bold</b> and <i>{words[:20]}</i> tail<bl>item</bl>.</FT>")
+    return "".join(fragments)
+
+
+def technical_section(entries: int, hits: int, rnd: random.Random, lang: str = "deu_che") -> tuple:
+    """(tech entries, attribute hits) of one technical section: sub-section headers between groups of
+    single-attribute entries, a few multi-attribute ones, and hits in no particular order (plus noise)."""
+    tech, names = [], []
+    for i in range(entries):
+        if i % 10 == 0:
+            tech.append({"attribute": ["dummy-table-header"], "label": [f"Group {i // 10}"], "shortcut": [None]})
+            continue
+        attrs = [f"ATT_{i}"] if i % 7 else [f"ATT_{i}", f"ATT_{i}_ALT"]
+        names.extend(attrs)
+        tech.append({"attribute": attrs, "label": [f"Parameter {i}"], "shortcut": [None]})
+    att_hits = []
+    for i in range(hits):
+        name = names[i] if i < len(names) else f"OTHER_{i}"
+        values = [{"value": f"{rnd.randint(1, 999)} [{rnd.choice(UNITS)}]", "unit": "",
+                   "unitList": [{"langIso": lang, "unitShortName": rnd.choice(UNITS)}]}]
+        if i % 9 == 0:
+            values.append({"value": str(rnd.randint(1, 99)), "seqorderNr": 2})
+        att_hits.append({"_source": {"name": name, "values": values if i % 13 else []}})
+    rnd.shuffle(att_hits)
+    return tech, att_hits
+
+
+def cases(scale: int, seed: int) -> dict:
+    """name -> (description, callable running one call)."""
+    rnd = random.Random(seed)
+    values = piped_values(200 * scale, rnd)
+    query = query_sku_attributes([f"ATT_{i}" for i in range(40 * scale)], [123456, 234567, 345678])
+    stats_hits = statistics_hits(300 * scale, 40, rnd)
+    rows = table_rows(12 * scale, 8, rnd)
+    xml = rich_text(10 * scale, rnd)
+    tech, att_hits = technical_section(60 * scale, 80 * scale, rnd)
+    om_builder = OperatingModeBuilder(None, None)
+    category_builder = CategoryBuilder(None)
+    loop = asyncio.new_event_loop()
+
+    def parse_all():
+        for value in values:
+            parse_piped_value(value)
+
+    def inject_all():
+        for lang in LANGS:
+            inject_fallback_sort(query, lang)
+
+    return {
+        "parse_piped_value": (f"{len(values)} values", parse_all),
+        "inject_fallback_sort": (f"{len(LANGS)} langs, {40 * scale} attributes", inject_all),
+        "shop_statistics": (f"{len(stats_hits)} attribute hits", lambda: shop_statistics(stats_hits)),
+        "clean_and_serialize_rows": (f"{len(rows)} rows", lambda: om_builder.clean_and_serialize_rows(rows)),
+        # the OperatingModeBuilder copy is the one requests run; CategoryBuilder's is the same code
+        "transform_xml_to_json": (f"{len(xml)} chars",
+                                  lambda: loop.run_until_complete(om_builder.transform_xml_to_json(xml))),
+        "transform_xml_to_json_category": (f"{len(xml)} chars",
+                                           lambda: loop.run_until_complete(category_builder.transform_xml_to_json(xml))),
+        "technical_rows": (f"{len(tech)} entries x {len(att_hits)} hits",
+                           lambda: _technical_rows(tech, att_hits, "deu_che")),
+    }
+
+
+def measure(run, repeat: int, min_time: float) -> dict:
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9)))
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        timings.append((time.perf_counter() - started) / loops)
+    return {"loops": loops, "best_us": round(min(timings) * 1e6, 2),
+            "median_us": round(statistics.median(timings) * 1e6, 2)}
+
+
+def main(args) -> None:
+    selected = cases(args.scale, args.seed)
+    if args.only:
+        names = args.only.split(",")
+        unknown = set(names) - set(selected)
+        if unknown:
+            sys.exit(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        selected = {name: selected[name] for name in names}
+
+    benchmarks = {}
+    for name, (size, run) in selected.items():
+        benchmarks[name] = {"size": size, **measure(run, args.repeat, args.min_time)}
+        print(f"{name:32} {benchmarks[name]['median_us']:>12.2f} us  ({size})", file=sys.stderr)
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "settings": {"scale": args.scale, "repeat": args.repeat, "min_time": args.min_time, "seed": args.seed},
+        "benchmarks": benchmarks,
+    }
+    failures = []
+    if args.check:
+        with open(args.thresholds, "r", encoding="utf-8") as f:
+            limits = json.load(f)
+        for name, stats in benchmarks.items():
+            limit = limits.get(name)
+            if limit is not None and stats["median_us"] > limit:
+                failures.append(f"{name}: {stats['median_us']} us > {limit} us")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["benchmarks"]
+        result["comparison"] = {name: round((stats["median_us"] - baseline[name]["median_us"])
+                                            / baseline[name]["median_us"] * 100, 1)
+                                for name, stats in benchmarks.items() if name in baseline}
+        if args.max_regression is not None:
+            failures += [f"{name}: {change}% slower than {args.baseline}"
+                         for name, change in result["comparison"].items() if change > args.max_regression]
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="comma separated benchmark names")
+    parser.add_argument("--scale", type=int, default=1, help="fixture size multiplier")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per repeat")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="store_true", help="fail when a median exceeds its threshold")
+    parser.add_argument("--thresholds", default=THRESHOLDS)
+    parser.add_argument("--output", help="also write the JSON result here")
+    parser.add_argument("--baseline", help="JSON result of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, help="fail when a median grew more than this many percent")
+    arguments = parser.parse_args()
+    if arguments.check and arguments.scale != 1:
+        parser.error("the thresholds are for --scale 1")
+    main(arguments)
@@ -0,0 +1,90 @@
+"""
+Deep-page latency of the SKU listing: from/size against cursor (point in time + search_after) pages.
+
+For each --depths page number, times the search of that page of GET /rest/<brand>/<locale>/skus
+with from/size and with the cursor a client walking the listing holds when it gets there (the walk
+itself is not timed). Reports wall time and ES `took` per page (median of --repeat runs) against
+the cluster configured in config/datastore.ini. from/size pages past index.max_result_window
+(10000 hits by default) are reported as errors.
+
+    python -m bench.pagination --lang deu_deu --brand systemair --limit 100 --depths 1,10,50,100,200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from core.environment import env
+from queries.export_queries import EXPORT_SORT, query_export_skus
+from services.brand_filters import brand_terms
+from services.elasticsearch_service import ESConnection
+from utils.pagination import cursor_paging
+
+
+async def timed(search) -> tuple:
+    started = time.perf_counter()
+    response = await search()
+    return (time.perf_counter() - started) * 1000, response.get("took", 0)
+
+
+async def offset_page(es: ESConnection, index: str, query: dict, page: int, args) -> dict:
+    body = {**query, "from": (page - 1) * args.limit, "size": args.limit, "sort": EXPORT_SORT}
+    runs = []
+    for _ in range(args.repeat):
+        try:
+            runs.append(await timed(lambda: es.asearch_direct(index, body)))
+        except Exception as e:
+            return {"error": type(e).__name__}
+    return {"wall_ms": round(statistics.median(r[0] for r in runs), 2),
+            "took_ms": statistics.median(r[1] for r in runs)}
+
+
+async def cursor_pages(es: ESConnection, index: str, query: dict, depths: list, args) -> dict:
+    """Walks the listing once; at every depth, times that page --repeat times from the same cursor."""
+    results, cursor, page = {}, "", 0
+    while cursor is not None and page < max(depths):
+        page += 1
+        if page in depths:
+            runs = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response, _ = await cursor_paging.page(es, index, query, EXPORT_SORT, args.limit, cursor)
+                runs.append(((time.perf_counter() - started) * 1000, response.get("took", 0)))
+            results[page] = {"wall_ms": round(statistics.median(r[0] for r in runs), 2),
+                             "took_ms": statistics.median(r[1] for r in runs)}
+        _, cursor = await cursor_paging.page(es, index, query, EXPORT_SORT, args.limit, cursor)
+    return results
+
+
+async def main(args) -> None:
+    config = env.getConfig()
+    es = ESConnection(config["elastic_source"])
+    es.connect()
+    cursor_paging.configure({"keep_alive": args.keep_alive})
+    index = f"systemair_ds_products_{args.lang}"
+    query = query_export_skus(args.brand, await brand_terms.resolve(es, index, args.brand))
+    depths = sorted(int(d) for d in args.depths.split(","))
+
+    cursor = await cursor_pages(es, index, query, depths, args)
+    results = []
+    for page in depths:
+        results.append({
+            "page": page,
+            "first_hit": (page - 1) * args.limit,
+            "from_size": await offset_page(es, index, query, page, args),
+            "cursor": cursor.get(page, {"error": "past the last page"}),
+        })
+    await es.aclose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lang", default="deu_deu")
+    parser.add_argument("--brand", default="systemair")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--depths", default="1,10,50,100,200")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep-alive", default="2m")
+    asyncio.run(main(parser.parse_args()))
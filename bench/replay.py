@@ -0,0 +1,253 @@
+"""
+Replay load benchmark: a weighted request mix against the app in-process, on recorded ES/DB responses.
+
+A mix is a JSON lines file, one entry per request kind:
+
+    {"name": "sku", "weight": 10, "paths": ["/rest/systemair/de-CH/sku/123456", "..."]}
+
+Record the responses of the mix once against the cluster and database of config/datastore.ini
+(every path is requested twice, so cache revalidation searches are recorded too):
+
+    python -m bench.replay --mix bench/mixes/catalogue.jsonl --record recordings/catalogue.json.gz
+
+then replay it offline, as often as needed, with --concurrency requests in flight and a simulated round
+trip time per ES search / msearch and DB query (see bench.standin):
+
+    python -m bench.replay --mix bench/mixes/catalogue.jsonl --recording recordings/catalogue.json.gz \
+        --requests 2000 --concurrency 32 --es-latency 4 --db-latency 2 --output results/replay.json
+
+Instead of recorded responses, ES can be a fake cluster answering real queries over a document snapshot
+(see bench.fake_es), in-process with --snapshot or as a separate server with --es-url, e.g. to replay
+requests whose exact queries were never recorded; DB rows still come from --recording when given:
+
+    python -m bench.replay --mix bench/mixes/catalogue.jsonl --snapshot recordings/catalogue.snapshot.json.gz \
+        --recording recordings/catalogue.json.gz --requests 2000 --concurrency 32
+
+Reports p50/p95/p99 latency, throughput, ES round trips / searches and DB queries per request (overall
+and per mix entry) and the peak RSS of the process, as JSON. With --baseline (the output of an earlier
+run, e.g. of the previous commit) the changes against it are added, and --max-regression makes the run
+fail when the overall p95 got worse by more than that percentage.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import orjson
+
+from bench.fake_es import FakeClient, FakeCluster
+from bench.standin import CannedClient, CannedDB, CountingClient, Latency, RecordingClient, RecordingDB, counting, \
+    load_recording, save_recording
+from core.environment import env
+from services.elasticsearch_service import ESConnection
+from services.response_cache import entity_responses
+from services.single_flight import entity_flight
+
+
+def load_mix(path: str) -> list:
+    mix = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entry.setdefault("paths", [entry.get("path")])
+                mix.append(entry)
+    return mix
+
+
+def schedule(mix: list, requests: int, seed: int) -> list:
+    """(name, path) of every request to send, drawn by weight from a seeded generator."""
+    rng = random.Random(seed)
+    entries = rng.choices(mix, weights=[entry.get("weight", 1) for entry in mix], k=requests)
+    return [(entry["name"], rng.choice(entry["paths"])) for entry in entries]
+
+
+def percentile(latencies: list, q: float) -> float:
+    return round(latencies[max(int(len(latencies) * q) - 1, 0)] * 1000, 2)
+
+
+def summary(samples: list, seconds: float) -> dict:
+    latencies = sorted(s["latency"] for s in samples)
+    count = len(samples)
+    return {
+        "requests": count,
+        "errors": sum(1 for s in samples if s["status"] >= 500),
+        "not_found": sum(1 for s in samples if s["status"] == 404),
+        "throughput_rps": round(count / seconds, 1) if seconds else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "es_round_trips_per_request": round(sum(s["round_trips"] for s in samples) / count, 2),
+        "es_searches_per_request": round(sum(s["searches"] for s in samples) / count, 2),
+        "db_queries_per_request": round(sum(s["db_queries"] for s in samples) / count, 2),
+    }
+
+
+async def replay(client, requests: list, concurrency: int) -> tuple:
+    samples = []
+    pending = iter(requests)
+
+    async def worker():
+        for name, path in pending:
+            counter = counting()
+            started = time.perf_counter()
+            response = await client.get(path)
+            await response.get_data()
+            samples.append({"name": name, "status": response.status_code,
+                            "latency": time.perf_counter() - started, "round_trips": counter.round_trips,
+                            "searches": counter.searches, "db_queries": counter.db_queries})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def compare(result: dict, baseline: dict) -> dict:
+    """Relative change (%) of the latency, throughput and call counts against baseline, overall and per entry."""
+    def delta(now: dict, before: dict) -> dict:
+        return {key: round((now[key] - before[key]) / before[key] * 100, 1)
+                for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "es_round_trips_per_request",
+                            "es_searches_per_request", "db_queries_per_request")
+                if before.get(key) and now.get(key) is not None}
+
+    return {
+        "baseline_commit": baseline.get("commit"),
+        "overall": delta(result["overall"], baseline["overall"]),
+        "entries": {name: delta(stats, baseline["entries"][name])
+                    for name, stats in result["entries"].items() if name in baseline.get("entries", {})},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def record(app, mix: list, args) -> None:
+    config = env.getConfig()
+    recording = {}
+    es = ESConnection(config["elastic_source"])
+    es.connect()
+    if es.aes is None:
+        sys.exit("recording needs the async transport ([elastic_source] async_transport = true)")
+    es.aes = RecordingClient(es.aes, recording)
+    db_cfg = config["epim_db"]
+    db = RecordingDB(recording, db_cfg["type"], db_cfg["host"], db_cfg["user"], db_cfg["pass"], db_cfg["name"])
+    db.configure_pool(db_cfg)
+    db.connect()
+    app.es, app.db = es, db
+
+    client = app.test_client()
+    paths = [path for entry in mix for path in entry["paths"]]
+    for _ in range(2):
+        for path in paths:
+            response = await client.get(path)
+            await response.get_data()
+            print(response.status_code, path, file=sys.stderr)
+    db.disconnect()
+    await es.aclose()
+    save_recording(args.record, recording)
+    print(json.dumps({"recording": args.record, "es_responses": len(recording.get("es", {})),
+                      "db_results": len(recording.get("db", {}))}, indent=2))
+
+
+async def main(args) -> None:
+    # imported here: importing the app reads config/datastore.ini
+    from app import app
+
+    mix = load_mix(args.mix)
+    if args.record:
+        await record(app, mix, args)
+        return
+
+    recording = load_recording(args.recording) if args.recording else {}
+    es_latency = Latency(args.es_latency, args.es_jitter, args.seed)
+    if args.es_url:
+        # latency is the server's (bench.fake_es serve --latency)
+        es = ESConnection({"url": args.es_url, "user": "", "pass": "", "async_transport": "true"})
+        es.connect()
+        es.aes = CountingClient(es.aes)
+    elif args.snapshot:
+        es = ESConnection({})
+        es.aes = CountingClient(FakeClient(FakeCluster.load(args.snapshot), es_latency))
+    else:
+        es = ESConnection({})
+        es.aes = CannedClient(recording, es_latency)
+    es.msearch_batching = not args.no_msearch_batching
+    db = CannedDB(recording, Latency(args.db_latency, 0, args.seed), env.getConfig().get("epim_db"))
+    app.es, app.db = es, db
+    if args.uncached:
+        # every entity request builds (in-flight builds are still shared)
+        entity_responses.enabled = False
+        entity_flight.reuse_window = 0
+
+    client = app.test_client()
+    if args.warmup:
+        await replay(client, schedule(mix, args.warmup, args.seed + 1), args.concurrency)
+    samples, seconds = await replay(client, schedule(mix, args.requests, args.seed), args.concurrency)
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "settings": {"mix": args.mix, "recording": args.recording, "snapshot": args.snapshot,
+                     "es_url": args.es_url, "requests": args.requests,
+                     "concurrency": args.concurrency, "es_latency_ms": args.es_latency,
+                     "es_jitter_ms": args.es_jitter, "db_latency_ms": args.db_latency,
+                     "msearch_batching": es.msearch_batching, "uncached": args.uncached, "seed": args.seed},
+        "overall": summary(samples, seconds),
+        "entries": {entry["name"]: summary([s for s in samples if s["name"] == entry["name"]], seconds)
+                    for entry in mix if any(s["name"] == entry["name"] for s in samples)},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "recording_misses": {"es": es.aes.misses, "db": db.misses},
+    }
+    if args.baseline:
+        with open(args.baseline, "rb") as f:
+            result["comparison"] = compare(result, orjson.loads(f.read()))
+    await es.aclose()
+    db.disconnect()
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    if args.baseline and args.max_regression is not None:
+        regression = result["comparison"]["overall"].get("p95_ms", 0.0)
+        if regression > args.max_regression:
+            sys.exit(f"p95 regressed by {regression}% (limit {args.max_regression}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", default="bench/mixes/catalogue.jsonl")
+    parser.add_argument("--record", help="record the mix's responses to this file (.gz to compress)")
+    parser.add_argument("--recording", help="replay on the responses recorded in this file")
+    es_source = parser.add_mutually_exclusive_group()
+    es_source.add_argument("--snapshot", help="answer ES searches from a fake cluster over this snapshot")
+    es_source.add_argument("--es-url", help="ES searches go to this (fake) cluster")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100, help="requests sent (and not measured) first")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--es-latency", type=float, default=3.0, help="ms per ES round trip")
+    parser.add_argument("--es-jitter", type=float, default=1.0, help="+- ms of ES latency")
+    parser.add_argument("--db-latency", type=float, default=2.0, help="ms per DB query")
+    parser.add_argument("--no-msearch-batching", action="store_true")
+    parser.add_argument("--uncached", action="store_true", help="disable the entity response cache and build reuse")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON result here")
+    parser.add_argument("--baseline", help="JSON result of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, help="fail when p95 grew more than this many percent")
+    arguments = parser.parse_args()
+    if arguments.record and (arguments.recording or arguments.snapshot or arguments.es_url):
+        parser.error("--record records from the configured cluster and database only")
+    if not (arguments.record or arguments.recording or arguments.snapshot or arguments.es_url):
+        parser.error("one of --record, --recording, --snapshot or --es-url is required")
+    asyncio.run(main(arguments))
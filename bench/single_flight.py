@@ -0,0 +1,96 @@
+"""
+Hot-key burst: many concurrent requests for the same SKU, with and without single-flight.
+
+Fires --requests builds of one SKU with --concurrency in flight, once with every request
+building on its own and once through entity_flight (the path of GET /rest/<brand>/<locale>/sku/<id>),
+against the cluster and database configured in config/datastore.ini. Reports the searches sent
+to ES (msearch bodies counted per search), ES QPS and request latency for both runs.
+
+    python -m bench.single_flight --id 123456 --lang deu_deu --brand systemair --market MARKET-005 --requests 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from core.environment import env
+from services.database_service import DBConnection
+from services.elasticsearch_service import ESConnection
+from services.single_flight import entity_flight
+from services.sku_builder import SkuBuilder
+
+
+class CountingES(ESConnection):
+    """ESConnection that counts the searches reaching the cluster."""
+
+    searches = 0
+
+    async def asearch_direct(self, index, query):
+        self.searches += 1
+        return await super().asearch_direct(index, query)
+
+    async def amsearch(self, body):
+        self.searches += len(body) // 2
+        return await super().amsearch(body)
+
+
+async def burst(es: CountingES, builder: SkuBuilder, coalesce: bool, args) -> dict:
+    entity_flight.enabled = coalesce
+    entity_flight.clear()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def request():
+        async with semaphore:
+            started = time.perf_counter()
+            await entity_flight.do(("sku", str(args.id), args.lang, args.brand, args.market),
+                                   lambda: builder.build_sku(args.id, args.lang, args.brand, args.market))
+            latencies.append(time.perf_counter() - started)
+
+    searches = es.searches
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    sent = es.searches - searches
+    latencies.sort()
+    return {
+        "single_flight": coalesce,
+        "requests": args.requests,
+        "es_searches": sent,
+        "es_qps": round(sent / elapsed, 1) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+async def main(args) -> None:
+    config = env.getConfig()
+    es = CountingES(config["elastic_source"])
+    es.connect()
+    db_cfg = config["epim_db"]
+    db = DBConnection(db_cfg["type"], db_cfg["host"], db_cfg["user"], db_cfg["pass"], db_cfg["name"])
+    db.configure_pool(db_cfg)
+    db.connect()
+    entity_flight.configure({"reuse_window": args.reuse_window})
+    builder = SkuBuilder(es, db)
+
+    # warm up the process-wide caches so both runs see the same state
+    await builder.build_sku(args.id, args.lang, args.brand, args.market)
+    results = [await burst(es, builder, False, args), await burst(es, builder, True, args)]
+    db.disconnect()
+    await es.aclose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--id", required=True)
+    parser.add_argument("--lang", default="deu_deu")
+    parser.add_argument("--brand", default="systemair")
+    parser.add_argument("--market", default="MARKET-005")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--reuse-window", type=float, default=1.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,102 @@
+"""
+SkuBuilder.build_many vs. one build_sku per SKU, on the SKUs of one product.
+
+Builds every SKU both ways against the cluster/DB configured in config/datastore.ini,
+checks that the orjson payloads are byte-identical and reports wall time plus the
+number of ES round trips and DB queries each path needed.
+
+    python -m bench.sku_build_many --product 123456 --lang deu_deu --brand systemair --market MARKET-005
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import orjson
+
+from core.environment import env
+from queries.product_queries import query_child_objects
+from services.database_service import DBConnection
+from services.elasticsearch_service import ESConnection
+from services.sku_builder import SkuBuilder
+
+
+class CallCounter:
+    """Counts ES round trips (_search and _msearch) and DB queries issued through the connections."""
+
+    def __init__(self, es: ESConnection, db: DBConnection):
+        self.es_calls = 0
+        self.db_calls = 0
+        for obj, name, attr in ((es, "asearch_direct", "es_calls"), (es, "amsearch", "es_calls"),
+                                (es, "agetScrollObject", "es_calls"), (db, "aexecute_query", "db_calls")):
+            setattr(obj, name, self._wrap(getattr(obj, name), attr))
+
+    def _wrap(self, fn, attr):
+        async def wrapper(*args, **kwargs):
+            setattr(self, attr, getattr(self, attr) + 1)
+            return await fn(*args, **kwargs)
+        return wrapper
+
+    def take(self) -> dict:
+        counts = {"es_round_trips": self.es_calls, "db_queries": self.db_calls}
+        self.es_calls = self.db_calls = 0
+        return counts
+
+
+def payload(sku) -> bytes:
+    return orjson.dumps(sku.model_dump()) if sku else b"null"
+
+
+async def main(args) -> None:
+    config = env.getConfig()
+    db_cfg = config["epim_db"]
+    db = DBConnection(db_cfg["type"], db_cfg["host"], db_cfg["user"], db_cfg["pass"], db_cfg["name"])
+    db.connect()
+    es = ESConnection(config["elastic_source"])
+    es.connect()
+
+    hits = await es.agetScrollObject(f"systemair_ds_products_{args.lang}", query_child_objects(args.product),
+                                     10000, "1m")
+    sku_ids = [hit["_source"]["epimId"] for hit in hits if hit.get("_source", {}).get("epimId")][:args.limit]
+    counter = CallCounter(es, db)
+    builder = SkuBuilder(es, db)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def build_one(sku_id):
+        async with semaphore:
+            return await builder.build_sku(sku_id, args.lang, args.brand, args.market)
+
+    started = time.perf_counter()
+    single = await asyncio.gather(*[build_one(sku_id) for sku_id in sku_ids])
+    single_s = time.perf_counter() - started
+    single_counts = counter.take()
+
+    started = time.perf_counter()
+    many = await builder.build_many(sku_ids, args.lang, args.brand, args.market, concurrency=args.concurrency)
+    many_s = time.perf_counter() - started
+    many_counts = counter.take()
+
+    mismatches = [str(sku_id) for sku_id, a, b in zip(sku_ids, single, many) if payload(a) != payload(b)]
+    await es.aclose()
+    db.disconnect()
+
+    print(json.dumps({
+        "skus": len(sku_ids),
+        "built": sum(1 for sku in many if sku),
+        "byte_identical": not mismatches,
+        "mismatched_ids": mismatches[:20],
+        "build_sku": {"elapsed_s": round(single_s, 3), **single_counts},
+        "build_many": {"elapsed_s": round(many_s, 3), **many_counts},
+        "speedup": round(single_s / many_s, 2) if many_s else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--product", required=True, help="product epimId whose SKUs are built")
+    parser.add_argument("--lang", default="deu_deu")
+    parser.add_argument("--brand", default="systemair")
+    parser.add_argument("--market", default="MARKET-005")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
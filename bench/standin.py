@@ -0,0 +1,306 @@
+"""
+Offline stand-ins for the cluster and the database: canned responses recorded from the real ones.
+
+RecordingClient wraps the AsyncElasticsearch client of a connected ESConnection (and RecordingDB the
+DBConnection) and keeps every response, keyed by the request (index + body, see request_key).
+CannedClient and CannedDB serve a saved recording back, after a configurable latency per round trip,
+so the real ESConnection (msearch batching, memo, tracing, metrics) and DBConnection code paths run
+unchanged. Requests missing from the recording get an empty result and are counted as misses.
+"""
+import asyncio
+import contextvars
+import decimal
+import gzip
+import hashlib
+import random
+import time
+from typing import Optional
+
+import orjson
+
+from services.database_service import DBConnection
+
+EMPTY_SEARCH = {"took": 0, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                "hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}}
+
+_request_calls: contextvars.ContextVar[Optional["CallCounter"]] = contextvars.ContextVar(
+    "bench_request_calls", default=None
+)
+
+
+class CallCounter:
+    """Round trips and searches of one replayed request (see counting())."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.searches = 0
+        self.db_queries = 0
+
+
+def counting() -> CallCounter:
+    """Count the calls of the current task (and the tasks it starts) in a new CallCounter."""
+    counter = CallCounter()
+    _request_calls.set(counter)
+    return counter
+
+
+def _count(round_trips=0, searches=0, db_queries=0) -> None:
+    counter = _request_calls.get()
+    if counter is not None:
+        counter.round_trips += round_trips
+        counter.searches += searches
+        counter.db_queries += db_queries
+
+
+def request_key(kind: str, index, body) -> str:
+    """Key of a request: its kind, index and body (point in time ids and keep-alives left out)."""
+    if isinstance(body, dict) and "pit" in body:
+        body = {**body, "pit": None}
+    if isinstance(index, (list, tuple)):
+        index = ",".join(index)
+    raw = orjson.dumps([kind, index, body], option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.sha1(raw).hexdigest()
+
+
+def load_recording(path: str) -> dict:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def _plain(value):
+    # DB rows: prices come back as Decimal
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+
+def save_recording(path: str, recording: dict) -> None:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wb") as f:
+        f.write(orjson.dumps(recording, default=_plain))
+
+
+class Latency:
+    """Simulated round trip time: `ms` milliseconds, +- up to `jitter_ms`, from a seeded generator."""
+
+    def __init__(self, ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 1):
+        self.ms = ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+
+    def seconds(self) -> float:
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(self.ms + jitter, 0.0) / 1000
+
+    async def wait(self) -> None:
+        delay = self.seconds()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RecordingClient:
+    """AsyncElasticsearch wrapper keeping the responses of the calls the app makes."""
+
+    def __init__(self, client, recording: dict):
+        self.client = client
+        self.responses = recording.setdefault("es", {})
+        self._scrolls = {}
+
+    async def search(self, index=None, body=None, **kwargs):
+        response = await self.client.search(index=index, body=body, **kwargs)
+        key = request_key("scroll" if "scroll" in kwargs else "search", index, body)
+        self.responses[key] = response
+        if "_scroll_id" in response:
+            self._scrolls[response["_scroll_id"]] = key
+        return response
+
+    async def scroll(self, body=None, **kwargs):
+        response = await self.client.scroll(body=body, **kwargs)
+        # a scroll is replayed as one page holding all its hits
+        key = self._scrolls.pop((body or {}).get("scroll_id"), None)
+        if key is not None:
+            self.responses[key]["hits"]["hits"].extend(response["hits"]["hits"])
+            if response.get("_scroll_id"):
+                self._scrolls[response["_scroll_id"]] = key
+        return response
+
+    async def clear_scroll(self, **kwargs):
+        return await self.client.clear_scroll(**kwargs)
+
+    async def msearch(self, body=None, **kwargs):
+        response = await self.client.msearch(body=body, **kwargs)
+        for header, query, result in zip(body[::2], body[1::2], response.get("responses", [])):
+            if "error" not in result:
+                self.responses[request_key("search", header.get("index"), query)] = result
+        return response
+
+    async def count(self, index=None, body=None, **kwargs):
+        response = await self.client.count(index=index, body=body, **kwargs)
+        self.responses[request_key("count", index, body)] = response
+        return response
+
+    async def open_point_in_time(self, **kwargs):
+        return await self.client.open_point_in_time(**kwargs)
+
+    async def close_point_in_time(self, **kwargs):
+        return await self.client.close_point_in_time(**kwargs)
+
+    async def close(self):
+        await self.client.close()
+
+
+class CannedClient:
+    """AsyncElasticsearch stand-in answering from a recording (see RecordingClient)."""
+
+    def __init__(self, recording: dict, latency: Optional[Latency] = None):
+        self.responses = recording.get("es", {})
+        self.latency = latency or Latency()
+        self.round_trips = 0
+        self.searches = 0
+        self.misses = 0
+
+    async def _round_trip(self, searches: int = 0) -> None:
+        self.round_trips += 1
+        self.searches += searches
+        _count(round_trips=1, searches=searches)
+        await self.latency.wait()
+
+    def _lookup(self, kind: str, index, body, empty=EMPTY_SEARCH) -> dict:
+        response = self.responses.get(request_key(kind, index, body))
+        if response is None:
+            self.misses += 1
+            return orjson.loads(orjson.dumps(empty))
+        # callers may mutate the response; a copy also costs about what parsing a real response does
+        return orjson.loads(orjson.dumps(response))
+
+    async def search(self, index=None, body=None, **kwargs):
+        await self._round_trip(searches=1)
+        if "scroll" in kwargs:
+            return {**self._lookup("scroll", index, body), "_scroll_id": "canned"}
+        response = self._lookup("search", index, body)
+        if isinstance(body, dict) and "pit" in body:
+            response["pit_id"] = "canned"
+        return response
+
+    async def scroll(self, **kwargs):
+        await self._round_trip()
+        return {**EMPTY_SEARCH, "_scroll_id": "canned"}
+
+    async def clear_scroll(self, **kwargs):
+        return {"succeeded": True}
+
+    async def msearch(self, body=None, **kwargs):
+        await self._round_trip(searches=len(body) // 2)
+        return {"took": 0, "responses": [{**self._lookup("search", header.get("index"), query), "status": 200}
+                                         for header, query in zip(body[::2], body[1::2])]}
+
+    async def count(self, index=None, body=None, **kwargs):
+        await self._round_trip(searches=1)
+        return self._lookup("count", index, body, empty={"count": 0})
+
+    async def open_point_in_time(self, **kwargs):
+        await self._round_trip()
+        return {"id": "canned"}
+
+    async def close_point_in_time(self, **kwargs):
+        return {"succeeded": True}
+
+    async def close(self):
+        pass
+
+
+class CountingClient:
+    """AsyncElasticsearch wrapper counting the round trips and searches of each replayed request (see counting())."""
+
+    def __init__(self, client):
+        self.client = client
+        self.round_trips = 0
+        self.searches = 0
+        self.misses = 0
+
+    def _round_trip(self, searches: int = 0) -> None:
+        self.round_trips += 1
+        self.searches += searches
+        _count(round_trips=1, searches=searches)
+
+    async def search(self, **kwargs):
+        self._round_trip(searches=1)
+        return await self.client.search(**kwargs)
+
+    async def scroll(self, **kwargs):
+        self._round_trip()
+        return await self.client.scroll(**kwargs)
+
+    async def clear_scroll(self, **kwargs):
+        return await self.client.clear_scroll(**kwargs)
+
+    async def msearch(self, body=None, **kwargs):
+        self._round_trip(searches=len(body) // 2)
+        return await self.client.msearch(body=body, **kwargs)
+
+    async def count(self, **kwargs):
+        self._round_trip(searches=1)
+        return await self.client.count(**kwargs)
+
+    async def open_point_in_time(self, **kwargs):
+        self._round_trip()
+        return await self.client.open_point_in_time(**kwargs)
+
+    async def close_point_in_time(self, **kwargs):
+        return await self.client.close_point_in_time(**kwargs)
+
+    async def close(self):
+        await self.client.close()
+
+
+def _db_key(query, params) -> str:
+    return request_key("sql", None, [" ".join(str(query).split()), params])
+
+
+class RecordingDB(DBConnection):
+    """DBConnection keeping the rows of every query in recording["db"]."""
+
+    def __init__(self, recording: dict, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows = recording.setdefault("db", {})
+
+    async def aexecute_query(self, query, params=None):
+        rows = await super().aexecute_query(query, params)
+        self.rows[_db_key(query, params)] = rows
+        return rows
+
+
+class CannedDB(DBConnection):
+    """
+    DBConnection answering from a recording after a latency per query, on the executor threads of the
+    pooled mode (`config`: the [epim_db] pool settings) like a real one.
+    """
+
+    def __init__(self, recording: dict, latency: Optional[Latency] = None, config: Optional[dict] = None):
+        super().__init__("mssql", "standin", "", "", "standin")
+        self.configure_pool(config)
+        self.connect()
+        self.rows = recording.get("db", {})
+        self.latency = latency or Latency()
+        self.misses = 0
+
+    def connect(self):
+        # the workers a pooled connect() would size
+        self._max_workers = self.pool_size + self.max_overflow if self.pooled else 1
+        return True
+
+    async def aexecute_query(self, query, params=None):
+        _count(db_queries=1)
+        return await super().aexecute_query(query, params)
+
+    def _execute_pooled(self, query, params=None):
+        return self.execute_query(query, params)
+
+    def execute_query(self, query, params=None):
+        time.sleep(self.latency.seconds())
+        rows = self.rows.get(_db_key(query, params))
+        if rows is None:
+            self.misses += 1
+            return []
+        return [dict(row) for row in rows]
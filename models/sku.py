@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from typing import List, Optional, Dict, Union,Any
 
 class Certification(BaseModel):
@@ -91,6 +91,8 @@ class ShopSku(BaseModel):
     deleted: bool = False
     technicalParameters: dict = {}
     relations: List[RelationShop]
+    # epimId of the reference SKU the shop SKU was built from (not serialized): a source of its response cache entry
+    _reference_id: Optional[str] = PrivateAttr(default=None)
 
 
 class Sku(BaseModel):
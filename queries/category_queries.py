@@ -1,4 +1,5 @@
 from typing import Optional, List, Dict, Union
+from queries.hierarchy_queries import brand_filter
 
 def query_category_by_id(identifier: str) -> dict:
     """
@@ -60,7 +61,7 @@ def query_attributes(identifiers: List[int]) -> dict:
             }
         }
     }
-def query_categories(offset: int = 0, limit: int = 10, brand: str = 10) -> dict:
+def query_categories(offset: int = 0, limit: int = 10, brand: str = 10, brand_terms: Optional[List[str]] = None) -> dict:
     """
     Query to get a paginated list of categories
     """
@@ -91,19 +92,7 @@ def query_categories(offset: int = 0, limit: int = 10, brand: str = 10) -> dict:
                             "minimum_should_match": 1
                         }
                     },
-                    {
-                        "nested": {
-                            "path": "hierarchies",
-                            "query": {
-                                "script": {
-                                    "script": {
-                                        "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
-                                        "lang": "painless"
-                                    }
-                                }
-                            }
-                        }
-                    }
+                    brand_filter(brand, brand_terms)
                 ]
             }
         },
@@ -113,7 +102,7 @@ def query_categories(offset: int = 0, limit: int = 10, brand: str = 10) -> dict:
             }
         ]
     }
-def query_categories_by_parentId(offset: int = 0, limit: int = 10, brand: str = 10,parentId: str="") -> dict:
+def query_categories_by_parentId(offset: int = 0, limit: int = 10, brand: str = 10,parentId: str="", brand_terms: Optional[List[str]] = None) -> dict:
     """
     Query to get a paginated list of categories
     """
@@ -151,19 +140,7 @@ def query_categories_by_parentId(offset: int = 0, limit: int = 10, brand: str =
 
                         }
                     },
-                    {
-                        "nested": {
-                            "path": "hierarchies",
-                            "query": {
-                                "script": {
-                                    "script": {
-                                        "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
-                                        "lang": "painless"
-                                    }
-                                }
-                            }
-                        }
-                    }
+                    brand_filter(brand, brand_terms)
                 ]
             }
         },
@@ -0,0 +1,94 @@
+from typing import List, Optional
+
+from queries.hierarchy_queries import brand_filter
+
+# assignment fields of a product document listing the objects (epimId) its texts and images belong to:
+# an element's parentElement is one of those objects
+ELEMENT_ASSIGNMENTS = ("textAssignments", "imageAssignments")
+
+
+def query_delta_high_water() -> dict:
+    """Newest timestamp of the queried indices: the upper bound of one delta feed run."""
+    return {
+        "size": 0,
+        "aggs": {"latest": {"max": {"field": "timestamp"}}}
+    }
+
+
+def query_changed_ids(field: str, since: int, until: int, size: int = 1000, after_key: Optional[dict] = None) -> dict:
+    """
+    Distinct `field` values of the documents (re)indexed in (since, until] (epoch ms), one composite
+    aggregation page.
+    """
+    composite = {
+        "size": size,
+        "sources": [{"id": {"terms": {"field": field}}}]
+    }
+    if after_key:
+        composite["after"] = after_key
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [{"range": {"timestamp": {"gt": since, "lte": until}}}]}},
+        "aggs": {"changed": {"composite": composite}}
+    }
+
+
+def query_element_owners(objects: List, size: int = 1000, search_after: Optional[list] = None) -> dict:
+    """
+    SKUs and reference SKUs of any brand with one of objects (elements' parentElement) among their text or
+    image assignments, one page sorted on epimId.
+    """
+    objects = [str(i) for i in objects]
+    query = {
+        "size": size,
+        "query": {
+            "bool": {
+                "should": [
+                    {"nested": {"path": field, "query": {"terms": {f"{field}.objects.epimId": objects}}}}
+                    for field in ELEMENT_ASSIGNMENTS
+                ],
+                "minimum_should_match": 1
+            }
+        },
+        "sort": [{"epimId": "asc"}],
+        "_source": ["epimId"]
+    }
+    if search_after:
+        query["search_after"] = search_after
+    return query
+
+
+def query_affected_shop_skus(identifiers: List, brand: str, brand_terms: Optional[List[str]] = None,
+                             size: int = 1000, search_after: Optional[list] = None) -> dict:
+    """
+    Shop SKUs (brand, ECOM NG hierarchy, as listed by get_shop_sku_ids) that are one of identifiers or
+    whose reference SKU is, one page sorted on epimId (a reference SKU can have any number of variants).
+    """
+    identifiers = [str(i) for i in identifiers]
+    query = {
+        "size": size,
+        "query": {
+            "bool": {
+                "filter": [
+                    brand_filter(brand, brand_terms),
+                    {
+                        "nested": {
+                            "path": "hierarchies",
+                            "query": {"bool": {"filter": [{"term": {"hierarchies.hierarchy": "ECOM NG"}}]}}
+                        }
+                    },
+                    {
+                        "bool": {
+                            "should": [{"terms": {"epimId": identifiers}}, {"terms": {"referenceId": identifiers}}],
+                            "minimum_should_match": 1
+                        }
+                    }
+                ]
+            }
+        },
+        "sort": [{"epimId": "asc"}],
+        "_source": ["epimId"]
+    }
+    if search_after:
+        query["search_after"] = search_after
+    return query
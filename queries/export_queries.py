@@ -0,0 +1,48 @@
+from typing import List, Optional
+
+from queries.category_queries import query_categories
+from queries.hierarchy_queries import brand_filter
+
+# sort of every export: epimId is unique per index, so the last exported epimId is a resumable position
+EXPORT_SORT = [{"epimId": "asc"}]
+
+
+def query_export_products(brand: str, brand_terms: Optional[List[str]] = None) -> dict:
+    """Products of the brand (hierarchies with planningLevel Product), as listed by get_products."""
+    return {
+        "query": {"bool": {"filter": [{"term": {"planningLevel": "Product"}}, brand_filter(brand, brand_terms)]}},
+        "_source": ["epimId"]
+    }
+
+
+def query_export_skus(brand: str, brand_terms: Optional[List[str]] = None) -> dict:
+    """SKUs of the brand in the ECOM NG hierarchy, as listed by get_skus."""
+    return {
+        "query": {
+            "bool": {
+                "filter": [
+                    brand_filter(brand, brand_terms),
+                    {
+                        "nested": {
+                            "path": "hierarchies",
+                            "query": {"bool": {"filter": [{"term": {"hierarchies.hierarchy": "ECOM NG"}}]}}
+                        }
+                    }
+                ]
+            }
+        },
+        "_source": ["epimId"]
+    }
+
+
+def query_export_categories(brand: str, brand_terms: Optional[List[str]] = None) -> dict:
+    """Categories of the brand, as listed by get_categories."""
+    return {"query": query_categories(brand=brand, brand_terms=brand_terms)["query"], "_source": ["epimId"]}
+
+
+def query_export_operating_modes() -> dict:
+    """Operating modes, as listed by get_operating_modes."""
+    return {
+        "query": {"bool": {"must": [{"term": {"planningLevel": "Product"}}]}},
+        "_source": ["epimId"]
+    }
@@ -0,0 +1,49 @@
+from typing import List, Optional
+
+# Upper bound for the distinct hierarchies.hierarchy values fetched in one terms aggregation
+HIERARCHY_VALUES_SIZE = 10000
+
+
+def query_hierarchy_values() -> dict:
+    """
+    Every distinct hierarchies.hierarchy value of an index (nested terms aggregation).
+    """
+    return {
+        "size": 0,
+        "aggs": {
+            "hierarchies": {
+                "nested": {"path": "hierarchies"},
+                "aggs": {
+                    "values": {
+                        "terms": {"field": "hierarchies.hierarchy", "size": HIERARCHY_VALUES_SIZE}
+                    }
+                }
+            }
+        }
+    }
+
+
+def brand_filter(brand: str, brand_terms: Optional[List[str]] = None) -> dict:
+    """
+    Nested filter for documents with a hierarchy starting with `brand` (case-insensitive).
+
+    With brand_terms (the concrete hierarchy values resolved by services.brand_filters) this is an
+    indexed `terms` filter; without it, the painless prefix script the queries used before.
+    """
+    if brand_terms is not None:
+        query = {"terms": {"hierarchies.hierarchy": brand_terms}}
+    else:
+        query = {
+            "script": {
+                "script": {
+                    "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
+                    "lang": "painless"
+                }
+            }
+        }
+    return {
+        "nested": {
+            "path": "hierarchies",
+            "query": query
+        }
+    }
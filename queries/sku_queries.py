@@ -1,26 +1,13 @@
 from typing import Optional, List, Dict, Union
+from queries.hierarchy_queries import brand_filter
 # This module should define raw Elasticsearch queries
 
-def query_sku_by_id(identifier: str, brand: str) -> dict:
+def query_sku_by_id(identifier: str, brand: str, brand_terms: Optional[List[str]] = None) -> dict:
     filters = [
         {"term": {"epimId": identifier}}
     ]
     if brand is not None:
-        filters.append(
-            {
-                "nested": {
-                    "path": "hierarchies",
-                    "query": {
-                        "script": {
-                            "script": {
-                                "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
-                                "lang": "painless"
-                            }
-                        }
-                    }
-                }
-            }
-        )
+        filters.append(brand_filter(brand, brand_terms))
     return {
         "query": {
             "bool": {
@@ -30,26 +17,19 @@ def query_sku_by_id(identifier: str, brand: str) -> dict:
     }
 
 
-def query_sku_by_refrence_id(identifier: str, brand: str) -> dict:
+def query_skus_by_ids(identifiers: List[str], brand: Optional[str], brand_terms: Optional[List[str]] = None) -> dict:
+    query = query_sku_by_id(identifiers[0], brand, brand_terms)
+    query["query"]["bool"]["filter"][0] = {"terms": {"epimId": identifiers}}
+    query["size"] = 10000
+    return query
+
+
+def query_sku_by_refrence_id(identifier: str, brand: str, brand_terms: Optional[List[str]] = None) -> dict:
     filters = [
         {"term": {"referenceId": identifier}}
     ]
     if brand is not None:
-        filters.append(
-            {
-                "nested": {
-                    "path": "hierarchies",
-                    "query": {
-                        "script": {
-                            "script": {
-                                "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
-                                "lang": "painless"
-                            }
-                        }
-                    }
-                }
-            }
-        )
+        filters.append(brand_filter(brand, brand_terms))
     return {
         "query": {
             "bool": {
@@ -368,6 +348,20 @@ def query_image_byId(id: str) -> dict:
         }
       }
     }
+def query_images_byIds(ids: List[str]) -> dict:
+    return {"size": 10000,
+      "query": {
+        "bool": {
+          "filter": [
+            {
+              "terms": {
+                "parentElement": ids
+              }
+            }
+          ]
+        }
+      }
+    }
 def query_editorial_assets(sku_id: str) -> dict:
     return {
         "query": {
@@ -392,6 +386,40 @@ def query_price() -> str:
         "WHERE PRODUCT_NUMBER = :productnr "
         "ORDER BY id DESC"
     )
+def query_prices(param_names: List[str]) -> str:
+    """
+    Returns the SQL template for fetching the latest price of several products at once.
+    Uses one named parameter per product number (:p0, :p1, ...).
+    """
+    placeholders = ", ".join(f":{name}" for name in param_names)
+    return (
+        "SELECT * FROM ("
+        "SELECT *, ROW_NUMBER() OVER (PARTITION BY PRODUCT_NUMBER ORDER BY id DESC) AS rn "
+        "FROM vmps_ERP_prices "
+        f"WHERE PRODUCT_NUMBER IN ({placeholders})"
+        ") latest WHERE rn = 1"
+    )
+def query_latest_prices() -> str:
+    """
+    Returns the SQL for the latest price row of every product (bulk load of the price snapshot).
+    """
+    return (
+        "SELECT * FROM ("
+        "SELECT *, ROW_NUMBER() OVER (PARTITION BY PRODUCT_NUMBER ORDER BY id DESC) AS rn "
+        "FROM vmps_ERP_prices"
+        ") latest WHERE rn = 1"
+    )
+def query_prices_since() -> str:
+    """
+    Returns the SQL template for price rows added after the last seen id, oldest first.
+    Uses a named parameter :last_id.
+    """
+    return (
+        "SELECT * "
+        "FROM vmps_ERP_prices "
+        "WHERE id > :last_id "
+        "ORDER BY id ASC"
+    )
 def query_uom() -> str:
     """
     Returns the SQL template for fetching the mapping_units_of_measurements .
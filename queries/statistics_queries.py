@@ -0,0 +1,78 @@
+from typing import List, Optional
+
+
+def query_brand_reference_ids(brand_filter: dict, size: int = 10000, after_key: Optional[dict] = None) -> dict:
+    """
+    Distinct referenceId values of the products matching brand_filter, one composite aggregation page.
+    """
+    composite = {
+        "size": size,
+        "sources": [{"referenceId": {"terms": {"field": "referenceId"}}}]
+    }
+    if after_key:
+        composite["after"] = after_key
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [brand_filter]}},
+        "aggs": {"reference_ids": {"composite": composite}}
+    }
+
+
+def query_brand_products(brand_filter: dict) -> dict:
+    return {
+        "query": {"bool": {"filter": [brand_filter]}},
+        "_source": ["epimId", "referenceId"]
+    }
+
+
+def query_market_attributes(parent_ids: List, brand: str) -> dict:
+    """
+    market-<nr> / market-<nr>-expired attributes of parent_ids in the brand's market collection.
+    """
+    return {
+        "query": {
+            "bool": {
+                "filter": [
+                    {"terms": {"parentId": parent_ids}},
+                    {"regexp": {"name": "market-[0-9]+(-expired)?"}},
+                    {
+                        "nested": {
+                            "path": "collections",
+                            "query": {
+                                "term": {
+                                    "collections.collection": f"market-{brand}-COL"
+                                }
+                            }
+                        }
+                    }
+                ]
+            }
+        },
+        "_source": ["parentId", "name", "values"]
+    }
+
+
+def query_index_version() -> dict:
+    """
+    Document count and newest timestamp of an index; changes whenever documents are (re)indexed.
+    """
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "aggs": {"latest": {"max": {"field": "timestamp"}}}
+    }
+
+
+def query_docs_version(ids: List) -> dict:
+    """
+    Count and newest timestamp of the documents of the given epimIds and of the attributes
+    whose parentId is one of them; changes whenever one of those documents is (re)indexed.
+    """
+    ids = [str(i) for i in ids]
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"bool": {"should": [{"terms": {"epimId": ids}}, {"terms": {"parentId": ids}}],
+                           "minimum_should_match": 1}},
+        "aggs": {"latest": {"max": {"field": "timestamp"}}}
+    }
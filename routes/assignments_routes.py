@@ -5,6 +5,8 @@ from models.sku import Sku, Relation, Document, Certification, RelationListRespo
 from utils.mapping import map_brand, map_locale, map_market
 from services.sku_builder import SkuBuilder
 from services.assignments_builder import AssignmentsBuilder
+from services.brand_filters import brand_terms
+from queries.hierarchy_queries import brand_filter
 import asyncio
 
 assignments_bp = Blueprint('assignments_routes', __name__)
@@ -18,19 +20,7 @@ async def get_sku_ids(es, mapped_locale, mapped_brand, market):
         "query": {
             "bool": {
               "filter": [
-                {
-                  "nested": {
-                    "path": "hierarchies",
-                    "query": {
-                      "script": {
-                        "script": {
-                          "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{mapped_brand}')",
-                          "lang": "painless"
-                        }
-                      }
-                    }
-                  }
-                }
+                brand_filter(mapped_brand, await brand_terms.resolve(es, index, mapped_brand))
               ]
             }
           },
@@ -43,7 +33,7 @@ async def get_sku_ids(es, mapped_locale, mapped_brand, market):
         ]
         # Corrected here
     }
-    hits = list(es.getScrollObject(index, body, 10000, "1m"))
+    hits = await es.agetScrollObject(index, body, 10000, "1m")
     sku_ids = [hit["_source"].get("epimId") for hit in hits if hit.get("_source", {}).get("epimId")]
     return sku_ids
 
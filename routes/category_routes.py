@@ -1,10 +1,12 @@
 from quart import Blueprint, request, Response, jsonify
-from quart_schema import validate_response, validate_querystring
+from quart_schema import validate_response, validate_querystring, document_response
 from pydantic import BaseModel, Field
 from services.category_service import get_categories, get_category_by_id
+from services.response_cache import entity_responses
+from utils.http_cache import http_caching
 from models.category import Category, CategoryListResponse
 from utils.auth import require_auth
-from utils.pagination import extract_pagination
+from utils.pagination import InvalidCursor, extract_pagination
 from utils.mapping import map_brand, map_locale
 import json
 from typing import Optional, List, Dict, Any
@@ -15,12 +17,13 @@ class CategoryQueryParams(BaseModel):
     offset: int = Field(0, ge=0, description="The number of items to skip before starting to collect the result set")
     limit: int = Field(10, ge=1, le=100, description="The numbers of items to return")
     parent_id: Optional[str] = Field(None, description="Filter categories by parent ID")
+    cursor: Optional[str] = Field(None, description="Cursor pagination: empty for the first page, then meta.next of the previous page")
 
     class Config:
         extra = "forbid"  # This will raise an error if extra fields are provided
 
 @category_bp.route("/rest/<brand>/<locale>/category/<identifier>", methods=["GET"])
-@validate_response(Category, 200)
+@document_response(Category, 200)
 async def get_category(locale: str, identifier: str, brand: str):
     """
     Get a single category by ID
@@ -62,6 +65,8 @@ async def get_category(locale: str, identifier: str, brand: str):
           application/json:
             schema:
               $ref: '#/components/schemas/Category'
+      304:
+        description: Unchanged since the ETag sent in If-None-Match
       400:
         description: Invalid brand or locale parameter
         content:
@@ -89,9 +94,13 @@ async def get_category(locale: str, identifier: str, brand: str):
     except ValueError as e:
         return {"error": str(e)}, 400  # Bad Request if invalid
         
-    category = await get_category_by_id(identifier, mapped_locale, mapped_brand)
-    if category:
-        return category
+    from quart import current_app
+    cached = await entity_responses.respond(
+        current_app.es, entity_responses.key("category", identifier, mapped_locale, mapped_brand, None),
+        lambda: get_category_by_id(identifier, mapped_locale, mapped_brand), lambda category: [category.id],
+        sort_keys=True)
+    if cached:
+        return http_caching.response(cached.payload, cached.etag, cached.last_modified)
     return {"error": "Category not found"}, 404
 
 @category_bp.route("/rest/<brand>/<locale>/categories", methods=["GET"])
@@ -149,6 +158,14 @@ async def get_categories_endpoint(locale: str, brand: str, query_args: CategoryQ
           type: string
           example: "12345"
         description: Filter categories by parent ID. Omit to get root categories.
+      - name: cursor
+        in: query
+        required: false
+        schema:
+          type: string
+        description: >-
+          Cursor pagination instead of offset. Pass an empty cursor for the first page, then the `meta.next`
+          of the previous page; `meta.next` is absent on the last page. Deep pages cost the same as the first.
     responses:
       200:
         description: A paginated list of categories
@@ -177,15 +194,21 @@ async def get_categories_endpoint(locale: str, brand: str, query_args: CategoryQ
     offset = query_args.offset
     limit = query_args.limit
     parent_id = query_args.parent_id
-    
+    if query_args.cursor is not None and query_args.offset:
+        return {"error": "offset cannot be combined with cursor"}, 400
+
     # Get categories with pagination and optional parent filter
-    categories = await get_categories(
-        offset=offset, 
-        limit=limit, 
-        brand=brand,
-        lang=mapped_locale,
-        parent_id=parent_id
-    )
+    try:
+        categories = await get_categories(
+            offset=offset,
+            limit=limit,
+            brand=brand,
+            lang=mapped_locale,
+            parent_id=parent_id,
+            cursor=query_args.cursor
+        )
+    except InvalidCursor as e:
+        return {"error": str(e)}, 400
     return categories
 
 
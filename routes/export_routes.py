@@ -0,0 +1,69 @@
+from quart import Blueprint, Response, current_app, request
+
+from services.export_service import EXPORT_INDICES, CatalogueExport
+from utils.mapping import map_brand, map_locale, map_market
+
+export_bp = Blueprint("export_routes", __name__)
+
+
+@export_bp.route("/rest/<brand>/<locale>/export/<kind>.ndjson", methods=["GET"])
+async def export_catalogue(brand: str, locale: str, kind: str):
+    """
+    Catalogue export
+
+    Every product, SKU, category or operating mode of the brand/locale as newline-delimited JSON
+    (one document per line, in epimId order), streamed as it is built and gzip-compressed on the fly
+    when the client accepts it. To resume an interrupted export, pass the id of the last complete
+    line as `after`.
+
+    ---
+    tags:
+      - Export
+    parameters:
+      - name: kind
+        in: path
+        required: true
+        schema:
+          type: string
+          enum: [products, skus, categories, operating-modes]
+      - name: after
+        in: query
+        required: false
+        schema:
+          type: string
+        description: Resume after this epimId
+    responses:
+      200:
+        description: One JSON document per line
+        content:
+          application/x-ndjson: {}
+      400:
+        description: Invalid brand or locale
+      404:
+        description: Unknown export
+    """
+    if kind not in EXPORT_INDICES:
+        return {"error": f"Unknown export: {kind}"}, 404
+    try:
+        mapped_brand = map_brand(brand)
+        mapped_locale = map_locale(locale)
+        market = map_market(brand, mapped_locale)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    export = CatalogueExport(
+        current_app.es, current_app.db, kind, mapped_locale,
+        # operating modes are built with the mapped brand, like on /operating-mode/<id>
+        mapped_brand if kind == "operating-modes" else brand, market,
+        after=request.args.get("after"),
+    )
+    headers = {"Cache-Control": "no-store", "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("Accept-Encoding", "").lower():
+        body = export.ndjson_gzip()
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = export.ndjson()
+    response = Response(body, mimetype="application/x-ndjson", headers=headers)
+    # a full export can take longer than the default response timeout
+    response.timeout = None
+    return response
@@ -1,8 +1,11 @@
 from quart import Blueprint, request, Response, jsonify
-from quart_schema import validate_response, validate_querystring
+from quart_schema import validate_response, validate_querystring, document_response
 from pydantic import BaseModel, Field
 from models.operating_mode import OperatingMode, OperatingModeListResponse
 from services.operating_mode_service import get_operating_mode_by_id, get_operating_modes, stream_operating_modes
+from services.response_cache import entity_responses
+from utils.http_cache import http_caching
+from utils.fieldsets import parse_fields
 from utils.auth import require_auth
 from utils.mapping import map_brand, map_locale, map_market
 from utils.pagination import extract_pagination
@@ -17,7 +20,7 @@ operating_mode_bp = Blueprint("operating_mode_routes", __name__)
 
 @operating_mode_bp.route("/rest/<brand>/<locale>/operating-mode/<identifier>", methods=["GET"])
 #@require_auth
-@validate_response(OperatingMode, 200)
+@document_response(OperatingMode, 200)
 async def get_operating_mode_endpoint(locale: str, identifier: str, brand: str):
     """
     Get a single operating mode by ID
@@ -52,6 +55,13 @@ async def get_operating_mode_endpoint(locale: str, identifier: str, brand: str):
           type: string
           example: "12345"
         description: The unique identifier of the operating mode
+      - name: fields
+        in: query
+        required: false
+        schema:
+          type: string
+          example: "name,price,active"
+        description: Comma separated fields to return (plus id); the others are not computed
     responses:
       200:
         description: The operating mode data
@@ -59,8 +69,10 @@ async def get_operating_mode_endpoint(locale: str, identifier: str, brand: str):
           application/json:
             schema:
               $ref: '#/components/schemas/OperatingMode'
+      304:
+        description: Unchanged since the ETag sent in If-None-Match
       400:
-        description: Invalid brand or locale parameter
+        description: Invalid brand, locale or fields parameter
         content:
           application/json:
             schema:
@@ -84,12 +96,17 @@ async def get_operating_mode_endpoint(locale: str, identifier: str, brand: str):
         mapped_brand = map_brand(brand)
         mapped_locale = map_locale(locale)
         market = map_market(brand, mapped_locale)
+        fields = parse_fields(request.args.get("fields"), OperatingMode)
     except ValueError as e:
         return {"error": str(e)}, 400  # Bad Request if invalid
         
-    operating_mode = await get_operating_mode_by_id(identifier, mapped_locale, mapped_brand, market)
-    if operating_mode:
-        return operating_mode
+    from quart import current_app
+    cached = await entity_responses.respond(
+        current_app.es, entity_responses.key("operating_mode", identifier, mapped_locale, mapped_brand, market, fields),
+        lambda: get_operating_mode_by_id(identifier, mapped_locale, mapped_brand, market, fields),
+        lambda operating_mode: [operating_mode.id], sort_keys=True)
+    if cached:
+        return http_caching.response(cached.payload, cached.etag, cached.last_modified)
     return {"error": "Operating mode not found"}, 404
 
 class OperatingModeQueryParams(BaseModel):
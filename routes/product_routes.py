@@ -1,12 +1,15 @@
 from quart import Blueprint, request, Response, jsonify
-from quart_schema import validate_response, validate_querystring
+from quart_schema import validate_response, validate_querystring, document_response
 from pydantic import BaseModel, Field, HttpUrl
 from typing import Optional, List
 from services.product_service import get_products, get_product_by_id, get_product_documents
+from services.response_cache import entity_responses
+from utils.http_cache import http_caching
+from utils.fieldsets import parse_fields
 from models.product import Product, ProductListResponse, ProductDocumentsResponse
 from models.sku import  SkuListResponse
 from utils.auth import require_auth
-from utils.pagination import extract_pagination
+from utils.pagination import InvalidCursor, extract_pagination
 from utils.mapping import map_brand, map_locale, map_market
 from core.environment import env
 import json
@@ -14,7 +17,7 @@ product_bp = Blueprint('product_routes', __name__)
 
 
 @product_bp.route("/rest/<brand>/<locale>/product/<identifier>", methods=["GET"])
-@validate_response(Product, 200)
+@document_response(Product, 200)
 async def get_product(locale: str, identifier: str, brand: str):
     """
     Get a single product by ID
@@ -42,6 +45,13 @@ async def get_product(locale: str, identifier: str, brand: str):
         schema:
           type: string
         description: The product ID or SKU
+      - name: fields
+        in: query
+        required: false
+        schema:
+          type: string
+          example: "name,price,active"
+        description: Comma separated fields to return (plus id); the others are not computed
     responses:
       200:
         description: The product data
@@ -49,25 +59,33 @@ async def get_product(locale: str, identifier: str, brand: str):
           application/json:
             schema:
               $ref: '#/components/schemas/Product'
+      304:
+        description: Unchanged since the ETag sent in If-None-Match
       400:
-        description: Invalid brand or locale
+        description: Invalid brand, locale or fields
       404:
         description: Product not found
     """
     try:
         mapped_brand = map_brand(brand)
         mapped_locale = map_locale(locale)
+        fields = parse_fields(request.args.get("fields"), Product)
     except ValueError as e:
         return {"error": str(e)}, 400  # Bad Request if invalid
-    product = await get_product_by_id(identifier, mapped_locale, brand)
-    if product:
-        return product
+    from quart import current_app
+    cached = await entity_responses.respond(
+        current_app.es, entity_responses.key("product", identifier, mapped_locale, brand, None, fields),
+        lambda: get_product_by_id(identifier, mapped_locale, brand, fields), lambda product: [product.id],
+        sort_keys=True)
+    if cached:
+        return http_caching.response(cached.payload, cached.etag, cached.last_modified)
     return {"error": "Product not found"}, 404
 
 class ProductQueryParams(BaseModel):
     offset: int = Field(0, ge=0, description="The number of items to skip before starting to collect the result set")
     limit: int = Field(10, ge=1, le=100, description="The numbers of items to return")
     category_id: Optional[str] = Field(None, description="Filter products by category ID")
+    cursor: Optional[str] = Field(None, description="Cursor pagination: empty for the first page, then meta.next of the previous page")
 
     class Config:
         extra = "forbid"  # This will raise an error if extra fields are provided
@@ -127,6 +145,14 @@ async def get_products_endpoint(locale: str, brand: str, query_args: ProductQuer
           type: string
           example: "12345"
         description: Filter products by category ID
+      - name: cursor
+        in: query
+        required: false
+        schema:
+          type: string
+        description: >-
+          Cursor pagination instead of offset. Pass an empty cursor for the first page, then the `meta.next`
+          of the previous page; `meta.next` is absent on the last page. Deep pages cost the same as the first.
     responses:
       200:
         description: A paginated list of products
@@ -150,12 +176,18 @@ async def get_products_endpoint(locale: str, brand: str, query_args: ProductQuer
         mapped_locale = map_locale(locale)
     except ValueError as e:
         return {"error": str(e)}, 400  # Bad Request if invalid
-    products = await get_products(
-        offset=query_args.offset, 
-        limit=query_args.limit, 
-        brand=brand,
-        lang=mapped_locale
-    )
+    if query_args.cursor is not None and query_args.offset:
+        return {"error": "offset cannot be combined with cursor"}, 400
+    try:
+        products = await get_products(
+            offset=query_args.offset,
+            limit=query_args.limit,
+            brand=brand,
+            lang=mapped_locale,
+            cursor=query_args.cursor
+        )
+    except InvalidCursor as e:
+        return {"error": str(e)}, 400
     return products
 
 
@@ -291,47 +323,10 @@ async def get_product_skus(locale: str, identifier: str, brand: str):
         return {"error": "No SKUs found for this product"}, 404
 
     from services.sku_builder import SkuBuilder
-    import asyncio
     builder = SkuBuilder(es, db)
-    '''
-    # Build all SKUs asynchronously
-    skus = await asyncio.gather(*[builder.build_sku(sku_id, mapped_locale, brand, market) for sku_id in sku_ids])
+    # one bulk query per data kind for the whole product instead of N build_sku fan-outs
+    skus = await builder.build_many(sku_ids, mapped_locale, brand, market)
     skus = [sku for sku in skus if sku]
-    '''
-    concurrency = 256  # tune 64–256
-    queue= asyncio.Queue()
-
-    for sid in sku_ids:
-        queue.put_nowait(sid)
-
-    results= []
-    results_lock = asyncio.Lock()  # protect list during concurrent appends
-
-    async def build_one(sku_id: str):
-        try:
-            return await builder.build_sku(sku_id, mapped_locale, brand, market)
-        except Exception:
-            current_app.logger.exception("SKU build failed for %s", sku_id)
-            return None
-
-    async def worker():
-        while True:
-            try:
-                sid = queue.get_nowait()
-            except asyncio.QueueEmpty:
-                break
-            try:
-                sku = await build_one(sid)
-                if sku:
-                    async with results_lock:
-                        results.append(sku)
-            finally:
-                queue.task_done()
-
-    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
-    await asyncio.gather(*workers)
-
-    skus = results
     return SkuListResponse(meta={"total": len(skus)}, items=skus)
 
 # Removed: SKU documents endpoint, now in sku_routes.py
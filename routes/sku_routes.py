@@ -4,9 +4,11 @@ from pydantic import BaseModel, Field
 from models.sku import Sku, SkuListResponse, Relation,Document
 from services.sku_service import get_sku_by_id, get_skus, get_shop_sku_ids
 from utils.auth import require_auth
-from utils.pagination import extract_pagination
+from utils.pagination import InvalidCursor, extract_pagination
 from utils.mapping import map_brand, map_locale, map_market
-from utils.utilities import json_response
+from services.response_cache import entity_responses
+from utils.http_cache import http_caching
+from utils.fieldsets import parse_fields
 from core.environment import env
 from typing import Optional
 import json
@@ -18,6 +20,7 @@ class SkuVendorIdQuery(BaseModel):
         False,
         description="If true, treats the identifier as a vendor ID (product number) instead of internal SKU ID"
     )
+    fields: Optional[str] = Field(None, description="Comma separated SKU fields to return (plus id)")
     
     class Config:
         extra = "forbid"  # This will raise an error if extra fields are provided
@@ -66,6 +69,13 @@ async def get_sku_endpoint(locale: str, identifier: str, brand: str, query_args:
           type: boolean
           default: false
         description: If true, treats the identifier as a vendor ID (product number) instead of internal SKU ID
+      - name: fields
+        in: query
+        required: false
+        schema:
+          type: string
+          example: "name,price,active"
+        description: Comma separated fields to return (plus id); the others are not computed
     responses:
       200:
         description: The SKU data
@@ -73,8 +83,10 @@ async def get_sku_endpoint(locale: str, identifier: str, brand: str, query_args:
           application/json:
             schema:
               $ref: '#/components/schemas/Sku'
+      304:
+        description: Unchanged since the ETag sent in If-None-Match
       400:
-        description: Invalid brand, locale, or market parameters
+        description: Invalid brand, locale, market or fields parameters
       404:
         description: SKU not found
     """
@@ -82,6 +94,7 @@ async def get_sku_endpoint(locale: str, identifier: str, brand: str, query_args:
         mapped_brand = map_brand(brand)
         mapped_locale = map_locale(locale)
         market = map_market(brand, mapped_locale)
+        fields = parse_fields(query_args.fields, Sku)
     except ValueError as e:
         return {"error": str(e)}, 400  # Bad Request if invalid
     
@@ -91,9 +104,15 @@ async def get_sku_endpoint(locale: str, identifier: str, brand: str, query_args:
     # Import here to avoid circular imports
     from services.sku_service import get_sku
     
-    sku = await get_sku(identifier, mapped_locale, brand, market, use_vendor_id=use_vendor_id)
-    if sku:
-        return json_response(sku)
+    from quart import current_app
+    key = entity_responses.key("sku", f"vendor:{identifier}" if use_vendor_id else identifier, mapped_locale, brand, market,
+                               fields)
+    cached = await entity_responses.respond(
+        current_app.es, key,
+        lambda: get_sku(identifier, mapped_locale, brand, market, use_vendor_id=use_vendor_id, fields=fields),
+        lambda sku: [sku.id, sku.maintenanceId])
+    if cached:
+        return http_caching.response(cached.payload, cached.etag, cached.last_modified)
     return {"error": "SKU not found"}, 404
 
 class SkuQueryParams(BaseModel):
@@ -101,6 +120,7 @@ class SkuQueryParams(BaseModel):
     limit: int = Field(10, ge=1, le=100, description="The numbers of items to return")
     product_id: Optional[str] = Field(None, description="Filter SKUs by product ID")
     operating_mode: Optional[str] = Field(None, description="Filter SKUs by operating mode ID")
+    cursor: Optional[str] = Field(None, description="Cursor pagination: empty for the first page, then meta.next of the previous page")
 
     class Config:
         extra = "forbid"  # This will raise an error if extra fields are provided
@@ -165,6 +185,14 @@ async def get_skus_endpoint(locale: str, brand: str, query_args: SkuQueryParams)
         schema:
           type: string
         description: Filter SKUs by operating mode ID
+      - name: cursor
+        in: query
+        required: false
+        schema:
+          type: string
+        description: >-
+          Cursor pagination instead of offset. Pass an empty cursor for the first page, then the `meta.next`
+          of the previous page; `meta.next` is absent on the last page. Deep pages cost the same as the first.
     responses:
       200:
         description: A paginated list of SKUs
@@ -189,15 +217,21 @@ async def get_skus_endpoint(locale: str, brand: str, query_args: SkuQueryParams)
         market = map_market(brand, mapped_locale)
     except ValueError as e:
         return {"error": str(e)}, 400  # Bad Request if invalid
-    response = await get_skus(
-        offset=query_args.offset,
-        limit=query_args.limit,
-        lang=mapped_locale,
-        brand=brand,
-        market=market
-        #product_id=query_args.product_id
-        #operating_mode=query_args.operating_mode
-    )
+    if query_args.cursor is not None and query_args.offset:
+        return {"error": "offset cannot be combined with cursor"}, 400
+    try:
+        response = await get_skus(
+            offset=query_args.offset,
+            limit=query_args.limit,
+            lang=mapped_locale,
+            brand=brand,
+            market=market,
+            cursor=query_args.cursor
+            #product_id=query_args.product_id
+            #operating_mode=query_args.operating_mode
+        )
+    except InvalidCursor as e:
+        return {"error": str(e)}, 400
     return response
 
 
@@ -415,17 +449,22 @@ async def get_shop_sku_endpoint(locale: str, identifier: str, brand: str):
     es = current_app.es
     db = current_app.db
     builder = SkuBuilder(es, db)
-    sku = await builder.build_shop_sku(identifier, forced_locale, brand, market)
-    if not sku:
+    # Convert the model to a dict *without* using .json() (which can sort)
+    cached = await entity_responses.respond(
+        es, entity_responses.key("shop_sku", identifier, forced_locale, brand, market),
+        lambda: builder.build_shop_sku(identifier, forced_locale, brand, market),
+        # the reference SKU's texts, vendor id, operating mode and price are part of the shop SKU
+        lambda sku: [sku.id, getattr(sku, "_reference_id", None)])
+    if not cached:
         return {"error": "SKU not found"}, 404
-        # Convert the model to a dict *without* using .json() (which can sort)
-    return json_response(sku)
+    return http_caching.response(cached.payload, cached.etag, cached.last_modified)
 
 
 class ShopSkuQueryParams(BaseModel):
     offset: int = Field(0, ge=0, description="The number of items to skip before starting to collect the result set")
     limit: int = Field(10, ge=1, le=100, description="The numbers of items to return")
     timestamp: Optional[str] = Field(None, description="Only SKUs with a timestamp >= this ISO8601 value (e.g. 2025-05-29T12:00:34.668147384Z)")
+    cursor: Optional[str] = Field(None, description="Cursor pagination: empty for the first page, then meta.next of the previous page")
 
     class Config:
         extra = "forbid"  # This will raise an error if extra fields are provided
@@ -450,6 +489,14 @@ async def get_shop_sku_ids_endpoint(locale: str, brand: str, query_args: ShopSku
         schema:
           type: string
         description: The locale code for language and region
+      - name: cursor
+        in: query
+        required: false
+        schema:
+          type: string
+        description: >-
+          Cursor pagination instead of offset. Pass an empty cursor for the first page, then the `meta.next`
+          of the previous page; `meta.next` is absent on the last page. Deep pages cost the same as the first.
     responses:
       200:
         description: List of shop SKU IDs
@@ -474,8 +521,76 @@ async def get_shop_sku_ids_endpoint(locale: str, brand: str, query_args: ShopSku
     size = query_args.limit
     offset = query_args.offset
     timestamp = query_args.timestamp
-    ids, total = await get_shop_sku_ids(forced_locale, brand, market, size=size, offset=offset, timestamp=timestamp)
+    if query_args.cursor is not None and query_args.offset:
+        return {"error": "offset cannot be combined with cursor"}, 400
+    try:
+        ids, total, next_cursor = await get_shop_sku_ids(forced_locale, brand, market, size=size, offset=offset,
+                                                         timestamp=timestamp, cursor=query_args.cursor)
+    except InvalidCursor as e:
+        return {"error": str(e)}, 400
+    meta = {"items": total}
+    if next_cursor is not None:
+        meta["next"] = next_cursor
     return {
-        "meta": {"items": total},
+        "meta": meta,
         "items": ids
     }
+
+
+@sku_bp.route("/rest/<brand>/<locale>/shopSKUs/changes", methods=["GET"])
+async def get_shop_sku_changes_endpoint(locale: str, brand: str):
+    """
+    Shop SKU delta feed
+
+    Shop SKUs changed since `since` (changes of the products, attributes and elements indices) with
+    their full shop payloads, as newline-delimited JSON: one `{"id", "sku"}` line per SKU, then a last
+    `{"next": token}` line. Pass that token as `since` on the next call; without `since` only the
+    token is returned (take it before a full sync to continue from there).
+    ---
+    tags:
+      - SKUs
+    parameters:
+      - name: brand
+        in: path
+        required: true
+        schema:
+          type: string
+        description: The brand identifier
+      - name: locale
+        in: path
+        required: true
+        schema:
+          type: string
+        description: The locale code for language and region
+      - name: since
+        in: query
+        required: false
+        schema:
+          type: string
+        description: The `next` token of the previous call
+    responses:
+      200:
+        description: One JSON document per line
+        content:
+          application/x-ndjson: {}
+      400:
+        description: Invalid brand, locale or token
+    """
+    from quart import current_app
+    from services.delta_feed import ShopSkuDelta
+    if len(locale) != 7 or not (locale[:3].islower() and locale[3] == '_' and locale[4:].isupper()):
+        return {"error": "Locale must be in format xxx_XXX (3 lowercase letters, underscore, 3 uppercase letters)"}, 400
+    try:
+        map_brand(brand)
+        market = map_market(brand, locale)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    since = request.args.get("since")
+    if since is not None and not since.isdigit():
+        return {"error": "Invalid since token"}, 400
+
+    delta = ShopSkuDelta(current_app.es, current_app.db, locale.lower(), brand, market,
+                         since=int(since) if since is not None else None)
+    response = Response(delta.ndjson(), mimetype="application/x-ndjson", headers={"Cache-Control": "no-store"})
+    response.timeout = None
+    return response
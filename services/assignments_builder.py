@@ -5,6 +5,9 @@ from models.sku import Certification
 from queries.assignments_queries import (query_certifications,query_cert_definitions,query_image_byId)
 from services.elasticsearch_service import ESConnection
 from services.database_service import DBConnection
+from services.es_batcher import batched_searches
+from services.reference_cache import cached_search
+from services.element_previews import element_previews
 
 
 logger = logging.getLogger(__name__)
@@ -16,12 +19,13 @@ class AssignmentsBuilder:
         self.db = db_client
 
 
+    @batched_searches
     async def parse_certifications_async(self, lang: str) -> List[Certification]:
         """
         From a list of ES attribute hits, return only those contain  "-CERT-"
         whose first 'value' == 1, as Certification objects.
         """
-        cert_table = self.es.search(f"systemair_ds_producttables_{lang}", query_cert_definitions())
+        cert_table = await cached_search(self.es, f"systemair_ds_producttables_{lang}", query_cert_definitions())
         hits = cert_table.get("hits", {}).get("hits", [])
         table_rows = hits[0]["_source"].get("table", [])[0].get("rows", [])
         # Build seq â†’ label mapping from row 0
@@ -50,8 +54,12 @@ class AssignmentsBuilder:
             }
         result: List[Certification] = []
         try:
-            response = self.es.search(f"systemair_ds_attributes_{lang}", query_certifications())
-            for att in response.get("hits", {}).get("hits", []):
+            response = await self.es.asearch(f"systemair_ds_attributes_{lang}", query_certifications())
+            hits = response.get("hits", {}).get("hits", [])
+            # every certification image in one lookup
+            images = await element_previews.resolve(
+                self.es, lang, [str(att.get("_source", att).get("flag1ObjeId", "")) for att in hits])
+            for att in hits:
                 # Some callers pass the raw dict or an ES hitâ€”normalize both
                 src = att.get("_source", att)
 
@@ -60,7 +68,7 @@ class AssignmentsBuilder:
                     id=str(src.get("attributeId", "")),
                     name=name,
                     label=merged_dict[name]["label"],
-                    image=await self.get_image_byId(str(src.get("flag1ObjeId", "")), lang),
+                    image=images[str(src.get("flag1ObjeId", ""))],
                     text=merged_dict[name]["nullFallbackText"]
                 )
                 result.append(cert)
@@ -71,11 +79,7 @@ class AssignmentsBuilder:
         return result
 
     async def get_image_byId(self, id: str, lang: str) -> Optional[str]:
-        response = self.es.search(f"systemair_ds_elements_{lang}", query_image_byId(id))
-        hits = response.get("hits", {}).get("hits", [])
-        if hits:
-            return hits[0]["_source"].get("dsElementPreviewFile")
-        return ""
+        return await element_previews.resolve_one(self.es, lang, id)
 
     def parse_certifications(self, certs: List[dict]) -> List[Certification]:
         return [
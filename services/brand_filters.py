@@ -0,0 +1,59 @@
+import logging
+from typing import List, Optional, Tuple
+
+from queries.hierarchy_queries import query_hierarchy_values
+from services.reference_cache import reference_cache
+
+logger = logging.getLogger("services.brand_filters")
+
+
+class BrandTermsResolver:
+    """
+    Resolves a brand to the concrete hierarchies.hierarchy values that start with it, so queries can
+    filter with an indexed `terms` query instead of running a painless script per nested document.
+
+    The distinct hierarchy values of an index come from one terms aggregation, cached in
+    reference_cache (a new hierarchy shows up within the cache ttl). When the aggregation cannot
+    return every value, resolve() returns None and callers keep the script filter.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.resolved = 0
+        self.fallbacks = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.enabled = str(config.get("enabled", "true")).strip().lower() in ("1", "true", "yes", "on")
+
+    async def resolve(self, es, index: str, brand: Optional[str]) -> Optional[List[str]]:
+        """Hierarchy values of `index` whose lowercase form starts with brand, or None to fall back to the script."""
+        if brand is None or not self.enabled:
+            return None
+        try:
+            values = await reference_cache.get(("hierarchy_values", index), lambda: self._load_values(es, index))
+        except Exception:
+            logger.warning("Could not load hierarchy values of %s; using the brand script filter", index, exc_info=True)
+            values = None
+        if values is None:
+            self.fallbacks += 1
+            return None
+        self.resolved += 1
+        # same test as the script: value.toLowerCase().startsWith(brand), brand not lowercased
+        return [value for lowered, value in values if lowered.startswith(brand)]
+
+    @staticmethod
+    async def _load_values(es, index: str) -> Optional[Tuple[Tuple[str, str], ...]]:
+        response = await es.asearch(index, query_hierarchy_values())
+        agg = response.get("aggregations", {}).get("hierarchies", {}).get("values", {})
+        if agg.get("sum_other_doc_count", 0):
+            logger.warning("%s has more distinct hierarchy values than one terms aggregation returns; "
+                           "brand filters stay on the script", index)
+            return None
+        return tuple((str(bucket["key"]).lower(), bucket["key"]) for bucket in agg.get("buckets", []))
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "resolved": self.resolved, "fallbacks": self.fallbacks}
+
+
+brand_terms = BrandTermsResolver()
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+import orjson
+from elasticsearch.exceptions import RequestError
+
+from queries.hierarchy_queries import brand_filter
+from queries.statistics_queries import (query_brand_reference_ids, query_brand_products, query_market_attributes,
+                                        query_index_version)
+from services.brand_filters import brand_terms
+from utils.http_cache import payload_etag
+from utils.mapping import get_epimLang_by_market, unmap_locale
+from utils.utilities import shop_statistics
+
+logger = logging.getLogger("services.brand_statistics")
+
+PRODUCTS_INDEX = "systemair_ds_products_eng_glo"
+ATTRIBUTES_INDEX = "systemair_ds_attributes_eng_glo"
+PARENT_IDS_CHUNK = 10000
+
+
+async def brand_reference_ids(es, brand: str) -> List:
+    """referenceIds of the brand's products: composite aggregation pages over referenceId (distinct
+    values only), or a scroll over the products where the field cannot be aggregated."""
+    filter_ = brand_filter(brand, await brand_terms.resolve(es, PRODUCTS_INDEX, brand))
+    reference_ids: List = []
+    after_key = None
+    try:
+        while True:
+            response = await es.asearch(PRODUCTS_INDEX, query_brand_reference_ids(filter_, after_key=after_key))
+            agg = response["aggregations"]["reference_ids"]
+            reference_ids.extend(bucket["key"]["referenceId"] for bucket in agg["buckets"])
+            after_key = agg.get("after_key")
+            if not agg["buckets"] or not after_key:
+                return reference_ids
+    except RequestError:
+        logger.warning("referenceId cannot be aggregated on %s; scrolling the products instead", PRODUCTS_INDEX,
+                       exc_info=True)
+    hits = await es.agetScrollObject(PRODUCTS_INDEX, query_brand_products(filter_), 10000, "1m")
+    return [hit["_source"]["referenceId"] for hit in hits if hit.get("_source", {}).get("referenceId")]
+
+
+async def compute_brand_statistics(es, brand: str) -> dict:
+    """
+    Markets with at least one of the brand's products released (market-<nr> == 1 and
+    market-<nr>-expired == 0) and the locales of those markets.
+    """
+    products = await brand_reference_ids(es, brand.lower())
+    chunks = [products[i:i + PARENT_IDS_CHUNK] for i in range(0, len(products), PARENT_IDS_CHUNK)]
+
+    # Limit parallelism to avoid hammering ES
+    semaphore = asyncio.Semaphore(10)
+
+    async def fetch_chunk(chunk):
+        async with semaphore:
+            return await es.agetScrollObject(ATTRIBUTES_INDEX, query_market_attributes(chunk, brand), 10000, "1m")
+
+    parts = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+    shops = shop_statistics([hit for part in parts for hit in part])
+
+    langs = []
+    for shop in shops:
+        for lang in get_epimLang_by_market(shop):
+            lang_mapped = unmap_locale(lang)
+            if lang_mapped and lang_mapped not in langs:
+                langs.append(lang_mapped)
+
+    now = datetime.now(ZoneInfo("Europe/Berlin"))
+    return {
+        "locales": langs,
+        "markets": shops,
+        "published": int(now.timestamp()),
+        "version": now.strftime("%Y.%m.%d")
+    }
+
+
+class _Entry:
+    __slots__ = ("payload", "etag", "last_modified", "source_version", "computed_at", "requested_at")
+
+    def __init__(self, payload: bytes, source_version, computed_at: float):
+        self.payload = payload
+        self.etag = payload_etag(payload)
+        self.last_modified = datetime.now(timezone.utc)
+        self.source_version = source_version
+        self.computed_at = computed_at
+        self.requested_at = computed_at
+
+
+class StatisticsMaterializer:
+    """
+    Serialized /rest/<brand>/statistics responses, one per brand (lowercased), served from memory with an ETag.
+
+    A brand is computed on its first request (concurrent requests share the computation) or at
+    startup when listed in `brands`. A background task checks every `refresh_interval` seconds
+    whether the products or attributes index changed (document count or newest `timestamp`) and
+    recomputes every known brand when it did, or when an entry is older than `max_age`. A failed
+    recomputation keeps serving the previous result. Brands outside `brands` that were not requested
+    for `idle_ttl` seconds are dropped instead of recomputed.
+    """
+
+    def __init__(self, refresh_interval: float = 300.0, max_age: float = 86400.0, idle_ttl: float = 604800.0):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.idle_ttl = idle_ttl
+        self.brands: List[str] = []
+        self._entries: Dict[str, _Entry] = {}
+        self._computing: Dict[str, asyncio.Future] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.recomputes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.refresh_interval = float(config.get("refresh_interval", self.refresh_interval))
+        self.max_age = float(config.get("max_age", self.max_age))
+        self.idle_ttl = float(config.get("idle_ttl", self.idle_ttl))
+        self.brands = [b.strip().lower() for b in str(config.get("brands", "")).split(",") if b.strip()]
+
+    async def get(self, es, brand: str) -> _Entry:
+        """Entry of a brand the caller validated (map_brand): an unknown brand would be computed and kept."""
+        brand = brand.lower()
+        entry = self._entries.get(brand)
+        if entry is not None:
+            self.hits += 1
+            entry.requested_at = time.monotonic()
+            return entry
+        self.misses += 1
+        future = self._computing.get(brand)
+        if future is None:
+            future = asyncio.ensure_future(self._compute(es, brand))
+            self._computing[brand] = future
+            future.add_done_callback(lambda _: self._computing.pop(brand, None))
+        return await asyncio.shield(future)
+
+    async def _compute(self, es, brand: str, source_version=None) -> _Entry:
+        if source_version is None:
+            try:
+                source_version = await self.source_version(es)
+            except Exception:
+                # unknown version: the next refresh recomputes this brand
+                logger.warning("Could not read the statistics source version", exc_info=True)
+        started = time.perf_counter()
+        result = await compute_brand_statistics(es, brand)
+        entry = _Entry(orjson.dumps(result), source_version, time.monotonic())
+        previous = self._entries.get(brand)
+        if previous is not None:
+            entry.requested_at = previous.requested_at
+        self._entries[brand] = entry
+        self.recomputes += 1
+        logger.info("Statistics for %s computed in %.2fs", brand, time.perf_counter() - started)
+        return entry
+
+    @staticmethod
+    async def source_version(es) -> tuple:
+        version = []
+        for index in (PRODUCTS_INDEX, ATTRIBUTES_INDEX):
+            response = await es.asearch(index, query_index_version())
+            version.append(response["hits"]["total"]["value"])
+            version.append(response.get("aggregations", {}).get("latest", {}).get("value"))
+        return tuple(version)
+
+    async def refresh(self, es) -> None:
+        """Drop the idle brands, then recompute the known brands whose entry is outdated."""
+        now = time.monotonic()
+        for brand, entry in list(self._entries.items()):
+            if brand not in self.brands and now - entry.requested_at >= self.idle_ttl:
+                del self._entries[brand]
+                self.evictions += 1
+        brands = list(dict.fromkeys([*self.brands, *self._entries]))
+        if not brands:
+            return
+        try:
+            source_version = await self.source_version(es)
+        except Exception:
+            self.refresh_errors += 1
+            logger.warning("Could not read the statistics source version", exc_info=True)
+            return
+        now = time.monotonic()
+        for brand in brands:
+            entry = self._entries.get(brand)
+            if entry is not None and entry.source_version == source_version and now - entry.computed_at < self.max_age:
+                continue
+            try:
+                await self._compute(es, brand, source_version)
+            except Exception:
+                self.refresh_errors += 1
+                logger.warning("Statistics refresh failed for %s; serving the previous result", brand, exc_info=True)
+
+    def start(self, es) -> None:
+        """Background task: compute the configured brands, then keep every known brand current."""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(es))
+
+    async def _refresh_loop(self, es) -> None:
+        while True:
+            await self.refresh(es)
+            if self.refresh_interval <= 0:
+                return
+            await asyncio.sleep(self.refresh_interval)
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    def stats(self) -> dict:
+        return {
+            "brands": sorted(self._entries),
+            "refresh_interval": self.refresh_interval,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recomputes": self.recomputes,
+            "refresh_errors": self.refresh_errors,
+            "evictions": self.evictions,
+        }
+
+
+statistics_materializer = StatisticsMaterializer()
@@ -2,19 +2,21 @@ from models.category import Category
 from queries.category_queries import (
     query_category_by_id,query_attributes,query_texts,query_images,query_secondaryParents,query_elements_attributes,
 )
-from utils.utilities import inject_fallback_sort
+from services.lang_fallback import lang_fallback
 from typing import Optional, List, Dict, Union, Any
 import logging
 import asyncio
 import json
 import xml.etree.ElementTree as ET
 import re
+from services.es_batcher import batched_searches
 logger = logging.getLogger(__name__)
 
 class CategoryBuilder:
     def __init__(self, es_client):
         self.es = es_client
 
+    @batched_searches
     async def build_category(self, identifier: str, lang: str, brand: str) -> Optional[Category]:
         try:
             category = await self.get_category(identifier, lang, brand)
@@ -27,14 +29,14 @@ class CategoryBuilder:
             pgrs = [h["id"] for h in category["hierarchies"]]
             pgrs.append(category_id)
 
-            indices, attQuery = inject_fallback_sort(query_attributes(pgrs), lang, "systemair_ds_attributes_","attributeParentId")
-            attributes_res = self.es.search(indices, attQuery)
+            attributes_res = await lang_fallback.search(self.es, query_attributes(pgrs), lang,
+                                                        "systemair_ds_attributes_", "attributeParentId")
             attributes = attributes_res.get("hits", {}).get("hits", [])
 
             #attributes = list(self.es.getScrollObject(index, query_attributes(pgrs), 10000, "1m"))
             get_texts_ids = await self.get_texts_ids(category, None)
             index = f"systemair_ds_elements_{lang}"
-            texts_res = self.es.search(index, query_texts(get_texts_ids))
+            texts_res = await self.es.asearch(index, query_texts(get_texts_ids))
             texts = texts_res.get("hits", {}).get("hits", [])
 
             # Get all necessary data in parallel
@@ -99,7 +101,7 @@ class CategoryBuilder:
     async def get_category(self, identifier: str, lang: str, brand: str) -> Optional[dict]:
         index = f"systemair_ds_hierarchies_{lang}"  # Categories are typically stored in hierarchies index
         try:
-            response = self.es.search(index, query_category_by_id(identifier))
+            response = await self.es.asearch(index, query_category_by_id(identifier))
             hits = response.get("hits", {}).get("hits", [])
             return hits[0]["_source"] if hits else None
         except Exception as e:
@@ -178,7 +180,7 @@ class CategoryBuilder:
         res = []
         index = f"systemair_ds_hierarchies_{lang}"
         try:
-            response = self.es.search(index, query_secondaryParents(category_id))
+            response = await self.es.asearch(index, query_secondaryParents(category_id))
             hits = response.get("hits", {}).get("hits", [])
             for hit in hits:
                 parent = hit.get("_source", {}).get("parentHierarchy")
@@ -251,7 +253,7 @@ class CategoryBuilder:
         final_response = []
         #print(query_images(resolved_epim_ids))
         try:
-            response = self.es.search(index, query_images(resolved_epim_ids))
+            response = await self.es.asearch(index, query_images(resolved_epim_ids))
             hits = response.get("hits", {}).get("hits", [])
             if not hits:
                 return None
@@ -265,7 +267,7 @@ class CategoryBuilder:
                     vaiants_elements.append(hit["_source"].get("epimId"))
             # Return the first image URL if available, otherwise None
             att_index = f"systemair_ds_attributes_{lang}"
-            att_response = list(self.es.getScrollObject(att_index, query_elements_attributes(vaiants_elements), 10000,"1m"))
+            att_response = await self.es.agetScrollObject(att_index, query_elements_attributes(vaiants_elements), 10000,"1m")
 
             check_inactive_internal = {}
             for hit in att_response:
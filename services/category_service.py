@@ -4,6 +4,9 @@ from services.category_builder import CategoryBuilder
 from services.elasticsearch_service import ESConnection
 from services.database_service import DBConnection
 from quart import current_app
+from services.brand_filters import brand_terms
+from services.single_flight import entity_flight
+from utils.pagination import InvalidCursor, cursor_meta, cursor_paging
 from queries.category_queries import query_categories, query_category_by_id,query_categories_by_parentId
 
 
@@ -13,14 +16,16 @@ async def get_category_by_id(identifier: str, lang: str, brand: str) -> Optional
     Get a single category by its ID
     """
     builder = CategoryBuilder(current_app.es)
-    return await builder.build_category(identifier, lang, brand)
+    return await entity_flight.do(("category", str(identifier), lang, brand, None),
+                                  lambda: builder.build_category(identifier, lang, brand))
 
 async def get_categories(
     offset: int = 0, 
     limit: int = 10, 
     brand: str = "systemair", 
     lang: str = "deu_deu",
-    parent_id: Optional[str] = None
+    parent_id: Optional[str] = None,
+    cursor: Optional[str] = None
 ) -> CategoryListResponse:
     """
     Get a list of categories with pagination and optional parent filtering
@@ -31,6 +36,8 @@ async def get_categories(
         brand: Brand identifier
         lang: Language code
         parent_id: Optional parent category ID to filter by
+        cursor: Cursor of the page to return ("" for the first page) instead of offset;
+            the response meta then carries the cursor of the next page
         
     Returns:
         CategoryListResponse containing the list of categories and metadata
@@ -40,13 +47,20 @@ async def get_categories(
     es = current_app.es
     builder = CategoryBuilder(es)
     # Build query based on whether we're getting root or child categories
+    terms = await brand_terms.resolve(es, index, brand)
     if parent_id:
-        query = query_categories_by_parentId(offset, limit, brand,parent_id)
+        query = query_categories_by_parentId(offset, limit, brand,parent_id, terms)
     else:
-        query = query_categories(offset, limit, brand)
+        query = query_categories(offset, limit, brand, terms)
     
     try:
-        response = es.search(index, query)
+        next_cursor = None
+        if cursor is not None:
+            # epimId breaks seqorderNr ties so search_after has a unique position
+            response, next_cursor = await cursor_paging.page(es, index, query, query["sort"] + [{"epimId": "asc"}],
+                                                             limit, cursor)
+        else:
+            response = await es.asearch(index, query)
         hits = response.get("hits", {}).get("hits", [])
         total = response.get("hits", {}).get("total", {}).get("value", 0)
         
@@ -60,9 +74,12 @@ async def get_categories(
                     items.append(category)
         
         return CategoryListResponse(
-            meta={"offset": offset, "limit": limit, "total": total},
+            meta=cursor_meta(limit, total, next_cursor) if cursor is not None
+            else {"offset": offset, "limit": limit, "total": total},
             items=items
         )
+    except InvalidCursor:
+        raise
     except Exception as e:
         current_app.logger.error(f"Error fetching categories: {str(e)}")
         return CategoryListResponse(
@@ -3,7 +3,17 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
+import time
 from typing import  Optional
+
+from services.metrics import DB_LATENCY
+from services.tracing import current_trace
+
+
+class DBQueueTimeout(TimeoutError):
+    """No pooled DB worker became free within max_queue_wait."""
+
+
 class DBConnection:
     def __init__(self, db_type, host, user, pw, name, port=None):
         self.db_type = db_type.lower()
@@ -17,6 +27,35 @@ class DBConnection:
         self.connection = None
         self._executor: Optional[ThreadPoolExecutor] = None
         self._max_workers = 1
+        # pooled mode (opt-in, pool_size > 0): every query checks its own connection out of the engine pool;
+        # 0 keeps the single shared connection on one worker thread
+        self.pool_size = 0
+        self.max_overflow = 5
+        self.pool_timeout = 30.0
+        self.max_queue_wait = 10.0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_use = 0
+        self._waiting = 0
+        self._peak_in_use = 0
+        self._peak_waiting = 0
+        self._queries = 0
+        self._queue_timeouts = 0
+        self._queue_wait_total = 0.0
+
+    @property
+    def pooled(self) -> bool:
+        return self.pool_size > 0
+
+    def configure_pool(self, config: Optional[dict]):
+        """
+        Pool settings from the [epim_db] section:
+        pool_size (0 = single shared connection), max_overflow, pool_timeout, max_queue_wait.
+        """
+        config = config or {}
+        self.pool_size = int(config.get("pool_size", self.pool_size))
+        self.max_overflow = int(config.get("max_overflow", self.max_overflow))
+        self.pool_timeout = float(config.get("pool_timeout", self.pool_timeout))
+        self.max_queue_wait = float(config.get("max_queue_wait", self.max_queue_wait))
 
     def connect(self):
         try:
@@ -29,12 +68,20 @@ class DBConnection:
 
             self.engine = create_engine(
                 connection_string,
-                pool_size=5,
-                max_overflow=5,
+                pool_size=max(self.pool_size, 1),
+                max_overflow=self.max_overflow if self.pooled else 5,
+                pool_timeout=self.pool_timeout,
+                # pre-ping = short "SELECT 1" health probe on every checkout
                 pool_pre_ping=True,
                 pool_recycle=3600  # seconds
             )
-            self.connection = self.engine.connect()
+            if self.pooled:
+                # fail fast on bad settings; queries check out their own connections
+                with self.engine.connect():
+                    pass
+                self._max_workers = self.pool_size + self.max_overflow
+            else:
+                self.connection = self.engine.connect()
             self.logger.info("Connected to database")
         except SQLAlchemyError as e:
             self.logger.exception("DB connection error")
@@ -42,6 +89,9 @@ class DBConnection:
 
     def disconnect(self):
         try:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
             if self.connection:
                 self.connection.close()
             if self.engine:
@@ -62,6 +112,8 @@ class DBConnection:
             raise e
 
     def execute_query(self, query, params=None):
+        if self.pooled:
+            return self._execute_pooled(query, params)
         if not self.connection:
             raise ConnectionError("Database not connected.")
         try:
@@ -74,13 +126,79 @@ class DBConnection:
             except Exception as rb_exc:
                 self.logger.error("Rollback failed: %s", rb_exc)
             raise e
+
+    def _execute_pooled(self, query, params=None):
+        if not self.engine:
+            raise ConnectionError("Database not connected.")
+        try:
+            # the connection goes back to the pool (rolled back) when the block exits
+            with self.engine.connect() as connection:
+                result = connection.execute(text(query), params or {})
+                return [dict(row) for row in result.mappings()]
+        except SQLAlchemyError as e:
+            self.logger.exception("Query failed: %s", query)
+            raise e
+
     async def aexecute_query(self, query, params=None):
+        trace = current_trace()
+        started = time.perf_counter()
+        rows = await self._aexecute_query(query, params)
+        DB_LATENCY.observe(time.perf_counter() - started)
+        if trace is not None:
+            trace.record("db", self.name, str(query), started, rows)
+        return rows
+
+    async def _aexecute_query(self, query, params=None):
         """
                 Runs execute_query in a dedicated thread so the event loop isn't blocked.
-                Default single-thread to keep SQLAlchemy Connection thread-safe.
+                Single shared connection: one worker thread, so the Connection stays thread-safe.
+                Pooled: pool_size + max_overflow workers, each query on its own pooled connection;
+                a query that waits longer than max_queue_wait for a worker raises DBQueueTimeout.
                 """
         if self._executor is None:
             # Keep it lazy; 1 worker == same thread always.
             self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="db-conn")
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self._executor, lambda: self.execute_query(query, params))
\ No newline at end of file
+        if not self.pooled:
+            return await loop.run_in_executor(self._executor, lambda: self.execute_query(query, params))
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_workers)
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        self._peak_waiting = max(self._peak_waiting, self._waiting)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self._queue_timeouts += 1
+            raise DBQueueTimeout(
+                f"Waited more than {self.max_queue_wait}s for a free DB connection "
+                f"({self._in_use} in use, {self._waiting - 1} queued)"
+            )
+        finally:
+            self._waiting -= 1
+        self._queue_wait_total += time.perf_counter() - queued_at
+        self._queries += 1
+        self._in_use += 1
+        self._peak_in_use = max(self._peak_in_use, self._in_use)
+        try:
+            return await loop.run_in_executor(self._executor, lambda: self._execute_pooled(query, params))
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+
+    def pool_stats(self) -> dict:
+        """Saturation of the pooled mode: workers busy/queued now and at peak, queue waits and engine pool state."""
+        pool = self.engine.pool if self.engine else None
+        return {
+            "pooled": self.pooled,
+            "workers": self._max_workers,
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "peak_in_use": self._peak_in_use,
+            "peak_waiting": self._peak_waiting,
+            "queries": self._queries,
+            "queue_timeouts": self._queue_timeouts,
+            "avg_queue_wait_ms": round(self._queue_wait_total / self._queries * 1000, 3) if self._queries else 0.0,
+            "engine_pool": pool.status() if pool is not None else None,
+        }
\ No newline at end of file
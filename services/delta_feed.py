@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional
+
+import orjson
+
+from queries.delta_queries import query_affected_shop_skus, query_changed_ids, query_delta_high_water, \
+    query_element_owners
+from services.brand_filters import brand_terms
+from services.sku_builder import SkuBuilder
+
+logger = logging.getLogger("services.delta_feed")
+
+# index kind -> field linking a changed document to the SKU (or reference SKU) it belongs to; for elements
+# (texts, images) that is the object they are assigned through (see ELEMENT_ASSIGNMENTS)
+DELTA_SOURCES = {
+    "products": "epimId",
+    "attributes": "parentId",
+    "elements": "parentElement",
+}
+# changed ids / SKUs resolved per search: terms list size and page size
+RESOLVE_CHUNK = 1000
+
+
+class DeltaSettings:
+    """Batching of the shop SKU delta feed, and counters of the feeds run."""
+
+    def __init__(self, batch_size: int = 200, concurrency: int = 16, overlap: int = 60):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        # seconds re-read before the token, for documents that became searchable after the previous run
+        self.overlap = overlap
+        self.started = 0
+        self.completed = 0
+        self.changed = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.batch_size = int(config.get("batch_size", self.batch_size))
+        self.concurrency = int(config.get("concurrency", self.concurrency))
+        self.overlap = int(config.get("overlap", self.overlap))
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "overlap": self.overlap,
+            "started": self.started,
+            "completed": self.completed,
+            "changed": self.changed,
+        }
+
+
+delta_settings = DeltaSettings()
+
+
+class ShopSkuDelta:
+    """
+    Shop SKUs changed since a high-water mark (epoch ms of the newest `timestamp` seen by the previous run).
+
+    The window is (since - overlap, high water], where high water is the newest timestamp of the products,
+    attributes and elements indices when the run starts. Changed documents of the three indices are mapped
+    to ids through DELTA_SOURCES (elements through the SKUs and reference SKUs they are assigned to),
+    resolved to the brand's shop SKUs that are those ids or reference them, and built in batches of `batch_size` with at most `concurrency` builds in flight. Without `since` only
+    the high-water mark is returned, to start the feed after a full sync.
+    """
+
+    def __init__(self, es, db, lang: str, brand: str, market: Optional[str], since: Optional[int] = None,
+                 batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.es = es
+        self.db = db
+        self.lang = lang
+        self.brand = brand
+        self.market = market
+        self.since = since
+        self.batch_size = batch_size or delta_settings.batch_size
+        self.concurrency = concurrency or delta_settings.concurrency
+        self.indices = {kind: f"systemair_ds_{kind}_{lang}" for kind in DELTA_SOURCES}
+
+    async def high_water(self) -> int:
+        response = await self.es.asearch(",".join(self.indices.values()), query_delta_high_water())
+        latest = response.get("aggregations", {}).get("latest", {}).get("value")
+        # an empty window (nothing indexed yet) keeps the caller's position
+        return int(latest) if latest is not None else (self.since or int(time.time() * 1000))
+
+    async def changed_ids(self, until: int) -> AsyncIterator[tuple]:
+        """(index kind, ids) of the documents changed in the window, one composite page per list."""
+        since = self.since - delta_settings.overlap * 1000
+        for kind, field in DELTA_SOURCES.items():
+            after_key = None
+            while True:
+                response = await self.es.asearch(self.indices[kind],
+                                                 query_changed_ids(field, since, until, 1000, after_key))
+                changed = response.get("aggregations", {}).get("changed", {})
+                ids = [bucket["key"]["id"] for bucket in changed.get("buckets", [])]
+                if ids:
+                    yield kind, ids
+                after_key = changed.get("after_key")
+                if not after_key or not ids:
+                    break
+
+    async def _paged_ids(self, query_page) -> AsyncIterator[str]:
+        """
+        epimId of every hit of query_page(search_after) on the products index, page by page: a page
+        shorter than RESOLVE_CHUNK is the last one, so no hit is left out.
+        """
+        after = None
+        while True:
+            response = await self.es.asearch(self.indices["products"], query_page(after))
+            hits = response.get("hits", {}).get("hits", [])
+            for hit in hits:
+                epim_id = hit.get("_source", {}).get("epimId")
+                if epim_id is not None:
+                    yield str(epim_id)
+            if len(hits) < RESOLVE_CHUNK:
+                return
+            after = hits[-1]["sort"]
+
+    async def affected(self, until: int) -> AsyncIterator[List[str]]:
+        """Shop SKU ids affected by the window, in batches of batch_size, each id once."""
+        terms = await brand_terms.resolve(self.es, self.indices["products"], self.brand)
+        seen, batch = set(), []
+        async for kind, ids in self.changed_ids(until):
+            if kind == "elements":
+                ids = [owner async for owner in self._paged_ids(
+                    lambda after, objects=ids: query_element_owners(objects, RESOLVE_CHUNK, after))]
+            for start in range(0, len(ids), RESOLVE_CHUNK):
+                chunk = ids[start:start + RESOLVE_CHUNK]
+                async for sku_id in self._paged_ids(
+                        lambda after, chunk=chunk: query_affected_shop_skus(chunk, self.brand, terms,
+                                                                           RESOLVE_CHUNK, after)):
+                    if sku_id in seen:
+                        continue
+                    seen.add(sku_id)
+                    batch.append(sku_id)
+                    if len(batch) >= self.batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    async def _build_batch(self, ids: List[str]) -> list:
+        builder = SkuBuilder(self.es, self.db)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(sku_id):
+            async with semaphore:
+                return sku_id, await builder.build_shop_sku(sku_id, self.lang, self.brand, self.market)
+
+        return await asyncio.gather(*(limited(i) for i in ids))
+
+    async def ndjson(self) -> AsyncIterator[bytes]:
+        """
+        One line per changed shop SKU ({"id", "sku"}; "sku" is null when it cannot be built any more),
+        then a last line {"next": <token>} to pass as `since` on the next run. A response without that
+        line was interrupted and should be retried with the same token.
+        """
+        until = await self.high_water()
+        delta_settings.started += 1
+        if self.since is not None:
+            async with aclosing(self.affected(until)) as batches:
+                async for ids in batches:
+                    built = await self._build_batch(ids)
+                    delta_settings.changed += len(built)
+                    yield b"".join(
+                        orjson.dumps({"id": sku_id, "sku": sku.model_dump() if sku else None}) + b"\n"
+                        for sku_id, sku in built)
+        delta_settings.completed += 1
+        yield orjson.dumps({"next": str(until)}) + b"\n"
@@ -1,12 +1,31 @@
 import logging
-from elasticsearch import Elasticsearch, helpers
-from elasticsearch.exceptions import NotFoundError, ConnectionError, ConnectionTimeout
+from elasticsearch import Elasticsearch, AsyncElasticsearch, helpers
+from elasticsearch.helpers import async_scan
+from elasticsearch.exceptions import NotFoundError, RequestError, ConnectionError, ConnectionTimeout
 import asyncio
+import time
+
+from services.es_batcher import current_batcher
+from services.request_memo import current_memo
+from services.metrics import observe_es, observe_msearch
+from services.tracing import current_trace
+
+
+def _config_flag(value, default: bool) -> bool:
+    if value is None:
+        return default
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
 class ESConnection:
     def __init__(self, config):
         self.logger = logging.getLogger("services.elasticsearch")
         self.config = config
         self.es = None
+        # native aiohttp-backed client used by the async helpers (asearch, agetScrollObject)
+        self.aes = None
+        self.msearch_batching = False
+        self.msearch_max_batch = 50
 
     def connect(self):
         url = self.config['url']
@@ -15,27 +34,29 @@ class ESConnection:
         certs = self.config.get('certs')
         timeout = int(self.config.get('timeout', 30))
         retries = int(self.config.get('retries', 3))
+        # async_transport=false falls back to running the sync client in worker threads
+        use_async = _config_flag(self.config.get('async_transport'), True)
+        pool_maxsize = int(self.config.get('pool_maxsize', 64))
+        # builder entry points coalesce the searches of one loop tick into a single _msearch
+        self.msearch_batching = _config_flag(self.config.get('msearch_batching'), True)
+        self.msearch_max_batch = int(self.config.get('msearch_max_batch', 50))
 
+        client_args = dict(
+            hosts=[url],
+            http_auth=(user, password),
+            timeout=timeout,
+            max_retries=retries,
+            retry_on_timeout=True,
+            http_compress=True,
+        )
         if certs:
-            self.es = Elasticsearch(
-                hosts=[url],
-                http_auth=(user, password),
-                timeout=timeout,
-                max_retries=retries,
-                retry_on_timeout=True,
-                verify_certs=True,
-                ca_certs=certs,
-                http_compress=True,
-            )
-        else:
-            self.es = Elasticsearch(
-                hosts=[url],
-                http_auth=(user, password),
-                timeout=timeout,
-                max_retries=retries,
-                retry_on_timeout=True,
-                http_compress=True,
-            )
+            client_args.update(verify_certs=True, ca_certs=certs)
+
+        self.es = Elasticsearch(**client_args)
+        if use_async:
+            # maxsize is the aiohttp connection limit per node; keep it >= the expected number of
+            # concurrent searches per worker (SKU fan-outs issue ~20 searches per SKU)
+            self.aes = AsyncElasticsearch(maxsize=pool_maxsize, **client_args)
 
         return self.check_connection()
 
@@ -49,27 +70,182 @@ class ESConnection:
     def get_client(self):
         return self.es
 
+    async def aclose(self):
+        if self.aes is not None:
+            await self.aes.close()
+        if self.es is not None:
+            self.es.close()
+
 
     def search(self, index, query):
+        trace = current_trace()
+        started = time.perf_counter()
         try:
-            return self.es.search(index=index, body=query)
+            response = self.es.search(index=index, body=query)
         except (ConnectionError, ConnectionTimeout):
             self.logger.exception(f"Error with ES connection during search. Index: {index}")
             raise
+        observe_es("search", index, started)
+        if trace is not None:
+            trace.round_trips += 1
+            trace.record("es", index, query, started, response)
+        return response
 
     async def asearch(self, index, query):
+        trace = current_trace()
+        started = time.perf_counter()
+        memo = current_memo()
+        if memo is not None:
+            # identical searches of one build share a single response
+            response = await memo.search(index, query, self._asearch_routed)
+        else:
+            response = await self._asearch_routed(index, query)
+        if trace is not None:
+            trace.record("es", index, query, started, response)
+        return response
+
+    async def _asearch_routed(self, index, query):
+        batcher = current_batcher()
+        if batcher is not None:
+            return await batcher.submit(index, query)
+        return await self.asearch_direct(index, query)
+
+    async def asearch_direct(self, index, query):
+        trace = current_trace()
+        if trace is not None:
+            trace.round_trips += 1
+        started = time.perf_counter()
         try:
-            # Why: elasticsearch-py is sync; run it in a worker thread
-            return await asyncio.to_thread(self.es.search, index=index, body=query)
+            if self.aes is None:
+                # Why: the sync client blocks; run it in a worker thread
+                response = await asyncio.to_thread(self.es.search, index=index, body=query)
+            else:
+                response = await self.aes.search(index=index, body=query)
         except (ConnectionError, ConnectionTimeout):
             self.logger.exception("Error with ES connection during search. Index: %s", index)
             raise
+        observe_es("search", index, started)
+        return response
+
+    async def amsearch(self, body):
+        trace = current_trace()
+        if trace is not None:
+            trace.round_trips += 1
+        started = time.perf_counter()
+        try:
+            if self.aes is None:
+                response = await asyncio.to_thread(self.es.msearch, body=body)
+            else:
+                response = await self.aes.msearch(body=body)
+        except (ConnectionError, ConnectionTimeout):
+            self.logger.exception("Error with ES connection during msearch (%d searches)", len(body) // 2)
+            raise
+        observe_msearch(body, started)
+        return response
 
     async def agetScrollObject(self, index, querySource, scrollSize, scrollTimeout):
-        def _scan_sync():
-            return list(helpers.scan(self.es, query=querySource, scroll=scrollTimeout, size=scrollSize, index=index))
+        trace = current_trace()
+        started = time.perf_counter()
+        if self.aes is None:
+            def _scan_sync():
+                return list(helpers.scan(self.es, query=querySource, scroll=scrollTimeout, size=scrollSize, index=index))
+
+            hits = await asyncio.to_thread(_scan_sync)
+        else:
+            hits = [hit async for hit in async_scan(self.aes, query=querySource, scroll=scrollTimeout,
+                                                    size=scrollSize, index=index)]
+        observe_es("scroll", index, started)
+        if trace is not None:
+            trace.round_trips += -(-len(hits) // scrollSize) if scrollSize else 1
+            trace.record("es", index, querySource, started, hits)
+        return hits
+
+    async def _client_call(self, method: str, **kwargs):
+        trace = current_trace()
+        if trace is not None:
+            trace.round_trips += 1
+        started = time.perf_counter()
+        if self.aes is None:
+            response = await asyncio.to_thread(getattr(self.es, method), **kwargs)
+        else:
+            response = await getattr(self.aes, method)(**kwargs)
+        # point in time calls: a pit search names no index
+        observe_es(method, kwargs.get("index", ""), started, searches=1 if method == "search" else 0)
+        return response
+
+    async def open_pit(self, index, keep_alive="2m"):
+        """Point in time id for index, or None where the cluster cannot open one."""
+        try:
+            return (await self._client_call("open_point_in_time", index=index, keep_alive=keep_alive))["id"]
+        except (ConnectionError, ConnectionTimeout):
+            raise
+        except Exception:
+            self.logger.warning("Could not open a point in time on %s; paging the live index", index, exc_info=True)
+            return None
+
+    async def close_pit(self, pit_id):
+        try:
+            await self._client_call("close_point_in_time", body={"id": pit_id})
+        except Exception:
+            self.logger.warning("Could not close point in time %s", pit_id[:16], exc_info=True)
+
+    async def asearch_page(self, index, query, sort, size, pit_id=None, search_after=None, keep_alive="2m"):
+        """
+        One search_after page of query in `sort` order: (response, next position). The next position
+        is {"pit": pit id or None, "after": sort values of the last hit}, or None after the last page
+        (the point in time is then closed). A point in time that has expired is replaced by the live
+        index, so a position stays usable as long as `sort` is unique per document (e.g. ends with epimId).
+        """
+        trace = current_trace()
+        started = time.perf_counter()
+        body = {**query, "size": size, "sort": sort}
+        body.pop("from", None)
+        if search_after is not None:
+            body["search_after"] = search_after
+        response = None
+        if pit_id is not None:
+            try:
+                response = await self._client_call(
+                    "search", body={**body, "pit": {"id": pit_id, "keep_alive": keep_alive}})
+                pit_id = response.get("pit_id", pit_id)
+            except (ConnectionError, ConnectionTimeout):
+                raise
+            except (NotFoundError, RequestError):
+                self.logger.info("Point in time on %s expired; continuing on the live index", index)
+                pit_id = None
+        if response is None:
+            if search_after is not None and len(search_after) > len(sort):
+                # the _shard_doc tiebreaker of a point in time page is unknown to the live index
+                body["search_after"] = search_after[:len(sort)]
+            response = await self._client_call("search", index=index, body=body)
+        if trace is not None:
+            trace.record("es", index, query, started, response)
+        hits = response.get("hits", {}).get("hits", [])
+        if len(hits) < size:
+            if pit_id is not None:
+                await self.close_pit(pit_id)
+            return response, None
+        return response, {"pit": pit_id, "after": hits[-1]["sort"]}
+
+    async def aiter_pages(self, index, query, sort, page_size=1000, keep_alive="2m", search_after=None):
+        """
+        Pages (lists of hits) of query in `sort` order, continuing after `search_after`. Reads a
+        point in time so the pages form one consistent snapshot; where the cluster cannot open one,
+        pages with search_after on the live index. `sort` must be unique per document (e.g. epimId)
+        for search_after to be a resumable position. Only one page is held at a time.
+        """
+        position = {"pit": await self.open_pit(index, keep_alive), "after": search_after}
+        try:
+            while position is not None:
+                response, position = await self.asearch_page(index, query, sort, page_size, position["pit"],
+                                                             position["after"], keep_alive)
+                hits = response.get("hits", {}).get("hits", [])
+                if hits:
+                    yield hits
+        finally:
+            if position is not None and position["pit"] is not None:
+                await self.close_pit(position["pit"])
 
-        return await asyncio.to_thread(_scan_sync)
     def searchAggregations(self, query_fn, index, size, fullFlag, lastRunTime):
         """
         Generator function to fetch results using composite aggregation pagination.
@@ -104,6 +280,10 @@ class ESConnection:
         res = helpers.scan(self.es, query=querySource, scroll=scrollTimeout, size=scrollSize, index=index)
         return res
     # counts documents in index depending on query (delta/full)
+    async def agetIndexCount(self, index, query):
+        """Number of documents of index matching query, without blocking the event loop."""
+        return (await self._client_call("count", index=index, body=query))["count"]
+
     def getIndexCount(self, index, query, aggregation=None):
 
         if aggregation:
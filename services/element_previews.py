@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from queries.sku_queries import query_images_byIds
+
+logger = logging.getLogger("services.element_previews")
+
+ES_MAX_SIZE = 10000
+
+
+class ElementPreviewResolver:
+    """
+    Element id -> preview file (dsElementPreviewFile, or `field`) of the first systemair_ds_elements_<lang>
+    document of that element, "" when there is none: what get_image_byId returns for certification
+    and button icons.
+
+    resolve() looks up every id it is not already holding with one `terms` search (split only if a
+    chunk fills the 10000-hit window) and keeps the results in a bounded LRU shared by all
+    requests. Ids that another request is already loading are awaited instead of searched again.
+    """
+
+    def __init__(self, maxsize: int = 20000, ttl: float = 600.0, max_ids: int = 1000):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_ids = max_ids
+        # (lang, field, element id) -> (preview, loaded_at)
+        self._entries: "OrderedDict[Tuple[str, str, str], tuple]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.searches = 0
+        self.evictions = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.maxsize = int(config.get("maxsize", self.maxsize))
+        self.ttl = float(config.get("ttl", self.ttl))
+
+    async def resolve_one(self, es, lang: str, element_id, field: str = "dsElementPreviewFile") -> str:
+        return (await self.resolve(es, lang, [element_id], field))[str(element_id)]
+
+    async def resolve(self, es, lang: str, element_ids: Iterable, field: str = "dsElementPreviewFile") -> Dict[str, str]:
+        """{str(id): preview file} for every id; raises when the search for any of them failed."""
+        ids = list(dict.fromkeys(str(i) for i in element_ids))
+        result: Dict[str, str] = {}
+        pending: List[asyncio.Future] = []
+        missing: List[str] = []
+        now = time.monotonic()
+        for element_id in ids:
+            key = (lang, field, element_id)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                result[element_id] = entry[0]
+            elif key in self._loading:
+                self.hits += 1
+                pending.append(self._loading[key])
+            else:
+                self.misses += 1
+                missing.append(element_id)
+
+        if missing:
+            load = asyncio.ensure_future(self._load(es, lang, field, missing))
+            # retrieve the exception even if every waiting request was cancelled
+            load.add_done_callback(lambda t: t.cancelled() or t.exception())
+            for element_id in missing:
+                self._loading[(lang, field, element_id)] = load
+            pending.append(load)
+
+        # shield: a cancelled request must not cancel a load other requests are waiting on
+        for loaded in await asyncio.gather(*[asyncio.shield(f) for f in dict.fromkeys(pending)]):
+            result.update((element_id, loaded[element_id]) for element_id in ids
+                          if element_id in loaded and element_id not in result)
+        return result
+
+    async def _load(self, es, lang: str, field: str, element_ids: List[str]) -> Dict[str, str]:
+        try:
+            previews = await self._search(es, f"systemair_ds_elements_{lang}", field, element_ids)
+        finally:
+            for element_id in element_ids:
+                self._loading.pop((lang, field, element_id), None)
+        now = time.monotonic()
+        for element_id, preview in previews.items():
+            self._entries[(lang, field, element_id)] = (preview, now)
+            self._entries.move_to_end((lang, field, element_id))
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return previews
+
+    async def _search(self, es, index: str, field: str, element_ids: List[str]) -> Dict[str, str]:
+        chunks = [element_ids[i:i + self.max_ids] for i in range(0, len(element_ids), self.max_ids)]
+        previews: Dict[str, str] = {}
+
+        async def run(chunk: List[str]):
+            self.searches += 1
+            response = await es.asearch(index, query_images_byIds(chunk))
+            hits = response.get("hits", {}).get("hits", [])
+            if len(hits) >= ES_MAX_SIZE and len(chunk) > 1:
+                middle = len(chunk) // 2
+                await asyncio.gather(run(chunk[:middle]), run(chunk[middle:]))
+                return
+            wanted = set(chunk)
+            for hit in hits:
+                src = hit.get("_source", {})
+                parents = src.get("parentElement")
+                for element_id in map(str, parents if isinstance(parents, list) else [parents]):
+                    # the first hit per element wins, as with the single-id term query
+                    if element_id in wanted and element_id not in previews:
+                        previews[element_id] = src.get(field)
+            for element_id in chunk:
+                previews.setdefault(element_id, "")
+
+        await asyncio.gather(*[run(chunk) for chunk in chunks])
+        return previews
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "searches": self.searches,
+            "evictions": self.evictions,
+        }
+
+
+element_previews = ElementPreviewResolver()
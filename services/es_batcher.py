@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+from elasticsearch.exceptions import HTTP_EXCEPTIONS, TransportError
+
+from services.request_memo import request_memo
+from services.tracing import traced
+
+logger = logging.getLogger("services.elasticsearch")
+
+_current_batcher: contextvars.ContextVar[Optional["MsearchBatcher"]] = contextvars.ContextVar(
+    "es_msearch_batcher", default=None
+)
+
+
+def current_batcher() -> Optional["MsearchBatcher"]:
+    return _current_batcher.get()
+
+
+class MsearchBatcher:
+    """
+    Collects the searches issued by one build within a single event-loop tick and sends
+    them as one _msearch. Each caller awaits its own future and gets back the same
+    response dict a plain _search would have returned.
+    """
+
+    def __init__(self, es, max_batch: int = 50):
+        self.es = es
+        self.max_batch = max_batch
+        self.searches = 0
+        self.round_trips = 0
+        self._pending: List[Tuple[object, dict, asyncio.Future]] = []
+        self._flush_scheduled = False
+        self._inflight = set()
+
+    def submit(self, index, query: dict) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((index, query, future))
+        self.searches += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif not self._flush_scheduled:
+            # Why: call_soon runs after every task already scheduled for this tick, so all
+            # siblings of an asyncio.gather get to enqueue their search first
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self.round_trips += 1
+        task = asyncio.ensure_future(self._send(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch):
+        if len(batch) == 1:
+            index, query, future = batch[0]
+            try:
+                result = await self.es.asearch_direct(index, query)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            if not future.done():
+                future.set_result(result)
+            return
+
+        body = []
+        for index, query, _ in batch:
+            body.append({"index": ",".join(index) if isinstance(index, (list, tuple)) else index})
+            body.append(query)
+        try:
+            response = await self.es.amsearch(body)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (index, _, future), item in zip(batch, response.get("responses", [])):
+            if future.done():
+                continue  # caller was cancelled
+            if "error" in item:
+                status = item.get("status", 500)
+                error = item["error"]
+                error_type = error.get("type", "unknown") if isinstance(error, dict) else str(error)
+                future.set_exception(HTTP_EXCEPTIONS.get(status, TransportError)(status, error_type, item))
+            else:
+                future.set_result(item)
+
+        # a short "responses" list must not leave callers waiting forever
+        answered = len(response.get("responses", []))
+        for index, _, future in batch[answered:]:
+            if not future.done():
+                future.set_exception(TransportError(
+                    "N/A", "msearch_response_missing",
+                    f"_msearch returned {answered} responses for {len(batch)} searches (index {index})"))
+
+
+@asynccontextmanager
+async def msearch_batch(es):
+    """
+    Route every ESConnection.asearch issued inside the block (including child tasks
+    created by asyncio.gather) through one request-scoped MsearchBatcher.
+    Nested blocks reuse the outer batcher.
+    """
+    if _current_batcher.get() is not None or not es.msearch_batching:
+        yield _current_batcher.get()
+        return
+    batcher = MsearchBatcher(es, es.msearch_max_batch)
+    token = _current_batcher.set(batcher)
+    try:
+        yield batcher
+    finally:
+        _current_batcher.reset(token)
+        logger.debug("msearch batcher sent %d searches in %d round trips", batcher.searches, batcher.round_trips)
+
+
+def batched_searches(method):
+    """
+    Decorator for builder entry points: run the whole build inside msearch_batch(self.es) and request_memo(),
+    timed as one step of the request trace.
+    """
+    step = method.__qualname__
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        async with request_memo(), msearch_batch(self.es):
+            return await traced(step, method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import zlib
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional
+
+import orjson
+
+from queries.export_queries import (EXPORT_SORT, query_export_categories, query_export_operating_modes,
+                                    query_export_products, query_export_skus)
+from services.brand_filters import brand_terms
+from services.category_builder import CategoryBuilder
+from services.operating_mode_builder import OperatingModeBuilder
+from services.product_builder import ProductBuilder
+from services.sku_builder import SkuBuilder
+
+logger = logging.getLogger("services.export")
+
+# export kind -> index kind of its source documents
+EXPORT_INDICES = {
+    "products": "hierarchies",
+    "skus": "products",
+    "categories": "hierarchies",
+    "operating-modes": "variants",
+}
+
+
+class ExportSettings:
+    """Page size and build concurrency of the catalogue exports, and counters of the exports run."""
+
+    def __init__(self, page_size: int = 200, concurrency: int = 16):
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.started = 0
+        self.completed = 0
+        self.documents = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.page_size = int(config.get("page_size", self.page_size))
+        self.concurrency = int(config.get("concurrency", self.concurrency))
+
+    def stats(self) -> dict:
+        return {
+            "page_size": self.page_size,
+            "concurrency": self.concurrency,
+            "started": self.started,
+            "completed": self.completed,
+            "documents": self.documents,
+        }
+
+
+export_settings = ExportSettings()
+
+
+class CatalogueExport:
+    """
+    Every entity of one kind for a brand/locale, in epimId order.
+
+    Ids come page by page from an ES point in time (ESConnection.aiter_pages); each page is built
+    with at most `concurrency` builds in flight (SKUs with one build_many per page) while the
+    previous page is being sent, so memory stays at about two pages whatever the catalogue size.
+    `after` resumes after that epimId (the id of the last complete line of an interrupted export).
+    """
+
+    def __init__(self, es, db, kind: str, lang: str, brand: str, market: Optional[str],
+                 after: Optional[str] = None, page_size: Optional[int] = None, concurrency: Optional[int] = None):
+        if kind not in EXPORT_INDICES:
+            raise ValueError(f"Unsupported export: {kind}")
+        self.es = es
+        self.db = db
+        self.kind = kind
+        self.lang = lang
+        self.brand = brand
+        self.market = market
+        self.page_size = page_size or export_settings.page_size
+        self.concurrency = concurrency or export_settings.concurrency
+        self.after = after
+        self.index = f"systemair_ds_{EXPORT_INDICES[kind]}_{lang}"
+
+    async def _query(self) -> dict:
+        if self.kind == "operating-modes":
+            return query_export_operating_modes()
+        terms = await brand_terms.resolve(self.es, self.index, self.brand)
+        return {
+            "products": query_export_products,
+            "skus": query_export_skus,
+            "categories": query_export_categories,
+        }[self.kind](self.brand, terms)
+
+    async def _build_page(self, ids: List) -> list:
+        if self.kind == "skus":
+            built = await SkuBuilder(self.es, self.db).build_many(ids, self.lang, self.brand, self.market,
+                                                                  concurrency=self.concurrency)
+            return [item for item in built if item]
+
+        if self.kind == "products":
+            builder = ProductBuilder(self.es)
+            build = lambda i: builder.build_product(i, self.lang, self.brand)
+        elif self.kind == "categories":
+            builder = CategoryBuilder(self.es)
+            build = lambda i: builder.build_category(i, self.lang, self.brand)
+        else:
+            builder = OperatingModeBuilder(self.es, self.db)
+            build = lambda i: builder.build_operating_mode(i, self.lang, self.brand, self.market)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(i):
+            async with semaphore:
+                return await build(i)
+
+        return [item for item in await asyncio.gather(*(limited(i) for i in ids)) if item]
+
+    async def pages(self) -> AsyncIterator[list]:
+        """Built entities, one list per source page."""
+        after = None
+        if self.after is not None:
+            after = [int(self.after) if str(self.after).isdigit() else self.after]
+        source = self.es.aiter_pages(self.index, await self._query(), EXPORT_SORT, self.page_size,
+                                     search_after=after)
+        building: Optional[asyncio.Future] = None
+        export_settings.started += 1
+        try:
+            async for hits in source:
+                # as strings, like the identifiers of the entity routes
+                ids = [str(hit["_source"]["epimId"]) for hit in hits if hit.get("_source", {}).get("epimId")]
+                # the next page builds while this one is sent
+                previous, building = building, asyncio.ensure_future(self._build_page(ids))
+                if previous is not None:
+                    yield await previous
+            if building is not None:
+                previous, building = building, None
+                yield await previous
+            export_settings.completed += 1
+        finally:
+            if building is not None:
+                building.cancel()
+            await source.aclose()
+
+    async def ndjson(self) -> AsyncIterator[bytes]:
+        """One JSON document per line, one chunk per page."""
+        async with aclosing(self.pages()) as pages:
+            async for items in pages:
+                if not items:
+                    continue
+                export_settings.documents += len(items)
+                yield b"".join(orjson.dumps(item.model_dump()) + b"\n" for item in items)
+
+    async def ndjson_gzip(self) -> AsyncIterator[bytes]:
+        """ndjson() gzip-compressed on the fly; every chunk is flushed so clients can decode as they read."""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        async with aclosing(self.ndjson()) as chunks:
+            async for chunk in chunks:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
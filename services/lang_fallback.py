@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Optional
+
+from elasticsearch.exceptions import RequestError
+
+from services.es_batcher import msearch_batch
+from utils.mapping import get_fallback_chain
+from utils.utilities import inject_fallback_sort, merge_fallback_hits, split_fallback_queries
+
+logger = logging.getLogger("services.lang_fallback")
+
+
+class LangFallbackSearch:
+    """
+    Searches across the language fallback chain of `lang` with one hit per collapse key, the
+    result inject_fallback_sort's painless langIso sort + collapse gives, without running the
+    script on every hit.
+
+    mode "merge" (default): every index of the chain is searched on its own (one _msearch round
+    trip when msearch batching is on) and the hits are merged client-side by merge_fallback_hits. Where the per-index
+    hits cannot reproduce the collapsed search exactly, or an index rejects the per-index search
+    (e.g. langIso or the collapse field has no doc values there), the script search runs instead.
+    mode "script": always the script search.
+    """
+
+    def __init__(self):
+        self.mode = "merge"
+        self.merged = 0
+        self.script_searches = 0
+        self.rejected = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        mode = str(config.get("mode", self.mode)).strip().lower()
+        if mode not in ("merge", "script"):
+            raise ValueError(f"[lang_fallback] mode must be 'merge' or 'script', not {mode!r}")
+        self.mode = mode
+
+    async def search(self, es, query: dict, lang: str, base_index: str = "systemair_ds_attributes_",
+                     collapse_field: str = "attributeParentId") -> dict:
+        if self.mode == "merge":
+            per_index = split_fallback_queries(query, lang, base_index, collapse_field)
+            responses = None
+            if per_index is not None:
+                try:
+                    async with msearch_batch(es):
+                        responses = await asyncio.gather(*[es.asearch(index, q) for index, q in per_index])
+                except RequestError:
+                    self.rejected += 1
+                    logger.warning("Per-index fallback search rejected for %s; using the fallback sort script", lang,
+                                   exc_info=True)
+            if responses is not None:
+                hits = merge_fallback_hits(responses, get_fallback_chain(lang), collapse_field,
+                                           int(query.get("size", 10)))
+                if hits is not None:
+                    self.merged += 1
+                    # merged only when every index returned all of its matches
+                    total = sum(len(r["hits"]["hits"]) for r in responses)
+                    return {"hits": {"total": {"value": total, "relation": "eq"}, "hits": hits}}
+                logger.debug("Per-index hits for %s not mergeable; using the fallback sort script", lang)
+        self.script_searches += 1
+        indices, script_query = inject_fallback_sort(query, lang, base_index, collapse_field)
+        return await es.asearch(indices, script_query)
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "merged": self.merged, "script_searches": self.script_searches,
+                "rejected": self.rejected}
+
+
+lang_fallback = LangFallbackSearch()
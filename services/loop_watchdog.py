@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+logger = logging.getLogger("services.loop_watchdog")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_SELF = os.path.abspath(__file__)
+
+
+def _own_frame(filename: str) -> bool:
+    filename = os.path.abspath(filename)
+    return filename.startswith(_ROOT) and "site-packages" not in filename and filename != _SELF
+
+
+class LoopWatchdog:
+    """
+    Finds code blocking the event loop. A heartbeat task on the loop ticks every `interval`; a thread
+    checks it and, while the loop has not ticked for longer than `threshold`, samples the loop thread's
+    stack. Each sample's time is charged to the callsite: the innermost frame of this application's code
+    (the line that made the blocking call, e.g. a sync ES search inside an async builder). Every blocking
+    episode over the threshold is logged once, with its stack, when the loop recovers.
+    """
+
+    def __init__(self, enabled: bool = False, threshold: float = 0.1, interval: float = 0.01, top: int = 20):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.episodes = 0
+        self.blocked_seconds = 0.0
+        self.max_blocked = 0.0
+        self._callsites = {}
+        self._beat = 0.0
+        self._loop_thread: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        if "enabled" in config:
+            self.enabled = str(config["enabled"]).strip().lower() in ("1", "true", "yes", "on")
+        self.threshold = float(config.get("threshold", self.threshold))
+        self.interval = float(config.get("interval", self.interval))
+        self.top = int(config.get("top", self.top))
+
+    def start(self) -> None:
+        """Watch the running loop (call from a coroutine on it)."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stopping.clear()
+        self._heartbeat = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._heartbeat.cancel()
+        try:
+            await self._heartbeat
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(self._thread.join)
+        self._heartbeat = self._thread = None
+
+    async def _tick(self) -> None:
+        while True:
+            self._beat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self) -> None:
+        episode = None  # [start, stack, callsite seconds of this episode]
+        last_sample = None
+        while not self._stopping.wait(self.interval):
+            now = time.perf_counter()
+            lag = now - self._beat - self.interval
+            if lag <= self.threshold:
+                if episode is not None:
+                    self._finish(episode, now)
+                    episode = None
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            if episode is None:
+                # the loop has been stuck since the missed tick: charge all of it to this first sample
+                episode = [self._beat + self.interval, stack, {}]
+                elapsed = lag
+            else:
+                elapsed = now - last_sample
+            last_sample = now
+            site = next((f for f in reversed(stack) if _own_frame(f.filename)), stack[-1])
+            key = f"{os.path.relpath(os.path.abspath(site.filename), _ROOT)}:{site.lineno} in {site.name}"
+            episode[2][key] = episode[2].get(key, 0.0) + elapsed
+            stats = self._callsites.setdefault(key, {"samples": 0, "seconds": 0.0, "episodes": 0, "max": 0.0,
+                                                     "line": site.line})
+            stats["samples"] += 1
+            stats["seconds"] += elapsed
+        if episode is not None:
+            self._finish(episode, time.perf_counter())
+
+    def _finish(self, episode, now: float) -> None:
+        started, stack, sites = episode
+        blocked = now - started
+        self.episodes += 1
+        self.blocked_seconds += blocked
+        self.max_blocked = max(self.max_blocked, blocked)
+        for key, seconds in sites.items():
+            stats = self._callsites[key]
+            stats["episodes"] += 1
+            stats["max"] = max(stats["max"], seconds)
+        worst = max(sites, key=sites.get)
+        # the frames of the running callback, below the loop's own
+        loop_frames = [i for i, f in enumerate(stack) if os.sep + "asyncio" + os.sep in f.filename]
+        callback = stack[loop_frames[-1] + 1:] if loop_frames else stack
+        logger.warning("Event loop blocked for %.3fs, mostly at %s\n%s", blocked, worst,
+                       "".join(traceback.format_list(callback[-12:] or stack[-12:])))
+
+    def stats(self) -> dict:
+        ranked = sorted(list(self._callsites.items()), key=lambda item: item[1]["seconds"], reverse=True)[:self.top]
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "episodes": self.episodes,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "max_blocked": round(self.max_blocked, 3),
+            "callsites": [{"callsite": key, "line": s["line"], "episodes": s["episodes"], "samples": s["samples"],
+                           "seconds": round(s["seconds"], 3), "max": round(s["max"], 3)} for key, s in ranked],
+        }
+
+
+loop_watchdog = LoopWatchdog()
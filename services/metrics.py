@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, \
+    generate_latest, multiprocess
+
+from utils.mapping import map_brand
+
+logger = logging.getLogger("services.metrics")
+
+# with PROMETHEUS_MULTIPROC_DIR set (before the workers start), every worker writes its samples there and /metrics
+# of any worker reports the sum over all of them
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+ES_FAMILIES = ("attributes", "elements", "products", "producttables", "hierarchies")
+_FAMILY = re.compile(r"systemair_ds_([a-z]+)_")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency until the response headers",
+                            ["method", "route", "brand", "status"], buckets=LATENCY_BUCKETS)
+ES_LATENCY = Histogram("es_request_duration_seconds", "ES round trip latency per index family",
+                       ["family", "kind"], buckets=LATENCY_BUCKETS)
+ES_SEARCHES = Counter("es_searches", "Searches sent to ES per index family (one per msearch body)", ["family"])
+DB_LATENCY = Histogram("db_query_duration_seconds", "DBConnection.aexecute_query latency, queue wait included",
+                       buckets=LATENCY_BUCKETS)
+DB_EXECUTOR = Gauge("db_executor_queries", "DB queries running on / queued for an executor worker", ["state"],
+                    multiprocess_mode="livesum")
+LOOP_LAG = Histogram("event_loop_lag_seconds", "Delay of a sleeping task waking up on the event loop",
+                     buckets=LAG_BUCKETS)
+LOOP_LAG_MAX = Gauge("event_loop_lag_max_seconds", "Largest event loop lag of the last sample interval",
+                     multiprocess_mode="max")
+CACHE_HITS = Gauge("cache_hits", "Lookups answered by the cache since the worker started", ["cache"],
+                   multiprocess_mode="livesum")
+CACHE_LOOKUPS = Gauge("cache_lookups", "Lookups of the cache since the worker started", ["cache"],
+                      multiprocess_mode="livesum")
+BUILDS_INFLIGHT = Gauge("entity_builds_inflight", "Entity builds in flight (single flight leaders)",
+                        multiprocess_mode="livesum")
+
+
+def brand_label(brand: Optional[str]) -> str:
+    """The lowercased brand when map_brand knows it, otherwise "-": a route may answer a made-up brand
+    (e.g. a 200 with an empty list), and every distinct label value would be a new time series."""
+    try:
+        map_brand(brand or "")
+    except ValueError:
+        return "-"
+    return brand.lower()
+
+
+def index_family(index) -> str:
+    """Index family of an index name (or comma separated list): attributes, elements, ..., mixed or other."""
+    names = index.split(",") if isinstance(index, str) else list(index or ())
+    families = set()
+    for name in names:
+        match = _FAMILY.match(name.strip())
+        families.add(match.group(1) if match and match.group(1) in ES_FAMILIES else "other")
+    if len(families) == 1:
+        return families.pop()
+    return "mixed" if families else "other"
+
+
+def observe_es(kind: str, index, started: float, searches: int = 1) -> None:
+    family = index_family(index)
+    ES_LATENCY.labels(family, kind).observe(time.perf_counter() - started)
+    ES_SEARCHES.labels(family).inc(searches)
+
+
+def observe_msearch(body: list, started: float) -> None:
+    """One msearch round trip, under the family of its searches (mixed if they span several)."""
+    indices = [header.get("index", "") for header in body[::2]]
+    families = {index_family(index) for index in indices}
+    family = families.pop() if len(families) == 1 else "mixed"
+    ES_LATENCY.labels(family, "msearch").observe(time.perf_counter() - started)
+    for index in indices:
+        ES_SEARCHES.labels(index_family(index)).inc()
+
+
+def _hits_misses(stats: dict) -> tuple:
+    return stats["hits"], stats["misses"]
+
+
+class Metrics:
+    """
+    /metrics exposition and the per-worker sampler of gauges that have no natural update point (event loop
+    lag, DB executor queue, cache counters, in-flight builds).
+    """
+
+    def __init__(self, enabled: bool = True, sample_interval: float = 1.0):
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self.db = None
+        self._task: Optional[asyncio.Task] = None
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        if "enabled" in config:
+            self.enabled = str(config["enabled"]).strip().lower() in ("1", "true", "yes", "on")
+        self.sample_interval = float(config.get("sample_interval", self.sample_interval))
+
+    def observe_request(self, method: str, route: Optional[str], brand: Optional[str], status: int,
+                        seconds: float) -> None:
+        if not self.enabled:
+            return
+        REQUEST_LATENCY.labels(method, route or "unmatched", brand_label(brand), str(status)).observe(seconds)
+
+    def start(self, db) -> None:
+        self.db = db
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if MULTIPROCESS:
+            multiprocess.mark_process_dead(os.getpid())
+
+    async def _sample(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.sample_interval)
+            lag = max(time.perf_counter() - started - self.sample_interval, 0.0)
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_MAX.set(lag)
+            try:
+                self._sample_gauges()
+            except Exception:
+                logger.warning("Could not sample metrics", exc_info=True)
+
+    def _sample_gauges(self) -> None:
+        # imported here: the caches import the ES layer, which reports to this module
+        from services.element_previews import element_previews
+        from services.reference_cache import reference_cache
+        from services.request_memo import memo_totals
+        from services.response_cache import entity_responses
+        from services.single_flight import entity_flight
+        from services.uom_cache import uom_cache
+
+        if self.db is not None:
+            pool = self.db.pool_stats()
+            DB_EXECUTOR.labels("running").set(pool["in_use"])
+            DB_EXECUTOR.labels("queued").set(pool["waiting"])
+        reference, flight, memo = reference_cache.stats(), entity_flight.stats(), memo_totals.stats()
+        caches = {
+            "reference": (reference["hits"] + reference["stale_hits"], reference["misses"]),
+            "uom": _hits_misses(uom_cache.stats()),
+            "element_previews": _hits_misses(element_previews.stats()),
+            "responses": _hits_misses(entity_responses.stats()),
+            "request_memo": (memo["calls_saved"], memo["calls"] - memo["calls_saved"]),
+            "single_flight": (flight["coalesced"] + flight["reused"], flight["builds"]),
+        }
+        for name, (hits, misses) in caches.items():
+            CACHE_HITS.labels(name).set(hits)
+            CACHE_LOOKUPS.labels(name).set(hits + misses)
+        BUILDS_INFLIGHT.set(flight["inflight"])
+
+    def exposition(self) -> tuple:
+        """(body, content type) of /metrics."""
+        if MULTIPROCESS:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+metrics = Metrics()
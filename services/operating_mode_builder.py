@@ -1,5 +1,5 @@
 import logging
-from typing import Optional, List, Dict, Union, Any
+from typing import Optional, List, Dict, Union, Any, FrozenSet
 from models.operating_mode import OperatingMode, Certification, Attribute, Section, Price, Buttons,SectionContent
 from queries.operating_mode_queries import query_operating_mode_by_id, query_attributes, query_texts, query_images,query_price,query_attr_buttons,query_attr_definitions,query_operating_mode_attributes,query_cert_definitions,query_certifications,query_image_byId,query_wiringSection
 from services.elasticsearch_service import ESConnection
@@ -9,16 +9,29 @@ import re
 import json
 import locale
 import xml.etree.ElementTree as ET
+from services.es_batcher import batched_searches
+from services.reference_cache import reference_cache, cached_search, query_key
+from services.price_cache import price_snapshot
+from services.element_previews import element_previews
+from utils.fieldsets import assemble, wants
 
 logger = logging.getLogger(__name__)
 
+# fields derived from the attribute documents / the text elements: without them, those fetches are skipped
+OPERATING_MODE_ATTRIBUTE_FIELDS = frozenset({"expired", "vendorId", "name", "tagline", "releaseDate", "selectionTool",
+                                             "magicadBim", "default"})
+OPERATING_MODE_TEXT_FIELDS = frozenset({"description", "specificationText"})
+
 
 class OperatingModeBuilder:
     def __init__(self, es_client: ESConnection, db_client: DBConnection):
         self.es = es_client
         self.db = db_client
 
-    async def build_operating_mode(self, identifier: str, lang: str, brand: str, market:str) -> Optional[OperatingMode]:
+    @batched_searches
+    async def build_operating_mode(self, identifier: str, lang: str, brand: str, market:str,
+                                   fields: Optional[FrozenSet[str]] = None) -> Optional[OperatingMode]:
+        """The operating mode, or with `fields` (see utils.fieldsets) only those fields, skipping the fetches they do not need."""
         try:
             operating_mode = await self.get_operating_mode(identifier, lang)
             if not operating_mode:
@@ -29,88 +42,44 @@ class OperatingModeBuilder:
             #if ref is not there do not proceed
             ref_operating_mode = await self.get_operating_mode(ref_operating_mode_id, lang) if ref_operating_mode_id else None
             identifiers = [i for i in [operating_mode_id, ref_operating_mode_id] if i is not None]
-            index = f"systemair_ds_attributes_{lang}"
-            raw_attributes  = list(self.es.getScrollObject(index, query_attributes(identifiers), 10000, "1m"))
+            raw_attributes, texts = [], []
+            if wants(fields, OPERATING_MODE_ATTRIBUTE_FIELDS):
+                index = f"systemair_ds_attributes_{lang}"
+                raw_attributes  = await self.es.agetScrollObject(index, query_attributes(identifiers), 10000, "1m")
             #print(attributes)
-            get_texts_ids = await self.get_texts_ids(ref_operating_mode, operating_mode)
-            index = f"systemair_ds_elements_{lang}"
-            texts_res = self.es.search(index, query_texts(get_texts_ids))
-            texts = texts_res.get("hits", {}).get("hits", [])
-
-            (
-                parent_id,
-                price,
-                certifications,
-                parsed_attributes,
-                sections,
-                expired,
-                vendor_id,
-                name,
-                short_name,
-                description,
-                specification,
-                tagline,
-                active,
-                release_date,
-                selectionTool,
-                magicadBim,
-                default,
-                approved,
-                sort,
-                images,
-                buttons,
-                skuId
-            ) = await asyncio.gather(
-                self.get_parent_id(operating_mode),
-                self.parse_price_async(operating_mode, market),
-                self.parse_certifications_async(identifiers, lang),
-                self.get_additional_attributes(operating_mode,ref_operating_mode,lang,brand),
-                self.parse_sections_async(operating_mode,ref_operating_mode,lang,brand),
-                self.get_expired_status(raw_attributes,market),
-                self.get_vendor_id(raw_attributes),
-                self.get_name(raw_attributes, operating_mode),
-                self.get_short_name(operating_mode),
-                self.get_description(texts),
-                self.get_specification(texts),
-                self.get_tagline(raw_attributes),
-                self.get_active_status(ref_operating_mode_id),
-                self.get_release_date(raw_attributes),
-                self.get_selection_tool(raw_attributes),
-                self.get_magicadBim(raw_attributes),
-                self.get_default_operating_mode_id(raw_attributes),
-                self.get_approved_status(operating_mode),
-                self.get_sort_order(operating_mode),
-                self.get_images(ref_operating_mode,operating_mode,lang),
-                self.get_buttons(identifiers, lang),
-                self.get_sku_id(operating_mode)
-            )
-
-            return OperatingMode(
-                id=str(operating_mode_id),
-                parentId=parent_id,
-                vendorId=vendor_id,
-                name=name,
-                shortName=short_name,
-                description=description,
-                specificationText=specification,
-                tagline=tagline,
-                active=active,
-                expired=expired,
-                approved=approved,
-                releaseDate=release_date,
-                selectionTool=selectionTool,
-                designTool=operating_mode.get("designTool", False),
-                magicadBim=magicadBim,
-                sort=sort,
-                price=price,
-                default=default,
-                certifications=certifications,
-                images=images,
-                attributes=parsed_attributes,
-                sections=sections,
-                skuId=skuId,
-                buttons=buttons
-            )
+            if wants(fields, OPERATING_MODE_TEXT_FIELDS):
+                get_texts_ids = await self.get_texts_ids(ref_operating_mode, operating_mode)
+                index = f"systemair_ds_elements_{lang}"
+                texts_res = await self.es.asearch(index, query_texts(get_texts_ids))
+                texts = texts_res.get("hits", {}).get("hits", [])
+
+            return await assemble(OperatingMode, {
+                "id": str(operating_mode_id),
+                "designTool": operating_mode.get("designTool", False),
+            }, {
+                "parentId": lambda: self.get_parent_id(operating_mode),
+                "price": lambda: self.parse_price_async(operating_mode, market),
+                "certifications": lambda: self.parse_certifications_async(identifiers, lang),
+                "attributes": lambda: self.get_additional_attributes(operating_mode,ref_operating_mode,lang,brand),
+                "sections": lambda: self.parse_sections_async(operating_mode,ref_operating_mode,lang,brand),
+                "expired": lambda: self.get_expired_status(raw_attributes,market),
+                "vendorId": lambda: self.get_vendor_id(raw_attributes),
+                "name": lambda: self.get_name(raw_attributes, operating_mode),
+                "shortName": lambda: self.get_short_name(operating_mode),
+                "description": lambda: self.get_description(texts),
+                "specificationText": lambda: self.get_specification(texts),
+                "tagline": lambda: self.get_tagline(raw_attributes),
+                "active": lambda: self.get_active_status(ref_operating_mode_id),
+                "releaseDate": lambda: self.get_release_date(raw_attributes),
+                "selectionTool": lambda: self.get_selection_tool(raw_attributes),
+                "magicadBim": lambda: self.get_magicadBim(raw_attributes),
+                "default": lambda: self.get_default_operating_mode_id(raw_attributes),
+                "approved": lambda: self.get_approved_status(operating_mode),
+                "sort": lambda: self.get_sort_order(operating_mode),
+                "images": lambda: self.get_images(ref_operating_mode,operating_mode,lang),
+                "buttons": lambda: self.get_buttons(identifiers, lang),
+                "skuId": lambda: self.get_sku_id(operating_mode)
+            }, fields)
 
         except Exception as e:
             logger.exception(f"Failed to build operating_mode {identifier}: {str(e)}")
@@ -119,7 +88,7 @@ class OperatingModeBuilder:
     async def get_operating_mode(self, identifier: str, lang: str) -> Optional[dict]:
         index = f"systemair_ds_variants_{lang}"
         try:
-            response = self.es.search(index, query_operating_mode_by_id(identifier))
+            response = await self.es.asearch(index, query_operating_mode_by_id(identifier))
             hits = response.get("hits", {}).get("hits", [])
             return hits[0]["_source"] if hits else None
         except Exception as e:
@@ -313,7 +282,7 @@ class OperatingModeBuilder:
         index = f"systemair_ds_elements_{lang}"
         res = []
         try:
-            response = self.es.search(index, query_images(resolved_epim_ids))
+            response = await self.es.asearch(index, query_images(resolved_epim_ids))
             for hit in response.get("hits", {}).get("hits", []):
                 res.append(hit["_source"].get("phyPreviewFile"))
             return res
@@ -328,8 +297,13 @@ class OperatingModeBuilder:
         then formats it as: { ondemand, string, float, currency }.
         Returns on-demand price if price is less than 1 or if price cannot be converted to a number.
         """
-        rows = self.db.execute_query(query_price(), {"productnr": operating_mode.get("productNr")})
-        if not rows:
+        product_nr = operating_mode.get("productNr")
+        if price_snapshot.loaded:
+            price = price_snapshot.lookup(product_nr, market)
+        else:
+            rows = await self.db.aexecute_query(query_price(), {"productnr": product_nr})
+            price = (rows[0][str(market+"_PRICE")], rows[0][str(market+"_CURRENCY")]) if rows else None
+        if price is None:
             # no price → on-demand
             return Price(
                 ondemand=True,
@@ -338,9 +312,7 @@ class OperatingModeBuilder:
                 currency=None,
             )
 
-        row = rows[0]
-        raw = row[str(market+"_PRICE")]
-        curr = row[str(market+"_CURRENCY")]
+        raw, curr = price
 
         # numeric value
         p = float(raw)
@@ -375,7 +347,7 @@ class OperatingModeBuilder:
         From a list of ES attribute hits, return only those contain  "-CERT-"
         whose first 'value' == 1, as Certification objects.
         """
-        cert_table = self.es.search(f"systemair_ds_producttables_{lang}", query_cert_definitions())
+        cert_table = await cached_search(self.es, f"systemair_ds_producttables_{lang}", query_cert_definitions())
         hits = cert_table.get("hits", {}).get("hits", [])
         table_rows = hits[0]["_source"].get("table", [])[0].get("rows", [])
         # Build seq → label mapping from row 0
@@ -404,8 +376,12 @@ class OperatingModeBuilder:
             }
         result: List[Certification] = []
         try:
-            response = self.es.search(f"systemair_ds_attributes_{lang}", query_certifications(identifiers))
-            for att in response.get("hits", {}).get("hits", []):
+            response = await self.es.asearch(f"systemair_ds_attributes_{lang}", query_certifications(identifiers))
+            hits = response.get("hits", {}).get("hits", [])
+            # every certification image in one lookup
+            images = await element_previews.resolve(
+                self.es, lang, [str(att.get("_source", att).get("flag1ObjeId", "")) for att in hits], "phyPreviewFile")
+            for att in hits:
                 # Some callers pass the raw dict or an ES hit—normalize both
                 src = att.get("_source", att)
 
@@ -414,7 +390,7 @@ class OperatingModeBuilder:
                     id=str(src.get("attributeId", "")),
                     name=name,
                     label= merged_dict[name]["label"],
-                    image= await self.get_image_byId(str(src.get("flag1ObjeId", "")),lang),
+                    image= images[str(src.get("flag1ObjeId", ""))],
                     text=merged_dict[name]["nullFallbackText"]
                 )
                 result.append(cert)
@@ -440,7 +416,7 @@ class OperatingModeBuilder:
         #description
         #wiring
         texts_ids=await self.get_texts_ids(ref_operating_mode, operating_mode)
-        wiringText=self.es.search([f"systemair_ds_elements_{lang}",f"systemair_ds_elements_eng_glo"],query_wiringSection(texts_ids))
+        wiringText=await self.es.asearch([f"systemair_ds_elements_{lang}",f"systemair_ds_elements_eng_glo"],query_wiringSection(texts_ids))
         hits = wiringText.get("hits", {}).get("hits", [])
         for hit in hits:
             xmlText=hit["_source"].get("xmlText")
@@ -450,7 +426,7 @@ class OperatingModeBuilder:
                 "content": jsonText
             })
         images_ids= await self.get_images_ids(ref_operating_mode, operating_mode, lang)
-        wiringImages=self.es.search(f"systemair_ds_elements_{lang}",query_wiringSection(images_ids))
+        wiringImages=await self.es.asearch(f"systemair_ds_elements_{lang}",query_wiringSection(images_ids))
         image=""
         for hit in wiringImages.get("hits", {}).get("hits", []):
             image=hit["_source"].get("phyPreviewFile")
@@ -471,12 +447,9 @@ class OperatingModeBuilder:
         prodtables_ids = await self.get_prodtable_ids(ref_operating_mode, operating_mode)
         index = f"systemair_ds_producttables_{lang}"
 
-        response = self.es.search(index, query_attr_definitions(prodtables_ids, brand))
-        hits = response.get("hits", {}).get("hits", [])
+        definitions = await self.get_att_definitions(index, query_attr_definitions(prodtables_ids, brand))
         techs={}
-        for hit in hits:
-            table = hit["_source"].get("table", [])
-            att_definitions = await  self.parse_att_definitions(table)
+        for att_definitions in definitions:
             for seq, att in att_definitions.items():
                 if att["attribute"][0]=="dummy-tab":
                     sec=att["label"][0]
@@ -490,9 +463,8 @@ class OperatingModeBuilder:
             ))
 
             att_index = f"systemair_ds_attributes_{lang}"
-            att_response = list(
-                self.es.getScrollObject(att_index, query_operating_mode_attributes(unique_attributes, variants), 10000,
-                                        "1m"))
+            att_response = await self.es.agetScrollObject(att_index, query_operating_mode_attributes(unique_attributes, variants),
+                                                          10000, "1m")
             # for hit in att_response.get("hits", {}).get("hits", []):
             rows = []
             for entry in tech:
@@ -647,11 +619,7 @@ class OperatingModeBuilder:
             ) for section in sections
         ]
     async def get_image_byId(self, id:str,lang: str) -> Optional[str]:
-        response = self.es.search(f"systemair_ds_elements_{lang}", query_image_byId(id))
-        hits = response.get("hits", {}).get("hits", [])
-        if hits:
-            return hits[0]["_source"].get("phyPreviewFile")
-        return ""
+        return await element_previews.resolve_one(self.es, lang, id, "phyPreviewFile")
     async def get_buttons(self, identifiers: List[int], lang: str) -> List[Buttons]:
         """
         Fetch and parse button attributes for a SKU.
@@ -669,7 +637,7 @@ class OperatingModeBuilder:
         try:
             # Query button attributes from Elasticsearch
             index = f"systemair_ds_attributes_{lang}"
-            response = self.es.search(index, query_attr_buttons(identifiers))
+            response = await self.es.asearch(index, query_attr_buttons(identifiers))
             hits = response.get("hits", {}).get("hits", [])
 
             if not hits:
@@ -678,6 +646,7 @@ class OperatingModeBuilder:
             # Group button attributes by their base name (without -LNK or -IMG suffix)
             from collections import defaultdict
             grouped = defaultdict(lambda: {"icon": None, "url": None})
+            icon_ids = {}
 
             for hit in hits:
                 src = hit.get("_source", {})
@@ -699,7 +668,14 @@ class OperatingModeBuilder:
                 if suffix == "LNK":
                     grouped[base]["url"] = val
                 elif suffix == "IMG":
-                    grouped[base]["icon"] = await self.get_image_byId(src.get("flag0ObjeId", ""), lang)
+                    # creates the entry in hit order; the icon itself is resolved below
+                    grouped[base]["icon"] = None
+                    icon_ids[base] = src.get("flag0ObjeId", "")
+
+            # every icon in one lookup
+            icons = await element_previews.resolve(self.es, lang, icon_ids.values(), "phyPreviewFile")
+            for base, icon_id in icon_ids.items():
+                grouped[base]["icon"] = icons[str(icon_id)]
 
             # Button type to name mapping
             BUTTON_MAP = {
@@ -746,6 +722,19 @@ class OperatingModeBuilder:
                 for obj in assignment["objects"]:
                     resolved_epim_ids.append(obj["epimId"])
         return resolved_epim_ids
+    async def get_att_definitions(self, index: str, query: dict) -> List[Dict[int, Dict[str, list]]]:
+        """
+        parse_att_definitions output for every producttables hit of `query`, in hit order.
+        Cached process-wide per (index, query); the result is shared, do not mutate it.
+        """
+        async def load():
+            response = await cached_search(self.es, index, query)
+            return [
+                await self.parse_att_definitions(hit["_source"].get("table", []))
+                for hit in response.get("hits", {}).get("hits", [])
+            ]
+
+        return await reference_cache.get(("om_att_definitions", *query_key(index, query)), load)
     async def parse_att_definitions(self, table: list) -> Dict[int, Dict[str, list]]:
         """
         Collect label and attribute lists for each seqorderNr from all rows and cells.
@@ -810,24 +799,18 @@ class OperatingModeBuilder:
         index = f"systemair_ds_producttables_{lang}"
         grouped = {}
         try:
-            response = self.es.search(index, query_attr_definitions(prodtables_ids,brand))
-            hits = response.get("hits", {}).get("hits", [])
-            if not hits:
+            definitions = await self.get_att_definitions(index, query_attr_definitions(prodtables_ids,brand))
+            if not definitions:
                 return []
-            for hit in hits:
-                table = hit["_source"].get("table", [])
-
-                # Run the parser
-                sku_att_definitions = await  self.parse_att_definitions(table)
+            for sku_att_definitions in definitions:
 
                 unique_attributes = list(set(
                     attr for data in sku_att_definitions.values() for attr in data["attribute"]
                 ))
 
                 att_index = f"systemair_ds_attributes_{lang}"
-                att_response = list(
-                    self.es.getScrollObject(att_index, query_operating_mode_attributes(unique_attributes, skus), 10000,
-                                            "1m"))
+                att_response = await self.es.agetScrollObject(att_index, query_operating_mode_attributes(unique_attributes, skus),
+                                                              10000, "1m")
                 # for hit in att_response.get("hits", {}).get("hits", []):
                 for hit in att_response:
                     src = hit["_source"]
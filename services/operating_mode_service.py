@@ -1,19 +1,24 @@
 import logging
-from typing import List, Optional
+from typing import FrozenSet, List, Optional
 from models.operating_mode import OperatingMode, OperatingModeListResponse
 from services.operating_mode_builder import OperatingModeBuilder
 from core.environment import env
 from services.elasticsearch_service import ESConnection
 from queries.operating_mode_queries import query_operating_modes
+from services.single_flight import entity_flight
+from services.export_service import CatalogueExport
+from contextlib import aclosing
 from quart import current_app
 logger = logging.getLogger(__name__)
 
 
 
 # Single OperatingMode by ID or slug
-async def get_operating_mode_by_id(identifier: str, lang: str, brand: str, market:str) -> Optional[OperatingMode]:
+async def get_operating_mode_by_id(identifier: str, lang: str, brand: str, market:str,
+                                   fields: Optional[FrozenSet[str]] = None) -> Optional[OperatingMode]:
     builder = OperatingModeBuilder(current_app.es,current_app.db)
-    return await builder.build_operating_mode(identifier, lang, brand, market)
+    return await entity_flight.do(("operating_mode", str(identifier), lang, brand, market, fields),
+                                  lambda: builder.build_operating_mode(identifier, lang, brand, market, fields))
 
 # Paginated list of operating_modes
 async def get_operating_modes_old(offset: int, limit: int, lang: str) -> OperatingModeListResponse:
@@ -52,7 +57,7 @@ async def get_operating_modes(offset=0, limit=10, brand="systemair", lang="deu_d
         "_source": ["epimId"]  # Corrected here
     }
 
-    response = es.search(index, body)
+    response = await es.asearch(index, body)
     hits = response.get("hits", {}).get("hits", [])
     total = response.get("hits", {}).get("total", {}).get("value", 0)
 
@@ -69,21 +74,9 @@ async def get_operating_modes(offset=0, limit=10, brand="systemair", lang="deu_d
         items=items
     )
 # Async generator for streaming
-async def stream_operating_modes(lang: str):
-    index = f"systemair_ds_hierarchies_{lang}"
-    offset = 0
-    size = 50
-
-    while True:
-        response = es.search(index=index, body=query_operating_modes(offset, size))
-        hits = response.get("hits", {}).get("hits", [])
-        if not hits:
-            break
-
-        for hit in hits:
-            operating_mode_id = hit["_source"]["id"]
-            operating_mode = await builder.build_operating_mode(operating_mode_id, lang)
-            if operating_mode:
+async def stream_operating_modes(lang: str, brand: str, market: str):
+    export = CatalogueExport(current_app.es, current_app.db, "operating-modes", lang, brand, market)
+    async with aclosing(export.pages()) as pages:
+        async for operating_modes in pages:
+            for operating_mode in operating_modes:
                 yield operating_mode
-
-        offset += size
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import math
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from queries.sku_queries import query_latest_prices, query_prices_since
+
+logger = logging.getLogger("services.price_cache")
+
+_NAN = float("nan")
+
+
+def normalize_product_nr(product_nr) -> str:
+    # SQL Server compares PRODUCT_NUMBER case-insensitively and ignores trailing blanks
+    return str(product_nr).rstrip().lower()
+
+
+def _as_float(raw) -> float:
+    try:
+        return float(raw)
+    except (ValueError, TypeError):
+        return _NAN
+
+
+class _PriceTable:
+    """Latest vmps_ERP_prices row per product, stored column-wise: one slot per product and,
+    per market column prefix (e.g. "MARKET_005"), a float array and a currency-id array."""
+
+    __slots__ = ("slots", "row_ids", "prices", "currencies")
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.row_ids = array("q")
+        self.prices: Dict[str, array] = {}
+        self.currencies: Dict[str, array] = {}
+
+
+class PriceSnapshot:
+    """
+    In-memory copy of the latest price per product for every market column of vmps_ERP_prices.
+
+    Bulk loaded at startup, then kept current by polling for rows with a higher `id` (price
+    rows are append-only; the latest row per product wins). A periodic full reload picks up
+    in-place edits and deletions. Until the first load succeeds `loaded` is False and callers
+    fall back to querying the DB per product. `change_id` grows with every load and every poll that
+    applied rows, so caches of priced responses can tell whether a price may have changed.
+    """
+
+    def __init__(self, poll_interval: float = 60.0, full_reload_interval: float = 3600.0):
+        self.enabled = True
+        self.poll_interval = poll_interval
+        self.full_reload_interval = full_reload_interval
+        self.last_id = 0
+        self.polled_rows = 0
+        self.poll_errors = 0
+        self.change_id = 0
+        self._table: Optional[_PriceTable] = None
+        self._loaded_at = 0.0
+        self._currency_table: List[Optional[str]] = [None]
+        self._currency_ids: Dict[Optional[str], int] = {None: 0}
+        self._poll_task: Optional[asyncio.Task] = None
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.enabled = str(config.get("enabled", "true")).strip().lower() in ("1", "true", "yes", "on")
+        self.poll_interval = float(config.get("poll_interval", self.poll_interval))
+        self.full_reload_interval = float(config.get("full_reload_interval", self.full_reload_interval))
+
+    @property
+    def loaded(self) -> bool:
+        return self._table is not None
+
+    def lookup(self, product_nr, prefix: str) -> Optional[Tuple[Optional[float], Optional[str]]]:
+        """
+        (price, currency) from the latest price row of product_nr for the market column prefix,
+        or None when the product has no price row. price is None where the column is NULL or
+        not numeric. Raises KeyError for an unknown column prefix, like indexing the row would.
+        """
+        table = self._table
+        slot = table.slots.get(normalize_product_nr(product_nr)) if product_nr is not None else None
+        if slot is None:
+            return None
+        if prefix not in table.prices:
+            raise KeyError(f"{prefix}_PRICE")
+        price = table.prices[prefix][slot]
+        currency = self._currency_table[table.currencies[prefix][slot]]
+        return (None if math.isnan(price) else price), currency
+
+    async def load(self, db) -> None:
+        started = time.perf_counter()
+        rows = await db.aexecute_query(query_latest_prices())
+        # Why: building the columns touches every market of every product; keep it off the event loop
+        table, last_id = await asyncio.to_thread(self._build, rows)
+        self._table = table
+        self.last_id = last_id
+        self.change_id += 1
+        self._loaded_at = time.monotonic()
+        logger.info("Price snapshot loaded: %d products, %d market columns in %.2fs",
+                    len(table.slots), len(table.prices), time.perf_counter() - started)
+
+    def _build(self, rows: List[dict]) -> Tuple[_PriceTable, int]:
+        table = _PriceTable()
+        prefixes = self._prefixes(rows)
+        last_id = 0
+        for row in rows:
+            last_id = max(last_id, self._apply(table, row, prefixes))
+        return table, last_id
+
+    async def poll(self, db) -> int:
+        rows = await db.aexecute_query(query_prices_since(), {"last_id": self.last_id})
+        prefixes = self._prefixes(rows)
+        for row in rows:
+            self.last_id = max(self.last_id, self._apply(self._table, row, prefixes))
+        if rows:
+            self.change_id += 1
+        self.polled_rows += len(rows)
+        return len(rows)
+
+    @staticmethod
+    def _prefixes(rows: List[dict]) -> List[str]:
+        if not rows:
+            return []
+        return [column[:-len("_PRICE")] for column in rows[0] if column.endswith("_PRICE")]
+
+    def _apply(self, table: _PriceTable, row: dict, prefixes: List[str]) -> int:
+        row_id = int(row.get("id") or 0)
+        key = normalize_product_nr(row.get("PRODUCT_NUMBER"))
+        slot = table.slots.get(key)
+        if slot is None:
+            slot = len(table.row_ids)
+            table.slots[key] = slot
+            table.row_ids.append(row_id)
+            for column in table.prices.values():
+                column.append(_NAN)
+            for column in table.currencies.values():
+                column.append(0)
+        elif row_id < table.row_ids[slot]:
+            return row_id
+        table.row_ids[slot] = row_id
+        for prefix in prefixes:
+            if prefix not in table.prices:
+                table.prices[prefix] = array("d", [_NAN]) * len(table.row_ids)
+                table.currencies[prefix] = array("H", [0]) * len(table.row_ids)
+            table.prices[prefix][slot] = _as_float(row.get(f"{prefix}_PRICE"))
+            table.currencies[prefix][slot] = self._currency_id(row.get(f"{prefix}_CURRENCY"))
+        return row_id
+
+    def _currency_id(self, currency) -> int:
+        currency_id = self._currency_ids.get(currency)
+        if currency_id is None:
+            currency_id = len(self._currency_table)
+            self._currency_table.append(currency)
+            self._currency_ids[currency] = currency_id
+        return currency_id
+
+    async def start(self, db) -> None:
+        """Initial load plus the background poller; a failed load is retried by the poller."""
+        if not self.enabled:
+            return
+        try:
+            await self.load(db)
+        except Exception:
+            logger.exception("Initial price snapshot load failed; falling back to per-product price queries")
+        if self._poll_task is None and self.poll_interval > 0:
+            self._poll_task = asyncio.create_task(self._poll_loop(db))
+
+    async def _poll_loop(self, db) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                due = self.full_reload_interval > 0 and time.monotonic() - self._loaded_at >= self.full_reload_interval
+                if not self.loaded or due:
+                    await self.load(db)
+                else:
+                    await self.poll(db)
+            except Exception:
+                self.poll_errors += 1
+                logger.warning("Price snapshot refresh failed; serving the previous snapshot", exc_info=True)
+
+    async def stop(self) -> None:
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+
+    def stats(self) -> dict:
+        table = self._table
+        return {
+            "loaded": table is not None,
+            "products": len(table.slots) if table else 0,
+            "market_columns": len(table.prices) if table else 0,
+            "currencies": len(self._currency_table) - 1,
+            "last_id": self.last_id,
+            "change_id": self.change_id,
+            "polled_rows": self.polled_rows,
+            "poll_errors": self.poll_errors,
+        }
+
+
+price_snapshot = PriceSnapshot()
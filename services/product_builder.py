@@ -2,28 +2,39 @@ from sqlalchemy import false
 
 from models.product import Product, SkuOption, SkuValue
 from queries.product_queries import query_product_by_id,query_images,query_attributes,query_texts,query_sku_options_definitions, query_child_objects,query_child_objects_attributes,query_productNrs,query_secondaryParents
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Union, FrozenSet
 import logging
 import asyncio
 import re
 import json
 from collections import defaultdict
 from datetime import datetime, timezone
-from utils.utilities import inject_fallback_sort
+from services.lang_fallback import lang_fallback
+from services.es_batcher import batched_searches
+from services.reference_cache import cached_search
+from utils.fieldsets import assemble, sparse, wants
 logger = logging.getLogger(__name__)
 
+# fields derived from the attribute documents / the text elements: without them, those fetches are skipped
+PRODUCT_ATTRIBUTE_FIELDS = frozenset({"oldExternalIds", "shortName", "tagline", "hidden", "approved", "releaseDate",
+                                      "attributes"})
+PRODUCT_TEXT_FIELDS = frozenset({"description"})
+
 class ProductBuilder:
     def __init__(self, es_client):
         self.es = es_client
 
-    async def build_product(self, identifier: str, lang: str, brand: str ) -> Optional[Product]:
+    @batched_searches
+    async def build_product(self, identifier: str, lang: str, brand: str,
+                            fields: Optional[FrozenSet[str]] = None) -> Optional[Product]:
+        """The product, or with `fields` (see utils.fieldsets) only those fields, skipping the fetches they do not need."""
         try:
             product = await self.get_product(identifier, lang, brand)
             if not product:
                 return None
             # If product is deleted, return minimal Product with deleted=True
             if product.get('deleted'):
-                return Product(
+                return sparse(Product(
                     id=identifier,
                     parentId=product.get("parentHierarchy",None),
                     name=product.get("name",None),
@@ -33,7 +44,7 @@ class ProductBuilder:
                     hidden=False,
                     approved=False,
                     deleted=True
-                )
+                ), fields)
             product_id= identifier
             refProd_id=await self.get_ref_id(product)
             if refProd_id:
@@ -44,72 +55,38 @@ class ProductBuilder:
             pgrs = [h["id"] for h in product["hierarchies"]]
             pgrs.append(product_id)
             pgrs.append(refProd_id)
+            attributes, texts = [], []
             #get also the accessory attributes from above levels
-            indices, attQuery = inject_fallback_sort(query_attributes(pgrs), lang, "systemair_ds_attributes_","attributeParentId")
-            attributes_res = self.es.search(indices, attQuery)
-            attributes = attributes_res.get("hits", {}).get("hits", [])
+            if wants(fields, PRODUCT_ATTRIBUTE_FIELDS):
+                attributes_res = await lang_fallback.search(self.es, query_attributes(pgrs), lang,
+                                                            "systemair_ds_attributes_", "attributeParentId")
+                attributes = attributes_res.get("hits", {}).get("hits", [])
             #index = f"systemair_ds_attributes_{lang}"
             #attributes= list(self.es.getScrollObject(index, query_attributes(identifiers),10000,"1m"))
 
-            get_texts_ids=await self.get_texts_ids(refProd,product)
-            index=f"systemair_ds_elements_{lang}"
-            texts_res= self.es.search(index, query_texts(get_texts_ids))  
-            texts = texts_res.get("hits", {}).get("hits", [])            
-            (
-                parent_id,
-                old_external_ids,
-                name,
-                short_name,
-                description,
-                tagline,
-                sort,
-                active,
-                hidden,
-                approved,
-                release_date,
-                importance,
-                images,
-                sku_options,
-                attributes,
-                secondaryParents
-            ) = await asyncio.gather(
-                self.get_parent_id(product),
-                self.get_old_external_ids(attributes),
-                self.get_name(product),
-                self.get_short_name(attributes,product),
-                self.get_description(texts),
-                self.get_tagline(attributes),
-                self.get_sort_order(product),
-                self.get_active_status(refProd_id),
-                self.get_hidden_status(attributes),
-                self.get_approved_status(product,attributes),
-                self.get_release_date(attributes),
-                self.get_importance(product_id),
-                self.get_images(refProd,product,lang),
-                self.get_sku_options(refProd,product,lang),
-                self.get_additional_attributes(attributes),
-                self.get_secondary_parents(identifier,lang)
-            )
-
-            return Product(
-                id=product_id,
-                parentId=parent_id,
-                oldExternalIds=old_external_ids,
-                secondaryParents=secondaryParents,
-                name=name,
-                shortName=short_name,
-                description=description,
-                tagline=tagline,
-                sort=sort,
-                active=active,
-                hidden=hidden,
-                approved=approved,
-                releaseDate=release_date,
-                importance=importance,
-                images=images,
-                skuOptions=sku_options,
-                attributes=attributes
-            )
+            if wants(fields, PRODUCT_TEXT_FIELDS):
+                get_texts_ids=await self.get_texts_ids(refProd,product)
+                index=f"systemair_ds_elements_{lang}"
+                texts_res= await self.es.asearch(index, query_texts(get_texts_ids))  
+                texts = texts_res.get("hits", {}).get("hits", [])            
+            return await assemble(Product, {"id": product_id}, {
+                "parentId": lambda: self.get_parent_id(product),
+                "oldExternalIds": lambda: self.get_old_external_ids(attributes),
+                "name": lambda: self.get_name(product),
+                "shortName": lambda: self.get_short_name(attributes,product),
+                "description": lambda: self.get_description(texts),
+                "tagline": lambda: self.get_tagline(attributes),
+                "sort": lambda: self.get_sort_order(product),
+                "active": lambda: self.get_active_status(refProd_id),
+                "hidden": lambda: self.get_hidden_status(attributes),
+                "approved": lambda: self.get_approved_status(product,attributes),
+                "releaseDate": lambda: self.get_release_date(attributes),
+                "importance": lambda: self.get_importance(product_id),
+                "images": lambda: self.get_images(refProd,product,lang),
+                "skuOptions": lambda: self.get_sku_options(refProd,product,lang),
+                "attributes": lambda: self.get_additional_attributes(attributes),
+                "secondaryParents": lambda: self.get_secondary_parents(identifier,lang)
+            }, fields)
         except Exception as e:
             logger.exception(f"Error building product {identifier}: {str(e)}")
             return None
@@ -117,7 +94,7 @@ class ProductBuilder:
         res = []
         index = f"systemair_ds_hierarchies_{lang}"
         try:
-            response = self.es.search(index, query_secondaryParents(category_id))
+            response = await self.es.asearch(index, query_secondaryParents(category_id))
             hits = response.get("hits", {}).get("hits", [])
             for hit in hits:
                 parent = hit.get("_source", {}).get("parentHierarchy")
@@ -130,7 +107,7 @@ class ProductBuilder:
     async def get_product(self, identifier: str, lang: str, brand: str) -> Optional[dict]:
         index = f"systemair_ds_hierarchies_{lang}"
         try:
-            response = self.es.search(index,query_product_by_id(identifier,brand))
+            response = await self.es.asearch(index,query_product_by_id(identifier,brand))
             hits = response.get("hits", {}).get("hits", [])
             if not hits:
                 return None
@@ -248,7 +225,7 @@ class ProductBuilder:
         res = []
         #print(query_images(resolved_epim_ids))
         try:
-            response = self.es.search(index, query_images(resolved_epim_ids))
+            response = await self.es.asearch(index, query_images(resolved_epim_ids))
             hits = response.get("hits", {}).get("hits", [])
             if not hits:
                 return []
@@ -271,7 +248,7 @@ class ProductBuilder:
         res = []
         grouped = defaultdict(lambda: defaultdict(list))
         try:
-            response = self.es.search(index, query_sku_options_definitions(prodtables_ids))
+            response = await cached_search(self.es, index, query_sku_options_definitions(prodtables_ids))
             hits = response.get("hits", {}).get("hits", [])
             if not hits:
                 return []
@@ -291,8 +268,8 @@ class ProductBuilder:
                 
                 productNrs=await self.get_productNrs(skus,lang)
 
-                indices, attQuery = inject_fallback_sort(query_child_objects_attributes(unique_attributes,skus), lang,"systemair_ds_attributes_", "attributeParentId")
-                attributes_res = self.es.search(indices, attQuery)
+                attributes_res = await lang_fallback.search(self.es, query_child_objects_attributes(unique_attributes,skus), lang,
+                                                            "systemair_ds_attributes_", "attributeParentId")
                 att_response = attributes_res.get("hits", {}).get("hits", [])
 
                 #att_index=f"systemair_ds_attributes_{lang}"
@@ -444,7 +421,7 @@ class ProductBuilder:
         result = {}
     
         try:
-            response = list(self.es.getScrollObject(index, query_child_objects(product_id),10000,"1m"))
+            response = await self.es.agetScrollObject(index, query_child_objects(product_id),10000,"1m")
             #hits = response.get("hits", {}).get("hits", [])
     
             if not response:
@@ -473,7 +450,7 @@ class ProductBuilder:
         result = {}
                   
         try:
-            prod_response = list(self.es.getScrollObject(prod_index, query_productNrs(skus), 10000, "1m"))
+            prod_response = await self.es.agetScrollObject(prod_index, query_productNrs(skus), 10000, "1m")
                 
             if not prod_response:
                 return {}
@@ -1,12 +1,18 @@
-from typing import Optional, List
+from typing import FrozenSet, Optional, List
 from quart import current_app
 from models.product import Product, ProductListResponse, ProductDocument, ProductDocumentsResponse
 from services.product_builder import ProductBuilder
+from services.brand_filters import brand_terms
+from services.single_flight import entity_flight
+from services.export_service import CatalogueExport
+from contextlib import aclosing
+from queries.hierarchy_queries import brand_filter
+from utils.pagination import cursor_meta, cursor_paging
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def get_products(offset=0, limit=10, brand="systemair", lang="deu_deu") -> ProductListResponse:
+async def get_products(offset=0, limit=10, brand="systemair", lang="deu_deu", cursor=None) -> ProductListResponse:
     es = current_app.es
     builder = ProductBuilder(es)
     index = f"systemair_ds_hierarchies_{lang}"
@@ -22,19 +28,7 @@ async def get_products(offset=0, limit=10, brand="systemair", lang="deu_deu") ->
                     "planningLevel": "Product"
                   }
                 },
-                {
-                  "nested": {
-                    "path": "hierarchies",
-                    "query": {
-                      "script": {
-                        "script": {
-                          "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
-                          "lang": "painless"
-                        }
-                      }
-                    }
-                  }
-                }
+                brand_filter(brand, await brand_terms.resolve(es, index, brand))
               ]
             }
           },
@@ -48,7 +42,13 @@ async def get_products(offset=0, limit=10, brand="systemair", lang="deu_deu") ->
         # Corrected here
     }
 
-    response = es.search(index, body)
+    next_cursor = None
+    if cursor is not None:
+        # epimId breaks seqorderNr ties so search_after has a unique position
+        response, next_cursor = await cursor_paging.page(es, index, body, body["sort"] + [{"epimId": "asc"}],
+                                                         limit, cursor)
+    else:
+        response = await es.asearch(index, body)
     hits = response.get("hits", {}).get("hits", [])
     total = response.get("hits", {}).get("total", {}).get("value", 0)
 
@@ -61,43 +61,26 @@ async def get_products(offset=0, limit=10, brand="systemair", lang="deu_deu") ->
                 items.append(product)
 
     return ProductListResponse(
-        meta={"offset": offset, "limit": limit, "total": total},
+        meta=cursor_meta(limit, total, next_cursor) if cursor is not None
+        else {"offset": offset, "limit": limit, "total": total},
         items=items
     )
 
 async def stream_products(lang: str, brand: str):
-    es = current_app.es
-    builder = ProductBuilder(es)
-    index = f"systemair_ds_hierarchies_{lang}"
-    size = 1000
-    scroll = "2m"
-    query = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"term": {"planningLevel": "Product"}}
-                ]
-            }
-        },
-        "_source": ["epimId"]  # Corrected here
-    }
-
+    export = CatalogueExport(current_app.es, None, "products", lang, brand, None)
     try:
-        hits = es.getScrollObject(index=index, querySource=query, scrollSize=size, scrollTimeout=scroll)
-
-        for hit in hits:  # Normal for-loop!
-            src = hit["_source"]
-            product_id = src.get("epimId")
-            if product_id:
-                product = await builder.build_product(product_id, lang, brand)
-                if product:
+        async with aclosing(export.pages()) as pages:
+            async for products in pages:
+                for product in products:
                     yield product
     except Exception as e:
         logger.exception(f"Failed during streaming products for {lang}: {e}")
 
-async def get_product_by_id(identifier: str, lang: str, brand: str) -> Optional[Product]:
+async def get_product_by_id(identifier: str, lang: str, brand: str,
+                            fields: Optional[FrozenSet[str]] = None) -> Optional[Product]:
     builder = ProductBuilder(current_app.es)
-    return await builder.build_product(identifier, lang, brand)
+    return await entity_flight.do(("product", str(identifier), lang, brand, None, fields),
+                                  lambda: builder.build_product(identifier, lang, brand, fields))
 
 
 async def get_product_documents(identifier: str, lang: str, brand: str) -> Optional[dict]:
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import orjson
+
+logger = logging.getLogger("services.reference_cache")
+
+
+class ReferenceCache:
+    """
+    Process-wide TTL + LRU cache for slow-changing catalogue reference data
+    (producttables definitions, certification dictionaries, ...).
+
+    - fresh (age < ttl): served from memory
+    - stale (ttl <= age < ttl + stale_ttl): served from memory while one background
+      task reloads the entry (stale-while-revalidate)
+    - expired or missing: loaded inline; concurrent callers for the same key share one load
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0, stale_ttl: float = 3600.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, loaded_at)
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.maxsize = int(config.get("maxsize", self.maxsize))
+        self.ttl = float(config.get("ttl", self.ttl))
+        self.stale_ttl = float(config.get("stale_ttl", self.stale_ttl))
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, calling loader() when it has to be (re)loaded."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._loading:
+                    self._start_load(key, loader, background=True)
+                return value
+
+        self.misses += 1
+        future = self._loading.get(key) or self._start_load(key, loader, background=False)
+        # shield: a cancelled request must not cancel the load other callers are waiting on
+        return await asyncio.shield(future)
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], background: bool) -> asyncio.Future:
+        async def load():
+            try:
+                value = await loader()
+            except Exception:
+                if background:
+                    self.refresh_errors += 1
+                    logger.warning("Background refresh of %s cache entry %r failed; serving stale value",
+                                   self.name, key, exc_info=True)
+                raise
+            finally:
+                self._loading.pop(key, None)
+            if background:
+                self.refreshes += 1
+            self._store(key, value)
+            return value
+
+        task = asyncio.ensure_future(load())
+        if background:
+            # nobody awaits a background refresh; retrieve its exception so asyncio doesn't log it again
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._loading[key] = task
+        return task
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "evictions": self.evictions,
+        }
+
+
+def query_key(index, query: dict) -> tuple:
+    """Cache key for an ES search: the index (lang included) plus the canonical query body
+    (which carries the table ids and brand)."""
+    index_key = ",".join(index) if isinstance(index, (list, tuple)) else index
+    return index_key, orjson.dumps(query, option=orjson.OPT_SORT_KEYS)
+
+
+reference_cache = ReferenceCache("reference")
+
+
+async def cached_search(es, index, query: dict) -> dict:
+    """ESConnection.asearch for reference-data queries, served through reference_cache.
+    Callers must treat the returned response as read-only."""
+    return await reference_cache.get(("search", *query_key(index, query)), lambda: es.asearch(index, query))
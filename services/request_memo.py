@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+logger = logging.getLogger("services.request_memo")
+
+_current_memo: contextvars.ContextVar[Optional["RequestMemo"]] = contextvars.ContextVar(
+    "request_memo", default=None
+)
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def current_memo() -> Optional["RequestMemo"]:
+    return _current_memo.get()
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # retrieve the exception even if every caller was cancelled
+    if not future.cancelled():
+        future.exception()
+
+
+class RequestMemo:
+    """
+    Results of the searches and memoized builder calls issued by one build. The first caller of
+    a key starts the work, every identical call in the same build awaits that same future.
+    Results are shared between callers: do not mutate them.
+    """
+
+    def __init__(self):
+        self._futures: Dict[tuple, asyncio.Future] = {}
+        # arguments keyed by id() stay referenced so their ids are not reused within the build
+        self._pinned: List[Any] = []
+        self.calls = 0
+        self.calls_saved = 0
+        self.searches = 0
+        self.searches_saved = 0
+
+    async def _shared(self, key: tuple, factory) -> Any:
+        future = self._futures.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            future.add_done_callback(_retrieve)
+            self._futures[key] = future
+            saved = False
+        else:
+            saved = True
+        # shield: a cancelled caller must not cancel the work other callers are waiting on
+        return saved, await asyncio.shield(future)
+
+    async def search(self, index, query: dict, run):
+        """run(index, query) once per identical (index, query) in this build."""
+        try:
+            body = orjson.dumps(query, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            self.searches += 1
+            return await run(index, query)
+        key = ("search", tuple(index) if isinstance(index, (list, tuple)) else index, body)
+        self.searches += 1
+        saved, result = await self._shared(key, lambda: run(index, query))
+        if saved:
+            self.searches_saved += 1
+        return result
+
+    async def call(self, name: str, args: tuple, kwargs: dict, factory):
+        """factory() once per identical call; dicts and lists match by identity, scalars by value."""
+        key_args = []
+        for arg in (*args, *(kwargs[k] for k in sorted(kwargs))):
+            if isinstance(arg, _SCALARS):
+                key_args.append(arg)
+            else:
+                self._pinned.append(arg)
+                key_args.append(("id", id(arg)))
+        key = ("call", name, tuple(key_args), tuple(sorted(kwargs)))
+        self.calls += 1
+        saved, result = await self._shared(key, factory)
+        if saved:
+            self.calls_saved += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "calls_saved": self.calls_saved,
+            "searches": self.searches,
+            "searches_saved": self.searches_saved,
+        }
+
+
+class MemoTotals:
+    """Process-wide sums of the per-build RequestMemo counters (served at /health/caches)."""
+
+    def __init__(self):
+        self.enabled = True
+        self.builds = 0
+        self.calls = 0
+        self.calls_saved = 0
+        self.searches = 0
+        self.searches_saved = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.enabled = str(config.get("enabled", "true")).strip().lower() in ("1", "true", "yes", "on")
+
+    def add(self, memo: RequestMemo) -> None:
+        self.builds += 1
+        self.calls += memo.calls
+        self.calls_saved += memo.calls_saved
+        self.searches += memo.searches
+        self.searches_saved += memo.searches_saved
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "builds": self.builds,
+            "calls": self.calls,
+            "calls_saved": self.calls_saved,
+            "searches": self.searches,
+            "searches_saved": self.searches_saved,
+        }
+
+
+memo_totals = MemoTotals()
+
+
+@asynccontextmanager
+async def request_memo():
+    """
+    Share one RequestMemo between everything awaited inside the block (including child tasks
+    created by asyncio.gather). Nested blocks reuse the outer memo.
+    """
+    if _current_memo.get() is not None or not memo_totals.enabled:
+        yield _current_memo.get()
+        return
+    memo = RequestMemo()
+    token = _current_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _current_memo.reset(token)
+        memo_totals.add(memo)
+        logger.debug("request memo: %d/%d calls and %d/%d searches saved", memo.calls_saved, memo.calls,
+                     memo.searches_saved, memo.searches)
+
+
+def memoized(method):
+    """
+    Decorator for builder helpers that several parts of one build call with the same arguments:
+    inside request_memo() identical calls share one execution, outside it the method runs as is.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        memo = _current_memo.get()
+        if memo is None:
+            return await method(self, *args, **kwargs)
+        return await memo.call(method.__qualname__, (self, *args), kwargs,
+                               lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,211 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, FrozenSet, Iterable, Optional, Tuple
+
+import orjson
+from pydantic import BaseModel
+
+from queries.statistics_queries import query_docs_version
+from services.price_cache import price_snapshot
+from services.single_flight import builds_started_after
+from utils.http_cache import epoch_ms_to_datetime, payload_etag
+from utils.mapping import get_fallback_chain
+
+logger = logging.getLogger("services.response_cache")
+
+# entity type -> index kind holding the entity's own documents
+SOURCE_INDICES = {
+    "sku": "products",
+    "product": "hierarchies",
+    "category": "hierarchies",
+    "operating_mode": "variants",
+    "shop_sku": "products",
+}
+# entity types whose responses carry prices from the price snapshot
+PRICED = frozenset({"sku", "shop_sku", "operating_mode"})
+
+
+class _Entry:
+    __slots__ = ("payload", "etag", "last_modified", "ids", "version", "stored_at")
+
+    def __init__(self, payload: bytes, ids: Tuple[str, ...], version: Optional[tuple], stored_at: float):
+        self.payload = payload
+        self.etag = payload_etag(payload)
+        # newest source `timestamp` (None when the version is unknown or the docs carry none)
+        self.last_modified = epoch_ms_to_datetime(version[1]) if version else None
+        self.ids = ids
+        self.version = version
+        self.stored_at = stored_at
+
+
+class ResponseCache:
+    """
+    Serialized entity responses (orjson bytes of a built Sku, Product, Category or OperatingMode)
+    keyed by (entity type, id, lang, brand, market), so a hit skips building and serialization.
+
+    Every entry remembers the epimIds it was built from (the entity and its reference) and their
+    version: count and newest `timestamp` of those documents and of their attributes, over the
+    language fallback chain, plus the price snapshot's change_id for priced entities. A lookup
+    re-reads that version with one size-0 search and serves the entry only if it is unchanged.
+
+    The version is read before the build, over the epimIds the previous build of the key used, so an
+    update landing during the build makes the entry stale instead of hiding it; builds that started
+    before the version read (entity_flight) are not shared for it. A key built for the first time is
+    served but not stored (its epimIds are only known afterwards). Elements (texts, images), units of
+    measure, certificate and other reference data, and prices read from the DB while the snapshot is
+    not loaded are not part of the version: those changes show after `max_age`.
+    """
+
+    def __init__(self, maxsize: int = 5000, max_bytes: int = 256 * 1024 * 1024, max_age: float = 300.0):
+        self.enabled = True
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        # epimIds of the last build of each key, for the version read before its next build
+        self._source_ids: "OrderedDict[tuple, Tuple[str, ...]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.probe_errors = 0
+        self.evictions = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.enabled = str(config.get("enabled", "true")).strip().lower() in ("1", "true", "yes", "on")
+        self.maxsize = int(config.get("maxsize", self.maxsize))
+        self.max_bytes = int(config.get("max_bytes", self.max_bytes))
+        self.max_age = float(config.get("max_age", self.max_age))
+
+    @staticmethod
+    def key(entity: str, identifier, lang: str, brand: Optional[str], market: Optional[str],
+            fields: Optional[FrozenSet[str]] = None) -> tuple:
+        return entity, str(identifier), lang, brand, market, fields
+
+    async def version(self, es, entity: str, lang: str, ids: Iterable) -> tuple:
+        indices = [f"systemair_ds_{kind}_{chain_lang}" for chain_lang in get_fallback_chain(lang)
+                   for kind in (SOURCE_INDICES[entity], "attributes")]
+        # read first: a poll landing during the search then shows as a change on the next lookup
+        prices = price_snapshot.change_id if entity in PRICED and price_snapshot.loaded else None
+        response = await es.asearch(indices, query_docs_version(list(ids)))
+        return (response["hits"]["total"]["value"],
+                response.get("aggregations", {}).get("latest", {}).get("value"), prices)
+
+    async def get(self, es, key: tuple) -> Optional[_Entry]:
+        """The cached entry for key, or None when there is none or it is outdated."""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - entry.stored_at >= self.max_age:
+            self.expired += 1
+            self._drop(key)
+            return None
+        entity, _, lang = key[:3]
+        try:
+            version = await self.version(es, entity, lang, entry.ids)
+        except Exception:
+            self.probe_errors += 1
+            logger.warning("Could not read the version of %s; rebuilding", key, exc_info=True)
+            return None
+        if version != entry.version:
+            self.stale += 1
+            self._drop(key)
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    async def version_before_build(self, es, key: tuple) -> Tuple[Optional[Tuple[str, ...]], Optional[tuple]]:
+        """(epimIds, version) of the key's previous build, read before rebuilding it; (None, None)
+        when the key was not built before (or the version cannot be read)."""
+        ids = self._source_ids.get(key)
+        if not self.enabled or ids is None:
+            return None, None
+        entity, _, lang = key[:3]
+        try:
+            return ids, await self.version(es, entity, lang, ids)
+        except Exception:
+            self.probe_errors += 1
+            logger.warning("Could not read the version of %s; not caching it", key, exc_info=True)
+            return None, None
+
+    def put(self, key: tuple, ids: Iterable, payload: bytes, version_ids: Optional[Tuple[str, ...]] = None,
+            version: Optional[tuple] = None) -> _Entry:
+        """
+        Entry for payload, built from the documents `ids`. Stored when `version` was read before the
+        build over those same documents (`version_ids`, see version_before_build); otherwise only
+        the documents are remembered, for the version read before the next build.
+        """
+        ids = tuple(dict.fromkeys(str(i) for i in ids if i is not None))
+        if not self.enabled:
+            return _Entry(payload, ids, None, time.monotonic())
+        self._source_ids[key] = ids
+        self._source_ids.move_to_end(key)
+        while len(self._source_ids) > self.maxsize:
+            self._source_ids.popitem(last=False)
+        if version is None or version_ids != ids:
+            return _Entry(payload, ids, None, time.monotonic())
+        entry = _Entry(payload, ids, version, time.monotonic())
+        self._drop(key)
+        self._entries[key] = entry
+        self._bytes += len(payload)
+        while self._entries and (len(self._entries) > self.maxsize or self._bytes > self.max_bytes):
+            self._bytes -= len(self._entries.popitem(last=False)[1].payload)
+            self.evictions += 1
+        return entry
+
+    async def respond(self, es, key: tuple, build: Callable[[], Awaitable[Optional[BaseModel]]],
+                      source_ids: Callable[[BaseModel], Iterable], sort_keys: bool = False) -> Optional[_Entry]:
+        """
+        Response for key (payload, ETag, Last-Modified): the cached entry while it is current,
+        otherwise build() serialized with orjson and stored. None when build() finds nothing (not cached).
+        """
+        entry = await self.get(es, key)
+        if entry is not None:
+            return entry
+        version_ids, version = await self.version_before_build(es, key)
+        if version is None:
+            entity = await build()
+        else:
+            # a build shared through entity_flight may have read ES before the version: only share newer ones
+            with builds_started_after(time.monotonic()):
+                entity = await build()
+        if entity is None:
+            return None
+        payload = orjson.dumps(entity.model_dump(), option=orjson.OPT_SORT_KEYS if sort_keys else None)
+        return self.put(key, source_ids(entity), payload, version_ids, version)
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.payload)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._source_ids.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "expired": self.expired,
+            "probe_errors": self.probe_errors,
+            "evictions": self.evictions,
+        }
+
+
+entity_responses = ResponseCache()
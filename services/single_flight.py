@@ -0,0 +1,117 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger("services.single_flight")
+
+_not_before: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "single_flight_not_before", default=None
+)
+
+
+@contextmanager
+def builds_started_after(moment: float):
+    """Inside the block, SingleFlight.do only shares builds started after `moment` (time.monotonic()):
+    for callers that read a version of the sources first and must not get a result read before it."""
+    token = _not_before.set(moment)
+    try:
+        yield
+    finally:
+        _not_before.reset(token)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical entity builds across requests: the first request for a key
+    (entity type, id, lang, brand, market) runs the build, every request for the same key that
+    arrives while it runs awaits that build. A successful result (including None, "not found")
+    is then reused for `reuse_window` seconds; failures are not kept. Under builds_started_after,
+    older builds (in flight or finished) are not shared and a new one is started instead.
+
+    Results are shared between requests: do not mutate them.
+    """
+
+    def __init__(self, reuse_window: float = 1.0, maxsize: int = 1024):
+        self.enabled = True
+        self.reuse_window = reuse_window
+        self.maxsize = maxsize
+        # key -> (future, started_at)
+        self._inflight: Dict[Hashable, Tuple[asyncio.Future, float]] = {}
+        # key -> (result, started_at, finished_at)
+        self._recent: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.builds = 0
+        self.coalesced = 0
+        self.reused = 0
+        self.errors = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.enabled = str(config.get("enabled", "true")).strip().lower() in ("1", "true", "yes", "on")
+        self.reuse_window = float(config.get("reuse_window", self.reuse_window))
+        self.maxsize = int(config.get("maxsize", self.maxsize))
+
+    async def do(self, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await build()
+        not_before = _not_before.get()
+        recent = self._recent.get(key)
+        if recent is not None:
+            result, started, finished = recent
+            if time.monotonic() - finished >= self.reuse_window:
+                del self._recent[key]
+            elif not_before is None or started >= not_before:
+                self.reused += 1
+                return result
+
+        flight = self._inflight.get(key)
+        if flight is not None and (not_before is None or flight[1] >= not_before):
+            self.coalesced += 1
+            future = flight[0]
+        else:
+            self.builds += 1
+            started = time.monotonic()
+            future = asyncio.ensure_future(build())
+            self._inflight[key] = (future, started)
+            future.add_done_callback(lambda f: self._finished(key, f, started))
+        # shield: a cancelled request must not cancel a build other requests are waiting on
+        return await asyncio.shield(future)
+
+    def _finished(self, key: Hashable, future: asyncio.Future, started: float) -> None:
+        if self._inflight.get(key, (None,))[0] is future:
+            del self._inflight[key]
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.errors += 1
+            return
+        if self.reuse_window <= 0:
+            return
+        recent = self._recent.get(key)
+        if recent is not None and recent[1] > started:
+            return  # a newer build finished first
+        self._recent[key] = (future.result(), started, time.monotonic())
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.maxsize:
+            self._recent.popitem(last=False)
+
+    def clear(self) -> None:
+        self._recent.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "reuse_window": self.reuse_window,
+            "inflight": len(self._inflight),
+            "recent": len(self._recent),
+            "builds": self.builds,
+            "coalesced": self.coalesced,
+            "reused": self.reused,
+            "errors": self.errors,
+        }
+
+
+entity_flight = SingleFlight()
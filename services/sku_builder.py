@@ -1,5 +1,5 @@
 import logging
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Union, FrozenSet
 
 from models.sku import RelationShop
 from models.sku import Sku, Certification, Attribute, Section, Price, Buttons, Relation, Document, SectionContent
@@ -10,9 +10,10 @@ from queries.sku_queries import (query_sku_by_id, query_attributes, query_texts,
                                  query_certifications, query_cert_definitions, query_image_byId, query_attr_buttons,
                                  query_sku_relations,
                                  query_documents, query_shop_attr_definitions, query_attr_TP_definitions,
-                                 query_elements_attributes, query_uom)
+                                 query_elements_attributes, query_skus_by_ids, query_prices)
 from utils.mapping import map_brand
-from utils.utilities import parse_piped_value, inject_fallback_sort
+from utils.utilities import parse_piped_value
+from utils.fieldsets import assemble, sparse, wants
 from services.elasticsearch_service import ESConnection
 from services.database_service import DBConnection
 import asyncio
@@ -21,32 +22,132 @@ import json
 import locale
 from datetime import datetime, timezone
 from collections import defaultdict
+from services.es_batcher import batched_searches
+from services.request_memo import memoized
+from services.reference_cache import reference_cache, cached_search, query_key
+from services.uom_cache import uom_cache
+from services.price_cache import price_snapshot, normalize_product_nr
+from services.brand_filters import brand_terms
+from services.lang_fallback import lang_fallback
+from services.element_previews import element_previews
 
 logger = logging.getLogger(__name__)
 
+# ES returns 10 hits when a query sets no size; bulk fetches cut each SKU's slice to the same window
+ES_DEFAULT_SIZE = 10
+ES_MAX_SIZE = 10000
+
+
+# fields derived from the attribute documents / the text elements: without them, those fetches are skipped
+SKU_ATTRIBUTE_FIELDS = frozenset({"expired", "name", "shortName", "tagline", "active", "releaseDate", "approved",
+                                  "magicadBim", "selectionTool"})
+SKU_TEXT_FIELDS = frozenset({"description", "specificationText"})
+
+
+async def _prefetched(value):
+    if isinstance(value, BaseException):
+        raise value
+    return value
+
+
+def _hit_keys(hit: dict, field: str) -> set:
+    value = hit.get("_source", {}).get(field)
+    if isinstance(value, list):
+        return {str(v) for v in value}
+    return {str(value)}
+
+
+def _price_columns(row: dict, market: str) -> tuple:
+    return row[str(market + "_PRICE")], row[str(market + "_CURRENCY")]
+
+
+def _technical_rows(tech: List[dict], att_response: List[dict], lang: str) -> Dict[str, list]:
+    """
+    {sub-section label: [{label: {"value", "unit"}}]} of one technical section: every entry of `tech`
+    takes the first attribute hit (in hit order) named like one of its attributes that has a value.
+    """
+    # hit positions per attribute name: each entry only visits the hits it can match
+    positions: Dict[str, List[int]] = {}
+    for position, hit in enumerate(att_response):
+        positions.setdefault(hit["_source"].get("name"), []).append(position)
+
+    rows = {}
+    sub_section = ""
+    for entry in tech:
+        attrs = entry["attribute"]  # the list of attribute keys for this tech-group
+        label_txt = entry["label"][0]  # the display label for this group
+
+        if attrs == "dummy-tab":
+            continue
+
+        # 1) Dummy-header rows
+        if "dummy-table-header" in attrs or "dummy-table-header-td" in attrs:
+            sub_section = label_txt
+            continue
+
+        # 2) For each real attribute key in this group, find its hit
+        if len(attrs) == 1:
+            candidates = positions.get(attrs[0], ())
+        else:
+            candidates = sorted({position for attr in attrs for position in positions.get(attr, ())})
+        for position in candidates:
+            src = att_response[position]["_source"]
+
+            # extract unit + value(s)
+            vals = src.get("values", [])
+            if not vals:
+                continue
+
+            unit = (
+                next(
+                    (u["unitShortName"]
+                     for v in vals
+                     for u in v.get("unitList", [])
+                     if u["langIso"] == lang),
+                    vals[0].get("unit", "") if vals else ""
+                )
+            )
+            if len(vals) == 1:
+                value = vals[0].get("value")
+            else:
+                value = [
+                    d["value"]
+                    for d in sorted(
+                        (d for d in vals if d.get("value") is not None),
+                        key=lambda d: (d.get("seqorderNr") is None, d.get("seqorderNr") or 0)
+                    )
+                ]
+            if value is None:
+                continue  # skip empties
+            value, unit2 = parse_piped_value(value)
+            if unit2:
+                unit = unit2
+
+            # Initialize the subsection if it doesn't exist
+            if sub_section not in rows:
+                rows[sub_section] = []
+            # build the row
+            rows[sub_section].append({label_txt: {"value": value, "unit": unit}})
+            # once matched, break out to the next entry
+            break
+    return rows
+
 
 class SkuBuilder:
     def __init__(self, es_client: ESConnection, db_client: DBConnection):
         self.es = es_client
         self.db = db_client
 
-    async def build_sku(self, identifier: str, lang: str, brand: str, market: str) -> Optional[Sku]:
+    @batched_searches
+    async def build_sku(self, identifier: str, lang: str, brand: str, market: str,
+                        fields: Optional[FrozenSet[str]] = None) -> Optional[Sku]:
+        """The SKU, or with `fields` (see utils.fieldsets) only those fields, skipping the fetches they do not need."""
         try:
             sku = await self.get_sku(identifier, lang, brand)
             if not sku:
                 return None
             if sku.get("deleted"):
-                return Sku(
-                    id=identifier,
-                    parentId=sku.get("parentHierarchy", ""),
-                    vendorId="",
-                    name=sku.get("name", ""),
-                    active=False,
-                    expired=True,
-                    approved=False,
-                    deleted=True,
-                    attributes={}
-                )
+                return sparse(self._deleted_sku(identifier, sku), fields)
 
             sku_id = identifier
             refSku_id = await self.get_ref_id(sku)
@@ -54,109 +155,323 @@ class SkuBuilder:
             identifiers = [i for i in [sku_id, refSku_id] if i is not None]
             # index = f"systemair_ds_attributes_{lang}"
             # raw_attributes  = list(self.es.getScrollObject(index, query_attributes(identifiers), 10000, "1m"))
-            indices, attQuery = inject_fallback_sort(query_attributes(identifiers), lang, "systemair_ds_attributes_",
-                                                     "attributeParentId")
-            attributes_res = await self.es.asearch(indices, attQuery)
+            raw_attributes, texts = [], []
+            if wants(fields, SKU_ATTRIBUTE_FIELDS):
+                attributes_res = await lang_fallback.search(self.es, query_attributes(identifiers), lang,
+                                                            "systemair_ds_attributes_", "attributeParentId")
 
-            #attributes_task = asyncio.create_task(asyncio.to_thread(self.es.search, indices, attQuery))
-            #texts_ids_task = asyncio.create_task(self.get_texts_ids(refSku, sku))
-            #attributes_res, get_texts_ids = await asyncio.gather(attributes_task, texts_ids_task)
+                #attributes_task = asyncio.create_task(asyncio.to_thread(self.es.search, indices, attQuery))
+                #texts_ids_task = asyncio.create_task(self.get_texts_ids(refSku, sku))
+                #attributes_res, get_texts_ids = await asyncio.gather(attributes_task, texts_ids_task)
 
-            raw_attributes = attributes_res.get("hits", {}).get("hits", [])
+                raw_attributes = attributes_res.get("hits", {}).get("hits", [])
             # print(attributes)
-            get_texts_ids = await self.get_texts_ids(refSku, sku)
-            index = f"systemair_ds_elements_{lang}"
-            texts_res = await self.es.asearch(index, query_texts(get_texts_ids))
-
-            #texts_res = await asyncio.to_thread(self.es.search, index, query_texts(get_texts_ids))
-
-            texts = texts_res.get("hits", {}).get("hits", [])
+            if wants(fields, SKU_TEXT_FIELDS):
+                get_texts_ids = await self.get_texts_ids(refSku, sku)
+                index = f"systemair_ds_elements_{lang}"
+                texts_res = await self.es.asearch(index, query_texts(get_texts_ids))
 
-            (
-                parent_id,
-                price,
-                certifications,
-                parsed_attributes,
-                sections,
-                expired,
-                vendor_id,
-                default_mode_id,
-                name,
-                short_name,
-                description,
-                specification,
-                tagline,
-                active,
-                release_date,
-                approved,
-                sort,
-                images,
-                buttons,
-                magic_ad_bim,
-                selection_tool,
-                successorsIds
+                #texts_res = await asyncio.to_thread(self.es.search, index, query_texts(get_texts_ids))
 
-            ) = await asyncio.gather(
-                # get the parent id as the ref id not the pgpr id  (check it first)
-                self.get_parent_id(sku),
-                self.parse_price_async(sku, refSku, market),
-                self.parse_certifications_async(identifiers, lang),
-                self.get_additional_attributes(sku, refSku, lang, brand, market),
-                # self.parse_sections_async(sku.get("sections", [])),
-                self.get_technical_sections(sku, refSku, lang, brand, market),
-                self.get_expired_status(raw_attributes, market),
-                # we get productNr from the source decesion: should we priortize the original or source (take it from the original)
-                self.get_vendor_id(sku, refSku),
-                self.get_default_operating_mode_id(sku, refSku, lang),
-                self.get_name(raw_attributes, sku),
-                self.get_short_name(raw_attributes, sku),
-                self.get_description(texts, "xmlText"),
-                self.get_specification(texts, "xmlText"),
-                self.get_tagline(raw_attributes),
-                self.get_active_status(refSku_id, market, raw_attributes),
-                self.get_release_date(raw_attributes),
-                self.get_approved_status(sku, raw_attributes),
-                self.get_sort_order(sku),
-                self.get_images(refSku, sku, lang),
-                self.get_buttons(identifiers, lang),
-                self.get_magicadBim(raw_attributes),
-                self.get_selectionTool(raw_attributes, brand),
-                self.get_successors_ids(sku, refSku, lang, brand, market)
-            )
+                texts = texts_res.get("hits", {}).get("hits", [])
 
-            return Sku(
-                id=str(sku_id),
-                parentId=parent_id,
-                vendorId=vendor_id,
-                maintenanceId=str(refSku_id),
-                defaultOperatingModeId=default_mode_id,
-                successorsIds=successorsIds,
-                name=name,
-                shortName=short_name,
-                description=description,
-                specificationText=specification,
-                tagline=tagline,
-                active=active,
-                expired=expired,
-                approved=approved,
-                releaseDate=release_date,
-                selectionTool=selection_tool,
-                designTool=sku.get("designTool", False),
-                magicadBim=magic_ad_bim,
-                sort=sort,
-                price=price,
-                default=sku.get("default", False),
-                certifications=certifications,
-                images=images,
-                attributes=parsed_attributes,
-                sections=sections,
-                buttons=buttons
-            )
+            return await self._assemble_sku(sku_id, sku, refSku_id, refSku, raw_attributes, texts, lang, brand, market,
+                                            fields=fields)
 
         except Exception as e:
             logger.exception(f"Failed to build SKU {identifier}: {str(e)}")
             return None
 
+    def _deleted_sku(self, identifier, sku: dict) -> Sku:
+        return Sku(
+            id=identifier,
+            parentId=sku.get("parentHierarchy", ""),
+            vendorId="",
+            name=sku.get("name", ""),
+            active=False,
+            expired=True,
+            approved=False,
+            deleted=True,
+            attributes={}
+        )
+
+    async def _assemble_sku(self, sku_id, sku: dict, refSku_id, refSku: Optional[dict], raw_attributes: List[dict],
+                            texts: List[dict], lang: str, brand: str, market: str,
+                            prefetched: Optional[dict] = None, fields: Optional[FrozenSet[str]] = None):
+        """
+        Shared tail of build_sku / build_many: derive every field from the fetched documents.
+        `prefetched` may hold already resolved "price", "certifications" and "images" values
+        (or the exception their fetch raised) from a bulk fetch. With `fields`, only those
+        fields are derived and a PartialEntity is returned.
+        """
+        prefetched = prefetched or {}
+        identifiers = [i for i in [sku_id, refSku_id] if i is not None]
+        return await assemble(Sku, {
+            "id": str(sku_id),
+            "maintenanceId": str(refSku_id),
+            "designTool": sku.get("designTool", False),
+            "default": sku.get("default", False),
+        }, {
+            # get the parent id as the ref id not the pgpr id  (check it first)
+            "parentId": lambda: self.get_parent_id(sku),
+            "price": lambda: _prefetched(prefetched["price"]) if "price" in prefetched
+            else self.parse_price_async(sku, refSku, market),
+            "certifications": lambda: _prefetched(prefetched["certifications"]) if "certifications" in prefetched
+            else self.parse_certifications_async(identifiers, lang),
+            "attributes": lambda: self.get_additional_attributes(sku, refSku, lang, brand, market),
+            # self.parse_sections_async(sku.get("sections", [])),
+            "sections": lambda: self.get_technical_sections(sku, refSku, lang, brand, market),
+            "expired": lambda: self.get_expired_status(raw_attributes, market),
+            # we get productNr from the source decesion: should we priortize the original or source (take it from the original)
+            "vendorId": lambda: self.get_vendor_id(sku, refSku),
+            "defaultOperatingModeId": lambda: self.get_default_operating_mode_id(sku, refSku, lang),
+            "name": lambda: self.get_name(raw_attributes, sku),
+            "shortName": lambda: self.get_short_name(raw_attributes, sku),
+            "description": lambda: self.get_description(texts, "xmlText"),
+            "specificationText": lambda: self.get_specification(texts, "xmlText"),
+            "tagline": lambda: self.get_tagline(raw_attributes),
+            "active": lambda: self.get_active_status(refSku_id, market, raw_attributes),
+            "releaseDate": lambda: self.get_release_date(raw_attributes),
+            "approved": lambda: self.get_approved_status(sku, raw_attributes),
+            "sort": lambda: self.get_sort_order(sku),
+            "images": lambda: _prefetched(prefetched["images"]) if "images" in prefetched
+            else self.get_images(refSku, sku, lang),
+            "buttons": lambda: self.get_buttons(identifiers, lang),
+            "magicadBim": lambda: self.get_magicadBim(raw_attributes),
+            "selectionTool": lambda: self.get_selectionTool(raw_attributes, brand),
+            "successorsIds": lambda: self.get_successors_ids(sku, refSku, lang, brand, market),
+        }, fields)
+
+    @batched_searches
+    async def build_many(self, identifiers: List[str], lang: str, brand: str, market: str,
+                         concurrency: int = 64) -> List[Optional[Sku]]:
+        """
+        Build several SKUs at once. SKU docs, ref SKUs, attributes, texts, images, prices and
+        certifications are fetched with one bulk query per data kind (chunked to stay inside
+        the 10000-hit window) and every SKU is then assembled exactly like build_sku.
+        Returns one entry per identifier, in input order (None where build_sku returns None).
+        """
+        if not identifiers:
+            return []
+
+        skus = await self._bulk_get_skus(identifiers, lang, brand)
+        ref_ids = list(dict.fromkeys(
+            sku["referenceId"] for sku in skus.values()
+            if not sku.get("deleted") and sku.get("referenceId")
+        ))
+        refs = await self._bulk_get_skus(ref_ids, lang, None) if ref_ids else {}
+
+        # (identifier, sku, refSku_id, refSku) for every SKU that gets fully assembled
+        live = []
+        for identifier in identifiers:
+            sku = skus.get(str(identifier))
+            if not sku or sku.get("deleted"):
+                continue
+            refSku_id = await self.get_ref_id(sku)
+            refSku = refs.get(str(refSku_id)) if refSku_id else None
+            live.append((identifier, sku, refSku_id, refSku))
+
+        attributes, texts, images, prices, certifications = await asyncio.gather(
+            self._bulk_attributes(live, lang),
+            self._bulk_texts(live, lang),
+            self._bulk_images(live, lang),
+            self._bulk_prices(live, market),
+            self._bulk_certifications(live, lang),
+        )
+        prepared = {
+            str(identifier): (sku, refSku_id, refSku, attributes[i], texts[i], {
+                "price": prices[i], "certifications": certifications[i], "images": images[i]
+            })
+            for i, (identifier, sku, refSku_id, refSku) in enumerate(live)
+        }
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def assemble(identifier) -> Optional[Sku]:
+            try:
+                sku = skus.get(str(identifier))
+                if not sku:
+                    return None
+                if sku.get("deleted"):
+                    return self._deleted_sku(identifier, sku)
+                sku, refSku_id, refSku, raw_attributes, sku_texts, prefetched = prepared[str(identifier)]
+                raw_attributes = await _prefetched(raw_attributes)
+                sku_texts = await _prefetched(sku_texts)
+                async with semaphore:
+                    return await self._assemble_sku(identifier, sku, refSku_id, refSku, raw_attributes, sku_texts,
+                                                    lang, brand, market, prefetched)
+            except Exception as e:
+                logger.exception(f"Failed to build SKU {identifier}: {str(e)}")
+                return None
+
+        return list(await asyncio.gather(*[assemble(identifier) for identifier in identifiers]))
+
+    async def _bulk_get_skus(self, identifiers: list, lang: str, brand: Optional[str]) -> Dict[str, dict]:
+        """get_sku for many ids: {str(epimId): first matching _source}. Failed chunks are logged and left out."""
+        index = f"systemair_ds_products_{lang}"
+        found: Dict[str, dict] = {}
+        unique_ids = list(dict.fromkeys(identifiers))
+        chunks = [unique_ids[i:i + 1000] for i in range(0, len(unique_ids), 1000)]
+        terms = await brand_terms.resolve(self.es, index, brand)
+        responses = await asyncio.gather(
+            *[self.es.asearch(index, query_skus_by_ids(chunk, brand, terms)) for chunk in chunks],
+            return_exceptions=True
+        )
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, BaseException):
+                logger.error(f"Error fetching SKUs {chunk}: {response}")
+                continue
+            for hit in response.get("hits", {}).get("hits", []):
+                src = hit["_source"]
+                found.setdefault(str(src.get("epimId")), src)
+        return found
+
+    async def _bulk_search_groups(self, search, groups: List[list], key_field: str,
+                                  max_ids: int = 200) -> List[Union[List[dict], BaseException]]:
+        """
+        For every group of ids return the hits search(group) would return (search: ids -> ES response),
+        in the same order. Groups are packed into chunks of about max_ids ids and each chunk is
+        searched once; the hits of a group are the chunk hits whose key_field is one of its ids,
+        which keeps ES's relative hit order. A chunk that fills the 10000-hit window is split.
+        A failed chunk yields the exception for each of its groups.
+        """
+        results: List[Union[List[dict], BaseException]] = [[] for _ in groups]
+        chunks, current, current_ids = [], [], 0
+        for position, group in enumerate(groups):
+            if not group:
+                continue
+            if current and current_ids + len(group) > max_ids:
+                chunks.append(current)
+                current, current_ids = [], 0
+            current.append(position)
+            current_ids += len(group)
+        if current:
+            chunks.append(current)
+
+        async def run(chunk: List[int]):
+            ids = list(dict.fromkeys(i for position in chunk for i in groups[position]))
+            try:
+                response = await search(ids)
+            except Exception as e:
+                for position in chunk:
+                    results[position] = e
+                return
+            hits = response.get("hits", {}).get("hits", [])
+            if len(hits) >= ES_MAX_SIZE and len(chunk) > 1:
+                middle = len(chunk) // 2
+                await asyncio.gather(run(chunk[:middle]), run(chunk[middle:]))
+                return
+            for position in chunk:
+                wanted = {str(i) for i in groups[position]}
+                results[position] = [hit for hit in hits if _hit_keys(hit, key_field) & wanted]
+
+        await asyncio.gather(*[run(chunk) for chunk in chunks])
+        return results
+
+    async def _bulk_attributes(self, live: list, lang: str) -> list:
+        groups = [[i for i in [identifier, refSku_id] if i is not None] for identifier, _, refSku_id, _ in live]
+        return await self._bulk_search_groups(
+            lambda ids: lang_fallback.search(self.es, query_attributes(ids), lang, "systemair_ds_attributes_",
+                                             "attributeParentId"),
+            groups, "parentId")
+
+    async def _bulk_texts(self, live: list, lang: str) -> list:
+        index = f"systemair_ds_elements_{lang}"
+        groups = [await self.get_texts_ids(refSku, sku) for _, sku, _, refSku in live]
+        return await self._bulk_search_groups(lambda ids: self.es.asearch(index, query_texts(ids)), groups,
+                                              "parentElement")
+
+    async def _bulk_images(self, live: list, lang: str) -> List[List[str]]:
+        """Same result as get_images for every SKU in live (an empty list when its chunk failed)."""
+        index = f"systemair_ds_elements_{lang}"
+        cat_ids = [125, 126, 120, 119]
+        groups = []
+        for _, sku, _, refSku in live:
+            resolved_epim_ids = []
+            for obj in (refSku or {}).get("imageAssignments", []):
+                for o in obj.get("objects", []):
+                    resolved_epim_ids.append(o["epimId"])
+            for obj in (sku or {}).get("imageAssignments", []):
+                for o in obj.get("objects", []):
+                    resolved_epim_ids.append(o["epimId"])
+            groups.append(resolved_epim_ids)
+        results = await self._bulk_search_groups(lambda ids: self.es.asearch(index, query_images(ids, cat_ids)),
+                                                 groups, "parentElement")
+        images = []
+        for group, hits in zip(groups, results):
+            if isinstance(hits, BaseException):
+                logger.error(f"Failed to fetch images {group} from ES: {hits}")
+                images.append([])
+            else:
+                images.append([hit["_source"].get("dsElementPreviewFile") for hit in hits])
+        return images
+
+    async def _bulk_prices(self, live: list, market: str) -> List[Union[Price, BaseException]]:
+        """parse_price_async for every SKU in live: from the price snapshot, or with one SQL round trip
+        per 1000 product numbers while the snapshot is not loaded."""
+        market = market.replace("-", "_")
+        prod_nrs = [refSku.get("productNr") if refSku else sku.get("productNr") for _, sku, _, refSku in live]
+        if price_snapshot.loaded:
+            lookup = lambda nr: price_snapshot.lookup(nr, market)
+        else:
+            unique_nrs = list(dict.fromkeys(nr for nr in prod_nrs if nr is not None))
+            latest: Dict[str, dict] = {}
+            try:
+                for start in range(0, len(unique_nrs), 1000):
+                    chunk = unique_nrs[start:start + 1000]
+                    params = {f"p{i}": nr for i, nr in enumerate(chunk)}
+                    rows = await self.db.aexecute_query(query_prices(list(params)), params)
+                    for row in rows:
+                        key = normalize_product_nr(row.get("PRODUCT_NUMBER"))
+                        if key not in latest or row.get("id", 0) > latest[key].get("id", 0):
+                            latest[key] = row
+            except Exception as e:
+                return [e for _ in live]
+
+            def lookup(nr):
+                row = latest.get(normalize_product_nr(nr)) if nr is not None else None
+                return _price_columns(row, market) if row else None
+
+        prices = []
+        for nr in prod_nrs:
+            try:
+                prices.append(self._format_price(lookup(nr)))
+            except Exception as e:
+                prices.append(e)
+        return prices
+
+    async def _bulk_certifications(self, live: list, lang: str) -> list:
+        """parse_certifications_async for every SKU in live, sharing one definitions lookup and image search."""
+        if not live:
+            return []
+        try:
+            merged_dict = await self.get_cert_definitions(lang)
+        except Exception as e:
+            return [e for _ in live]
+
+        groups = [[i for i in [identifier, refSku_id] if i is not None] for identifier, _, refSku_id, _ in live]
+        index = f"systemair_ds_attributes_{lang}"
+        results = await self._bulk_search_groups(
+            lambda ids: self.es.asearch(index, {**query_certifications(ids), "size": ES_MAX_SIZE}), groups, "parentId")
+
+        image_ids = list(dict.fromkeys(
+            str(hit["_source"].get("flag1ObjeId", ""))
+            for hits in results if not isinstance(hits, BaseException)
+            for hit in hits[:ES_DEFAULT_SIZE]
+        ))
+        images = await self._resolve_previews(image_ids, lang)
+
+        certifications = []
+        for hits in results:
+            if isinstance(hits, BaseException):
+                logger.error(f"Error parsing certifications: {hits}")
+                certifications.append([])
+                continue
+            certifications.append(await self._parse_certification_hits(
+                hits[:ES_DEFAULT_SIZE], merged_dict, lambda image_id: _prefetched(images.get(image_id, ""))))
+        return certifications
+
+    @batched_searches
     async def build_shop_sku(self, identifier: str, lang: str, brand: str, market: str) -> Optional[dict]:
         """
         Build only the minimal SKU fields needed for the shop view endpoint for performance.
@@ -167,17 +482,7 @@ class SkuBuilder:
             if not sku:
                 return None
             if sku.get("deleted"):
-                return Sku(
-                    id=identifier,
-                    parentId=sku.get("parentHierarchy", ""),
-                    vendorId="",
-                    name=sku.get("name", ""),
-                    active=False,
-                    expired=True,
-                    approved=False,
-                    deleted=True,
-                    attributes={}
-                )
+                return self._deleted_sku(identifier, sku)
 
             sku_id = identifier
             refSku_id = await self.get_ref_id(sku)
@@ -185,9 +490,8 @@ class SkuBuilder:
             identifiers = [i for i in [sku_id, refSku_id] if i is not None]
             # index = f"systemair_ds_attributes_{lang}"
             # raw_attributes = list(self.es.getScrollObject(index, query_attributes(identifiers), 10000, "1m"))
-            indices, attQuery = inject_fallback_sort(query_attributes(identifiers), lang, "systemair_ds_attributes_",
-                                                     "attributeParentId")
-            attributes_res = await self.es.asearch(indices, attQuery)
+            attributes_res = await lang_fallback.search(self.es, query_attributes(identifiers), lang,
+                                                        "systemair_ds_attributes_", "attributeParentId")
             raw_attributes = attributes_res.get("hits", {}).get("hits", [])
 
             # print(attributes)
@@ -235,7 +539,7 @@ class SkuBuilder:
 
             )
             from models.sku import ShopSku
-            return ShopSku(
+            shop_sku = ShopSku(
                 id=str(sku_id),
                 parentId=parent_id,
                 vendorId=vendor_id,
@@ -257,6 +561,8 @@ class SkuBuilder:
                 relations=relations
 
             )
+            shop_sku._reference_id = str(refSku_id) if refSku_id else None
+            return shop_sku
 
         except Exception as e:
             logger.exception(f"Failed to build SHOP SKU {identifier}: {str(e)}")
@@ -272,15 +578,12 @@ class SkuBuilder:
         prodtables_ids = await self.get_prodtable_ids(refSku, sku)
         index = f"systemair_ds_producttables_{lang}"
 
-        response = await self.es.asearch(index, query_attr_TP_definitions(prodtables_ids, mapped_brand))
-        hits = response.get("hits", {}).get("hits", [])
+        definitions = await self.get_att_definitions(index, query_attr_TP_definitions(prodtables_ids, mapped_brand),
+                                                     market)
         techs = {}
         final_techs = {}
 
-        for hit in hits:
-            table = hit["_source"].get("table", [])
-            att_definitions = await self.parse_att_definitions(table, market)
-
+        for att_definitions in definitions:
             # att_definitions is already in the ascending order you want
             for seq, att in att_definitions.items():
                 if att["attribute"][0] in ["dummy-tab", "dummy-tab-td"] and att["shortcut"][
@@ -306,73 +609,12 @@ class SkuBuilder:
 
             # att_index = f"systemair_ds_attributes_{lang}"
             # att_response = list(self.es.getScrollObject(att_index,query_sku_attributes(unique_attributes, identifiers),10000,"1m"))
-            indices, attQuery = inject_fallback_sort(query_sku_attributes(unique_attributes, identifiers), lang,
-                                                     "systemair_ds_attributes_",
-                                                     "attributeParentId")
-            attributes_res = await self.es.asearch(indices, attQuery)
+            attributes_res = await lang_fallback.search(self.es, query_sku_attributes(unique_attributes, identifiers), lang,
+                                                        "systemair_ds_attributes_", "attributeParentId")
             att_response = attributes_res.get("hits", {}).get("hits", [])
             # att_response = list(self.es.getScrollObject(indices, attQuery, 10000, "1m"))
 
-            rows = {}
-            sub_section = ""
-            for entry in tech:
-                attrs = entry["attribute"]  # the list of attribute keys for this tech-group
-                label_txt = entry["label"][0]  # the display label for this group
-
-                if attrs == "dummy-tab":
-                    continue
-
-                # 1) Dummy-header rows
-                if "dummy-table-header" in attrs or "dummy-table-header-td" in attrs:
-                    sub_section = label_txt
-                    continue
-
-                # 2) For each real attribute key in this group, find its hit
-                for hit in att_response:
-                    src = hit["_source"]
-                    name = src.get("name")
-                    if name not in attrs:
-                        continue
-
-                    # extract unit + value(s)
-                    vals = src.get("values", [])
-                    if not vals:
-                        continue
-
-                    unit = (
-                        next(
-                            (u["unitShortName"]
-                             for v in vals
-                             for u in v.get("unitList", [])
-                             if u["langIso"] == lang),
-                            vals[0].get("unit", "") if vals else ""
-                        )
-                    )
-                    if len(vals) == 1:
-                        value = vals[0].get("value")
-                    else:
-                        # value = [v["value"] for v in vals if v.get("value") is not None]
-                        # value = [v["value"] for v in sorted((item for item in vals if item["value"] is not None), key=lambda x: x.get("seqorderNr", 0), reverse=True)]
-                        value = [
-                            d["value"]
-                            for d in sorted(
-                                (d for d in vals if d.get("value") is not None),
-                                key=lambda d: (d.get("seqorderNr") is None, d.get("seqorderNr") or 0)
-                            )
-                        ]
-                    if value is None:
-                        continue  # skip empties
-                    value, unit2 = parse_piped_value(value)
-                    if unit2:
-                        unit = unit2
-
-                    # Initialize the subsection if it doesn't exist
-                    if sub_section not in rows:
-                        rows[sub_section] = []
-                    # build the row
-                    rows[sub_section].append({label_txt: {"value": value, "unit": unit}})
-                    # once matched, break out to the next entry
-                    break
+            rows = _technical_rows(tech, att_response, lang)
 
             if secName not in final_techs:
                 final_techs[secName] = []
@@ -391,15 +633,12 @@ class SkuBuilder:
         prodtables_ids = await self.get_prodtable_ids(refSku, sku)
         index = f"systemair_ds_producttables_{lang}"
 
-        response = await self.es.asearch(index, query_attr_TP_definitions(prodtables_ids, mapped_brand))
-        hits = response.get("hits", {}).get("hits", [])
+        definitions = await self.get_att_definitions(index, query_attr_TP_definitions(prodtables_ids, mapped_brand),
+                                                     market)
         techs = {}
         final_techs = {}
 
-        for hit in hits:
-            table = hit["_source"].get("table", [])
-            att_definitions = await self.parse_att_definitions(table, market)
-
+        for att_definitions in definitions:
             # att_definitions is already in the ascending order you want
             for seq, att in att_definitions.items():
                 if att["attribute"][0] in ["dummy-tab", "dummy-tab-td"] and not (
@@ -425,73 +664,12 @@ class SkuBuilder:
 
             # att_index = f"systemair_ds_attributes_{lang}"
             # att_response = list(self.es.getScrollObject(att_index,query_sku_attributes(unique_attributes, identifiers),10000,"1m"))
-            indices, attQuery = inject_fallback_sort(query_sku_attributes(unique_attributes, identifiers), lang,
-                                                     "systemair_ds_attributes_",
-                                                     "attributeParentId")
-            attributes_res = await self.es.asearch(indices, attQuery)
+            attributes_res = await lang_fallback.search(self.es, query_sku_attributes(unique_attributes, identifiers), lang,
+                                                        "systemair_ds_attributes_", "attributeParentId")
             att_response = attributes_res.get("hits", {}).get("hits", [])
             # att_response = list(self.es.getScrollObject(indices, attQuery, 10000, "1m"))
 
-            rows = {}
-            sub_section = ""
-            for entry in tech:
-                attrs = entry["attribute"]  # the list of attribute keys for this tech-group
-                label_txt = entry["label"][0]  # the display label for this group
-
-                if attrs == "dummy-tab":
-                    continue
-
-                # 1) Dummy-header rows
-                if "dummy-table-header" in attrs or "dummy-table-header-td" in attrs:
-                    sub_section = label_txt
-                    continue
-
-                # 2) For each real attribute key in this group, find its hit
-                for hit in att_response:
-                    src = hit["_source"]
-                    name = src.get("name")
-                    if name not in attrs:
-                        continue
-
-                    # extract unit + value(s)
-                    vals = src.get("values", [])
-                    if not vals:
-                        continue
-
-                    unit = (
-                        next(
-                            (u["unitShortName"]
-                             for v in vals
-                             for u in v.get("unitList", [])
-                             if u["langIso"] == lang),
-                            vals[0].get("unit", "") if vals else ""
-                        )
-                    )
-                    if len(vals) == 1:
-                        value = vals[0].get("value")
-                    else:
-                        # value = [v["value"] for v in vals if v.get("value") is not None]
-                        # value = [v["value"] for v in sorted((item for item in vals if item["value"] is not None), key=lambda x: x.get("seqorderNr", 0), reverse=True)]
-                        value = [
-                            d["value"]
-                            for d in sorted(
-                                (d for d in vals if d.get("value") is not None),
-                                key=lambda d: (d.get("seqorderNr") is None, d.get("seqorderNr") or 0)
-                            )
-                        ]
-                    if value is None:
-                        continue  # skip empties
-                    value, unit2 = parse_piped_value(value)
-                    if unit2:
-                        unit = unit2
-
-                    # Initialize the subsection if it doesn't exist
-                    if sub_section not in rows:
-                        rows[sub_section] = []
-                    # build the row
-                    rows[sub_section].append({label_txt: {"value": value, "unit": unit}})
-                    # once matched, break out to the next entry
-                    break
+            rows = _technical_rows(tech, att_response, lang)
 
             if secName not in final_techs:
                 final_techs[secName] = []
@@ -507,10 +685,12 @@ class SkuBuilder:
 
         return sections
 
+    @memoized
     async def get_sku(self, identifier: str, lang: str, brand: str) -> Optional[dict]:
         index = f"systemair_ds_products_{lang}"
         try:
-            response = await self.es.asearch(index, query_sku_by_id(identifier, brand))
+            terms = await brand_terms.resolve(self.es, index, brand)
+            response = await self.es.asearch(index, query_sku_by_id(identifier, brand, terms))
             hits = response.get("hits", {}).get("hits", [])
             return hits[0]["_source"] if hits else None
         except Exception as e:
@@ -550,6 +730,7 @@ class SkuBuilder:
             return refSku.get("productNr")
         return sku.get("productNr")
 
+    @memoized
     async def get_default_operating_mode_id(self, sku: dict, refsku: dict, lang: str) -> Optional[str]:
         """
         Looks up the defaultOperatingModeId for a SKU by querying
@@ -572,10 +753,8 @@ class SkuBuilder:
 
         index = f"systemair_ds_attributes_{lang}"
         try:
-            indices, attQuery = inject_fallback_sort(query_default_operating_mode(variant_ids), lang,
-                                                     "systemair_ds_attributes_",
-                                                     "attributeParentId")
-            attributes_res = await self.es.asearch(indices, attQuery)
+            attributes_res = await lang_fallback.search(self.es, query_default_operating_mode(variant_ids), lang,
+                                                        "systemair_ds_attributes_", "attributeParentId")
             hits = attributes_res.get("hits", {}).get("hits", [])
 
             # resp = await self.es.asearch(index, query_default_operating_mode(variant_ids))
@@ -733,6 +912,20 @@ class SkuBuilder:
                     resolved_epim_ids.append(obj["epimId"])
         return resolved_epim_ids
 
+    async def get_att_definitions(self, index: str, query: dict, market) -> List[Dict[int, Dict[str, list]]]:
+        """
+        parse_att_definitions output for every producttables hit of `query`, in hit order.
+        Cached process-wide per (index, query, division); the result is shared, do not mutate it.
+        """
+        async def load():
+            response = await cached_search(self.es, index, query)
+            return [
+                await self.parse_att_definitions(hit["_source"].get("table", []), market)
+                for hit in response.get("hits", {}).get("hits", [])
+            ]
+
+        return await reference_cache.get(("att_definitions", *query_key(index, query), market[-3:]), load)
+
     async def parse_att_definitions(self, table: list, market) -> Dict[int, Dict[str, list]]:
         """
         Collect label and attribute lists for each seqorderNr from all rows and cells.
@@ -740,12 +933,7 @@ class SkuBuilder:
         """
         market_id = market[-3:]
         definitions = {}
-        rows = await self.db.aexecute_query(query_uom(), {"division": market_id})
-        mapping = {
-            d["BASE_ATTRIBUTE"]: d["CONVERTED_ATTRIBUTE"]
-            for d in rows
-            if "BASE_ATTRIBUTE" in d and "CONVERTED_ATTRIBUTE" in d
-        }
+        mapping = await uom_cache.get(self.db, market_id)
 
         for block in table:
             rows = block.get("rows", [])
@@ -815,15 +1003,10 @@ class SkuBuilder:
         index = f"systemair_ds_producttables_{lang}"
         grouped = {}
         try:
-            response = await self.es.asearch(index, query_attr_definitions(prodtables_ids, brand))
-            hits = response.get("hits", {}).get("hits", [])
-            if not hits:
+            definitions = await self.get_att_definitions(index, query_attr_definitions(prodtables_ids, brand), market)
+            if not definitions:
                 return []
-            for hit in hits:
-                table = hit["_source"].get("table", [])
-
-                # Run the parser
-                sku_att_definitions = await  self.parse_att_definitions(table, market)
+            for sku_att_definitions in definitions:
 
                 unique_attributes = list(set(
                     attr for data in sku_att_definitions.values() for attr in data["attribute"]
@@ -831,10 +1014,8 @@ class SkuBuilder:
 
                 # att_index = f"systemair_ds_attributes_{lang}"
                 # att_response = list(self.es.getScrollObject(att_index, query_sku_attributes(unique_attributes, skus), 10000,"1m"))
-                indices, attQuery = inject_fallback_sort(query_sku_attributes(unique_attributes, skus), lang,
-                                                         "systemair_ds_attributes_",
-                                                         "attributeParentId")
-                attributes_res = await self.es.asearch(indices, attQuery)
+                attributes_res = await lang_fallback.search(self.es, query_sku_attributes(unique_attributes, skus), lang,
+                                                            "systemair_ds_attributes_", "attributeParentId")
                 att_response = attributes_res.get("hits", {}).get("hits", [])
 
                 # for hit in att_response.get("hits", {}).get("hits", []):
@@ -921,15 +1102,10 @@ class SkuBuilder:
         index = f"systemair_ds_producttables_{lang}"
 
         try:
-            response = await self.es.asearch(index, query_shop_attr_definitions())
-            hits = response.get("hits", {}).get("hits", [])
-            if not hits:
+            definitions = await self.get_att_definitions(index, query_shop_attr_definitions(), market)
+            if not definitions:
                 return []
-            for hit in hits:
-                table = hit["_source"].get("table", [])
-
-                # Run the parser
-                sku_att_definitions = await  self.parse_att_definitions(table, market)
+            for sku_att_definitions in definitions:
 
                 unique_attributes = list(set(
                     attr for data in sku_att_definitions.values() for attr in data["attribute"]
@@ -938,10 +1114,8 @@ class SkuBuilder:
                 # att_index = f"systemair_ds_attributes_{lang}"
                 # att_response = list(self.es.getScrollObject(att_index, query_sku_attributes(unique_attributes, skus), 10000,"1m"))
 
-                indices, attQuery = inject_fallback_sort(query_sku_attributes(unique_attributes, skus), lang,
-                                                         "systemair_ds_attributes_",
-                                                         "attributeParentId")
-                attributes_res = await self.es.asearch(indices, attQuery)
+                attributes_res = await lang_fallback.search(self.es, query_sku_attributes(unique_attributes, skus), lang,
+                                                            "systemair_ds_attributes_", "attributeParentId")
                 att_response = attributes_res.get("hits", {}).get("hits", [])
 
                 # for hit in att_response.get("hits", {}).get("hits", []):
@@ -1102,8 +1276,7 @@ class SkuBuilder:
                     res[epim_id]["fallback"] = True
                     # Return the first image URL if available, otherwise None
             att_index = f"systemair_ds_attributes_{lang}"
-            att_response = list(
-                self.es.getScrollObject(att_index, query_elements_attributes(vaiants_elements), 10000, "1m"))
+            att_response = await self.es.agetScrollObject(att_index, query_elements_attributes(vaiants_elements), 10000, "1m")
 
             check_inactive_internal = {}
             for hit in att_response:
@@ -1224,10 +1397,15 @@ class SkuBuilder:
         then formats it as: { ondemand, string, float, currency }.
         """
         market = market.replace("-", "_")
-
         prodNr = refSku.get("productNr") if refSku else sku.get("productNr")
+        if price_snapshot.loaded:
+            return self._format_price(price_snapshot.lookup(prodNr, market))
         rows = await self.db.aexecute_query(query_price(), {"productnr": prodNr})
-        if not rows:
+        return self._format_price(_price_columns(rows[0], market) if rows else None)
+
+    def _format_price(self, price: Optional[tuple]) -> Price:
+        """Format a (raw price, currency) pair; None means the product has no price row."""
+        if price is None:
             # no price → on-demand
             return Price(
                 ondemand=True,
@@ -1236,9 +1414,7 @@ class SkuBuilder:
                 currency=None,
             )
 
-        row = rows[0]
-        raw = row[str(market + "_PRICE")]
-        curr = row[str(market + "_CURRENCY")]
+        raw, curr = price
 
         # numeric value
         try:
@@ -1274,7 +1450,30 @@ class SkuBuilder:
         From a list of ES attribute hits, return only those contain  "-CERT-"
         whose first 'value' == 1, as Certification objects.
         """
-        cert_table = await self.es.asearch(f"systemair_ds_producttables_{lang}", query_cert_definitions())
+        merged_dict = await self.get_cert_definitions(lang)
+        try:
+            response = await self.es.asearch(f"systemair_ds_attributes_{lang}", query_certifications(identifiers))
+        except Exception:
+            logger.exception("Error parsing certifications")
+            return []
+        hits = response.get("hits", {}).get("hits", [])
+        images = await self._resolve_previews([str(hit.get("_source", hit).get("flag1ObjeId", "")) for hit in hits],
+                                              lang)
+        return await self._parse_certification_hits(hits, merged_dict,
+                                                     lambda image_id: _prefetched(images.get(image_id, "")))
+
+    async def _resolve_previews(self, element_ids: List[str], lang: str) -> Dict[str, Union[str, BaseException]]:
+        """element_previews.resolve; when the search fails every id maps to the error instead."""
+        try:
+            return await element_previews.resolve(self.es, lang, element_ids)
+        except Exception as e:
+            return {str(element_id): e for element_id in element_ids}
+
+    async def get_cert_definitions(self, lang: str) -> Dict[str, dict]:
+        return await reference_cache.get(("cert_definitions", lang), lambda: self._load_cert_definitions(lang))
+
+    async def _load_cert_definitions(self, lang: str) -> Dict[str, dict]:
+        cert_table = await cached_search(self.es, f"systemair_ds_producttables_{lang}", query_cert_definitions())
         hits = cert_table.get("hits", {}).get("hits", [])
         table_rows = hits[0]["_source"].get("table", [])[0].get("rows", [])
         # Build seq â†’ label mapping from row 0
@@ -1301,10 +1500,13 @@ class SkuBuilder:
                 "nullFallbackText": cell.get("nullFallbackText"),
                 "nullFallbackTextDictId": cell.get("nullFallbackTextDictId"),
             }
+        return merged_dict
+
+    async def _parse_certification_hits(self, hits: List[dict], merged_dict: Dict[str, dict],
+                                        image_for) -> List[Certification]:
         result: List[Certification] = []
         try:
-            response = await self.es.asearch(f"systemair_ds_attributes_{lang}", query_certifications(identifiers))
-            for att in response.get("hits", {}).get("hits", []):
+            for att in hits:
                 # Some callers pass the raw dict or an ES hitâ€”normalize both
                 src = att.get("_source", att)
 
@@ -1313,7 +1515,7 @@ class SkuBuilder:
                     id=str(src.get("attributeId", "")),
                     name=name,
                     label=merged_dict[name]["label"],
-                    image=await self.get_image_byId(str(src.get("flag1ObjeId", "")), lang),
+                    image=await image_for(str(src.get("flag1ObjeId", ""))),
                     text=merged_dict[name]["nullFallbackText"]
                 )
                 result.append(cert)
@@ -1324,11 +1526,7 @@ class SkuBuilder:
         return result
 
     async def get_image_byId(self, id: str, lang: str) -> Optional[str]:
-        response = await self.es.asearch(f"systemair_ds_elements_{lang}", query_image_byId(id))
-        hits = response.get("hits", {}).get("hits", [])
-        if hits:
-            return hits[0]["_source"].get("dsElementPreviewFile")
-        return ""
+        return await element_previews.resolve_one(self.es, lang, id)
 
     async def parse_attributes_async(self, data: Dict[str, dict]) -> Dict[str, Attribute]:
         return self.parse_attributes(data)
@@ -1400,6 +1598,7 @@ class SkuBuilder:
             # Group button attributes by their base name (without -LNK or -IMG suffix)
             from collections import defaultdict
             grouped = defaultdict(lambda: {"icon": None, "url": None})
+            icon_ids = {}
 
             for hit in hits:
                 src = hit.get("_source", {})
@@ -1421,7 +1620,14 @@ class SkuBuilder:
                 if suffix == "LNK":
                     grouped[base]["url"] = val
                 elif suffix == "IMG":
-                    grouped[base]["icon"] = await self.get_image_byId(src.get("flag0ObjeId", ""), lang)
+                    # creates the entry in hit order; the icon itself is resolved below
+                    grouped[base]["icon"] = None
+                    icon_ids[base] = src.get("flag0ObjeId", "")
+
+            # every icon in one lookup
+            icons = await element_previews.resolve(self.es, lang, icon_ids.values())
+            for base, icon_id in icon_ids.items():
+                grouped[base]["icon"] = icons[str(icon_id)]
 
             # Button type to name mapping
             BUTTON_MAP = {
@@ -1468,6 +1674,7 @@ class SkuBuilder:
         identifiers = [i for i in [sku_id, refSku_id] if i is not None]
         return identifiers
 
+    @batched_searches
     async def get_relations(self, identifier, lang, brand) -> List["Relation"]:
         """
         Fetches related SKUs/accessories for a given SKU identifier.
@@ -1598,6 +1805,7 @@ class SkuBuilder:
 
         return relations
 
+    @batched_searches
     async def get_documents(self, identifier, lang, brand) -> List["Document"]:
         """
         Fetches related documents for a given SKU identifier.
@@ -1716,7 +1924,7 @@ class SkuBuilder:
         attributes = [market_attr, expired_attr, m3_name]
 
         # Get the attributes for the SKUs
-        attributes = await self.es.getScrollObject(
+        attributes = await self.es.agetScrollObject(
             f"systemair_ds_attributes_{lang}",
             query_sku_attributes(attributes, sku_ids),
             10000,
@@ -1,31 +1,38 @@
 import logging
-from typing import List, Optional
+from typing import FrozenSet, List, Optional
 from models.sku import Sku, SkuListResponse
 from models.product import ProductDocument
 from services.sku_builder import SkuBuilder
 from core.environment import env
 from services.elasticsearch_service import ESConnection
 from queries.sku_queries import query_skus,query_shopSku_market,query_sku_by_refrence_id
+from queries.hierarchy_queries import brand_filter
+from services.brand_filters import brand_terms
+from services.single_flight import entity_flight
 from quart import current_app
 from utils.mapping import map_brand, map_locale, map_market
+from utils.pagination import InvalidCursor, cursor_meta, cursor_paging
 logger = logging.getLogger(__name__)
 
 
 
 # Single SKU by ID or slug
-async def get_sku_by_id(identifier: str, lang: str, brand: str, market: str) -> Optional[Sku]:
-    """Get SKU by its internal identifier."""
+async def get_sku_by_id(identifier: str, lang: str, brand: str, market: str,
+                        fields: Optional[FrozenSet[str]] = None) -> Optional[Sku]:
+    """Get SKU by its internal identifier (only `fields`, when given)."""
     builder = SkuBuilder(current_app.es, current_app.db)
-    return await builder.build_sku(identifier, lang, brand, market)
+    return await entity_flight.do(("sku", str(identifier), lang, brand, market, fields),
+                                  lambda: builder.build_sku(identifier, lang, brand, market, fields))
 
 # Single SKU by vendor ID
-async def get_sku_by_vendor_id(vendor_id: str, lang: str, brand: str, market: str) -> Optional[Sku]:
+async def get_sku_by_vendor_id(vendor_id: str, lang: str, brand: str, market: str,
+                               fields: Optional[FrozenSet[str]] = None) -> Optional[Sku]:
     """Get SKU by vendor ID (product number)."""
     from queries.sku_queries import query_sku_by_vendor_id
     
     # First, find the internal ID using the vendor ID
     index = f"systemair_ds_products_{lang}"
-    response = current_app.es.search(index, query_sku_by_vendor_id(vendor_id))
+    response = await current_app.es.asearch(index, query_sku_by_vendor_id(vendor_id))
     hits = response.get("hits", {}).get("hits", [])
     
     if not hits:
@@ -36,7 +43,8 @@ async def get_sku_by_vendor_id(vendor_id: str, lang: str, brand: str, market: st
 
     if not sku_id:
         return None
-    ref_response = current_app.es.search(index, query_sku_by_refrence_id(sku_id, brand))
+    terms = await brand_terms.resolve(current_app.es, index, brand)
+    ref_response = await current_app.es.asearch(index, query_sku_by_refrence_id(sku_id, brand, terms))
     ref_hits = ref_response.get("hits", {}).get("hits", [])
     if not ref_hits:
         return None
@@ -45,10 +53,11 @@ async def get_sku_by_vendor_id(vendor_id: str, lang: str, brand: str, market: st
         return None
 
     # Now build the full SKU using the internal ID
-    return await get_sku_by_id(ref_id, lang, brand, market)
+    return await get_sku_by_id(ref_id, lang, brand, market, fields)
 
 # Unified function to get SKU by either ID or vendor ID
-async def get_sku(identifier: str, lang: str, brand: str, market: str, use_vendor_id: bool = False) -> Optional[Sku]:
+async def get_sku(identifier: str, lang: str, brand: str, market: str, use_vendor_id: bool = False,
+                  fields: Optional[FrozenSet[str]] = None) -> Optional[Sku]:
     """Get SKU by either internal ID or vendor ID.
     
     Args:
@@ -57,13 +66,14 @@ async def get_sku(identifier: str, lang: str, brand: str, market: str, use_vendo
         brand: Brand identifier
         market: Market identifier
         use_vendor_id: If True, treats the identifier as a vendor ID
+        fields: Only build these fields (see utils.fieldsets)
         
     Returns:
         Sku object if found, None otherwise
     """
     if use_vendor_id:
-        return await get_sku_by_vendor_id(identifier, lang, brand, market)
-    return await get_sku_by_id(identifier, lang, brand, market)
+        return await get_sku_by_vendor_id(identifier, lang, brand, market, fields)
+    return await get_sku_by_id(identifier, lang, brand, market, fields)
 
 # Paginated list of SKUs
 async def get_skus_old(offset: int, limit: int, lang: str, market:str) -> SkuListResponse:
@@ -83,7 +93,7 @@ async def get_skus_old(offset: int, limit: int, lang: str, market:str) -> SkuLis
         meta={"total": total, "offset": offset, "limit": limit},
         items=items
     )
-async def get_skus(offset=0, limit=10, brand="systemair", lang="deu_deu", market="") -> SkuListResponse:
+async def get_skus(offset=0, limit=10, brand="systemair", lang="deu_deu", market="", cursor=None) -> SkuListResponse:
     es = current_app.es
     db=current_app.db
     builder = SkuBuilder(es,db)
@@ -95,19 +105,7 @@ async def get_skus(offset=0, limit=10, brand="systemair", lang="deu_deu", market
         "query": {
             "bool": {
                 "filter": [
-                    {
-                        "nested": {
-                            "path": "hierarchies",
-                            "query": {
-                                "script": {
-                                    "script": {
-                                        "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
-                                        "lang": "painless"
-                                    }
-                                }
-                            }
-                        }
-                    },
+                    brand_filter(brand, await brand_terms.resolve(es, index, brand)),
                     {
                         "nested": {
                             "path": "hierarchies",
@@ -134,46 +132,37 @@ async def get_skus(offset=0, limit=10, brand="systemair", lang="deu_deu", market
         ]
     }
 
-    response = es.search(index, body)
+    next_cursor = None
+    if cursor is not None:
+        response, next_cursor = await cursor_paging.page(es, index, body, body["sort"], limit, cursor)
+    else:
+        response = await es.asearch(index, body)
     #response = list(es.getScrollObject(index, body, 10000, "1m"))
     hits = response.get("hits", {}).get("hits", [])
     #total = len(hits)
     total = response.get("hits", {}).get("total", {}).get("value", 0)
     mapped_brand = map_brand(brand)
-    items: List[Sku] = []
-    for hit in hits:
-        sku_id = hit["_source"].get("epimId")
-        if sku_id:
-            sku = await builder.build_sku(sku_id, lang, brand,market)
-            if sku:
-                items.append(sku)
+    sku_ids = [hit["_source"].get("epimId") for hit in hits if hit["_source"].get("epimId")]
+    items: List[Sku] = [sku for sku in await builder.build_many(sku_ids, lang, brand, market) if sku]
 
     return SkuListResponse(
-        meta={"offset": offset, "limit": limit, "total": total},
+        meta=cursor_meta(limit, total, next_cursor) if cursor is not None
+        else {"offset": offset, "limit": limit, "total": total},
         items=items
     )
 
-async def get_shop_sku_ids(lang: str, brand: str, market: str, size: int = 1000, offset: int = 0, timestamp: Optional[int] = None) -> tuple:
+async def get_shop_sku_ids(lang: str, brand: str, market: str, size: int = 1000, offset: int = 0, timestamp: Optional[int] = None,
+                           cursor: Optional[str] = None) -> tuple:
     """
     Return a list of SKU IDs for shop view from Elasticsearch for the given brand/locale/market, optionally filtered by timestamp (epoch ms).
+    With a cursor ("" for the first page) pages by point in time + search_after; the third value is the
+    cursor of the next page (None at the end, and always None without a cursor).
     """
     from quart import current_app
     es = current_app.es
     index = f"systemair_ds_products_{lang}"
     filters = [
-        {
-            "nested": {
-                "path": "hierarchies",
-                "query": {
-                    "script": {
-                        "script": {
-                            "source": f"doc['hierarchies.hierarchy'].value.toLowerCase().startsWith('{brand}')",
-                            "lang": "painless"
-                        }
-                    }
-                }
-            }
-        },
+        brand_filter(brand, await brand_terms.resolve(es, index, brand)),
         {
             "nested": {
                 "path": "hierarchies",
@@ -220,8 +209,12 @@ async def get_shop_sku_ids(lang: str, brand: str, market: str, size: int = 1000,
     }
     try:
 
-        total = es.getIndexCount(index, queryCount,None)
-        response = es.search(index, query)
+        total = await es.agetIndexCount(index, queryCount)
+        next_cursor = None
+        if cursor is not None:
+            response, next_cursor = await cursor_paging.page(es, index, query, query["sort"], size, cursor)
+        else:
+            response = await es.asearch(index, query)
         hits = response.get("hits", {}).get("hits", [])
         ids = [hit["_source"]["epimId"] for hit in hits if "epimId" in hit["_source"]]
         ref_ids = [hit["_source"]["referenceId"] for hit in hits if "referenceId" in hit["_source"]]
@@ -229,7 +222,7 @@ async def get_shop_sku_ids(lang: str, brand: str, market: str, size: int = 1000,
         # Query attributes for each ref_id (market attribute)
         attIndex = f"systemair_ds_attributes_{lang}"
         attr_query = query_shopSku_market(marketCorrected, ref_ids)
-        attr_response = es.search(attIndex, attr_query)
+        attr_response = await es.asearch(attIndex, attr_query)
         attr_hits = attr_response.get("hits", {}).get("hits", [])
         # Map parentId (ref_id) to value
         attr_map = {hit["_source"]["parentId"]: hit["_source"].get("values", [{}])[0].get("value", 0) for hit in attr_hits}
@@ -244,8 +237,10 @@ async def get_shop_sku_ids(lang: str, brand: str, market: str, size: int = 1000,
                 "id": id_,
                 marketCorrected[0]: value
             })
-        return result, total
+        return result, total, next_cursor
+    except InvalidCursor:
+        raise
     except Exception as e:
         import logging
         logging.getLogger(__name__).exception(f"Failed to fetch shop SKU IDs: {e}")
-        return [], 0
+        return [], 0, None
@@ -0,0 +1,246 @@
+import contextvars
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, List, Optional
+
+import orjson
+
+logger = logging.getLogger("services.tracing")
+
+_current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar(
+    "request_trace", default=None
+)
+
+
+def current_trace() -> Optional["RequestTrace"]:
+    return _current_trace.get()
+
+
+def query_shape(query: Any) -> str:
+    """Short hash of a query's structure (keys and nesting, values left out): equal for the same query with other ids."""
+
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            shapes = []
+            for item in value:
+                shape = strip(item)
+                if shape not in shapes:
+                    shapes.append(shape)
+            return shapes
+        return "?"
+
+    if isinstance(query, str):
+        # SQL: the statement without literals
+        raw = " ".join(query.split()).encode()
+    else:
+        raw = orjson.dumps(strip(query), option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha1(raw).hexdigest()[:8]
+
+
+def _busy_seconds(intervals: List[tuple]) -> float:
+    """Wall time covered by at least one of the (start, end) intervals."""
+    busy, until = 0.0, None
+    for start, end in sorted(intervals):
+        if until is None or start > until:
+            busy += end - start
+            until = end
+        elif end > until:
+            busy += end - until
+            until = end
+    return busy
+
+
+class _Call:
+    __slots__ = ("kind", "target", "query", "started", "ended", "hits", "size")
+
+    def __init__(self, kind, target, query, started, ended, hits, size):
+        self.kind = kind
+        self.target = target
+        self.query = query
+        self.started = started
+        self.ended = ended
+        self.hits = hits
+        self.size = size
+
+    def as_dict(self, origin: float) -> dict:
+        return {
+            "kind": self.kind,
+            "target": self.target,
+            "shape": query_shape(self.query),
+            "start_ms": round((self.started - origin) * 1000, 2),
+            "ms": round((self.ended - self.started) * 1000, 2),
+            "hits": self.hits,
+            "bytes": self.size,
+        }
+
+
+def _hit_count(result) -> Optional[int]:
+    if isinstance(result, dict):
+        hits = result.get("hits")
+        return len(hits.get("hits", [])) if isinstance(hits, dict) else None
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+
+class RequestTrace:
+    """
+    Ledger of one request: every ES search / scroll / point-in-time page and DB query (target, query,
+    start and end, hit count, and with `detailed` the response size) plus the time spent in builder
+    steps (spans). Query shapes and sizes are only computed when the trace is reported.
+
+    Only the first `max_calls` calls are kept; later ones (long scrolls, streamed exports and feeds)
+    are counted per kind and target with their summed time, keeping only the group's first query (its
+    shape stands for the group in offenders()).
+    """
+
+    def __init__(self, detailed: bool = False, max_calls: int = 500):
+        self.detailed = detailed
+        self.max_calls = max_calls
+        self.started = time.perf_counter()
+        self.calls: List[_Call] = []
+        # (kind, target) -> [calls, seconds, first query] of the calls past max_calls
+        self.overflow = {}
+        self.round_trips = 0
+        self.spans = defaultdict(lambda: [0, 0.0])
+
+    def record(self, kind: str, target, query, started: float, result=None) -> None:
+        if isinstance(target, (list, tuple)):
+            target = ",".join(target)
+        if len(self.calls) >= self.max_calls:
+            group = self.overflow.get((kind, target))
+            if group is None:
+                group = self.overflow[(kind, target)] = [0, 0.0, query]
+            group[0] += 1
+            group[1] += time.perf_counter() - started
+            return
+        size = None
+        if self.detailed and result is not None:
+            size = len(orjson.dumps(result, default=str))
+        self.calls.append(_Call(kind, target, query, started, time.perf_counter(), _hit_count(result), size))
+
+    def count(self, kind: str) -> int:
+        return (sum(1 for c in self.calls if c.kind == kind)
+                + sum(calls for (k, _), (calls, _, _) in self.overflow.items() if k == kind))
+
+    async def span(self, name: str, awaitable: Awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            span = self.spans[name]
+            span[0] += 1
+            span[1] += time.perf_counter() - started
+
+    def busy(self, kind: str) -> float:
+        """Wall seconds with at least one call of kind ("es" or "db") in flight (calls past max_calls
+        are added as their summed time)."""
+        return (_busy_seconds([(c.started, c.ended) for c in self.calls if c.kind == kind])
+                + sum(seconds for (k, _), (_, seconds, _) in self.overflow.items() if k == kind))
+
+    def server_timing(self, total: float) -> str:
+        parts = []
+        for kind in ("es", "db"):
+            count = self.count(kind)
+            if count:
+                parts.append(f'{kind};dur={self.busy(kind) * 1000:.1f};desc="{count} calls"')
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+    def offenders(self, top: int = 5) -> List[dict]:
+        """Calls grouped by kind, target and query shape, slowest total first."""
+        groups = {}
+        for call in self.calls:
+            key = (call.kind, call.target, query_shape(call.query))
+            group = groups.setdefault(key, {"kind": key[0], "target": key[1], "shape": key[2], "calls": 0, "ms": 0.0})
+            group["calls"] += 1
+            group["ms"] += (call.ended - call.started) * 1000
+        for (kind, target), (calls, seconds, query) in self.overflow.items():
+            key = (kind, target, query_shape(query))
+            group = groups.setdefault(key, {"kind": key[0], "target": key[1], "shape": key[2], "calls": 0, "ms": 0.0})
+            group["calls"] += calls
+            group["ms"] += seconds * 1000
+        ranked = sorted(groups.values(), key=lambda g: g["ms"], reverse=True)[:top]
+        for group in ranked:
+            group["ms"] = round(group["ms"], 2)
+        return ranked
+
+    def top_spans(self, top: int = 5) -> List[dict]:
+        ranked = sorted(self.spans.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return [{"step": name, "calls": count, "ms": round(seconds * 1000, 2)} for name, (count, seconds) in ranked]
+
+    def report(self) -> dict:
+        """The `?_trace=1` appendix."""
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "es_ms": round(self.busy("es") * 1000, 2),
+            "db_ms": round(self.busy("db") * 1000, 2),
+            "es_round_trips": self.round_trips,
+            "calls": [call.as_dict(self.started) for call in self.calls],
+            "calls_not_listed": sum(calls for calls, _, _ in self.overflow.values()),
+            "steps": self.top_spans(len(self.spans)),
+            "offenders": self.offenders(),
+        }
+
+
+class Tracing:
+    """Settings of the request tracer (and counters of the requests it saw)."""
+
+    def __init__(self, enabled: bool = True, debug: bool = False, slow_threshold: float = 0.5, top: int = 5,
+                 max_calls: int = 500):
+        self.enabled = enabled
+        # ?_trace=1 appends the whole ledger (indices, timings) to JSON responses: off unless configured
+        self.debug = debug
+        self.slow_threshold = slow_threshold
+        self.top = top
+        self.max_calls = max_calls
+        self.traced = 0
+        self.slow = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        if "enabled" in config:
+            self.enabled = str(config["enabled"]).strip().lower() in ("1", "true", "yes", "on")
+        if "debug" in config:
+            self.debug = str(config["debug"]).strip().lower() in ("1", "true", "yes", "on")
+        self.slow_threshold = float(config.get("slow_threshold", self.slow_threshold))
+        self.top = int(config.get("top", self.top))
+        self.max_calls = int(config.get("max_calls", self.max_calls))
+
+    def start(self, detailed: bool = False) -> Optional[RequestTrace]:
+        """Trace the current request (its task and the tasks it creates from now on)."""
+        if not self.enabled:
+            return None
+        trace = RequestTrace(detailed=detailed, max_calls=self.max_calls)
+        _current_trace.set(trace)
+        self.traced += 1
+        return trace
+
+    def slow_summary(self, trace: RequestTrace) -> str:
+        self.slow += 1
+        es = trace.count("es")
+        db = trace.count("db")
+        offenders = "; ".join(f"{o['kind']} {o['target']} [{o['shape']}] x{o['calls']} {o['ms']:.0f}ms"
+                              for o in trace.offenders(self.top))
+        steps = "; ".join(f"{s['step']} x{s['calls']} {s['ms']:.0f}ms" for s in trace.top_spans(self.top))
+        return (f"es {es} calls {trace.busy('es'):.2f}s ({trace.round_trips} round trips), "
+                f"db {db} calls {trace.busy('db'):.2f}s | top calls: {offenders or '-'} | top steps: {steps or '-'}")
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "debug": self.debug, "slow_threshold": self.slow_threshold,
+                "max_calls": self.max_calls, "traced": self.traced, "slow": self.slow}
+
+
+tracing = Tracing()
+
+
+async def traced(name: str, awaitable: Awaitable):
+    """Await awaitable, counting its time under `name` in the current request's trace (if any)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return await awaitable
+    return await trace.span(name, awaitable)
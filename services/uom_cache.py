@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional
+
+from queries.sku_queries import query_uom
+
+logger = logging.getLogger("services.uom_cache")
+
+
+class UomMappingCache:
+    """
+    Division -> {BASE_ATTRIBUTE: CONVERTED_ATTRIBUTE} from vmps_mapping_units_of_measurements.
+
+    Warmed for every known division at startup and reloaded every `refresh_interval` seconds
+    by a background task, so parse_att_definitions never waits on MSSQL. A division that was
+    not preloaded is loaded once on first use.
+    """
+
+    def __init__(self, refresh_interval: float = 900.0):
+        self.refresh_interval = refresh_interval
+        self._mappings: Dict[str, Dict[str, str]] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.refresh_interval = float(config.get("refresh_interval", self.refresh_interval))
+
+    async def get(self, db, division: str) -> Dict[str, str]:
+        mapping = self._mappings.get(division)
+        if mapping is not None:
+            self.hits += 1
+            return mapping
+        self.misses += 1
+        future = self._loading.get(division)
+        if future is None:
+            future = asyncio.ensure_future(self._load(db, division))
+            self._loading[division] = future
+            future.add_done_callback(lambda _: self._loading.pop(division, None))
+        return await asyncio.shield(future)
+
+    async def _load(self, db, division: str) -> Dict[str, str]:
+        rows = await db.aexecute_query(query_uom(), {"division": division})
+        mapping = {
+            d["BASE_ATTRIBUTE"]: d["CONVERTED_ATTRIBUTE"]
+            for d in rows
+            if "BASE_ATTRIBUTE" in d and "CONVERTED_ATTRIBUTE" in d
+        }
+        self._mappings[division] = mapping
+        return mapping
+
+    async def preload(self, db, divisions: Iterable[str]) -> None:
+        for division in divisions:
+            try:
+                await self._load(db, division)
+            except Exception:
+                logger.exception("Failed to preload UOM mapping for division %s", division)
+        logger.info("UOM mappings loaded for %d divisions", len(self._mappings))
+
+    async def refresh(self, db) -> None:
+        """Reload every known division; a division that fails keeps its previous mapping."""
+        for division in list(self._mappings):
+            try:
+                await self._load(db, division)
+                self.refreshes += 1
+            except Exception:
+                self.refresh_errors += 1
+                logger.warning("UOM mapping refresh failed for division %s; keeping previous mapping",
+                               division, exc_info=True)
+
+    def start_refresh(self, db) -> None:
+        if self._refresh_task is None and self.refresh_interval > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(db))
+
+    async def _refresh_loop(self, db) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh(db)
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    def stats(self) -> dict:
+        return {
+            "divisions": len(self._mappings),
+            "refresh_interval": self.refresh_interval,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+uom_cache = UomMappingCache()
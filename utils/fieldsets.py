@@ -0,0 +1,80 @@
+import asyncio
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Type
+
+from pydantic import BaseModel, TypeAdapter
+
+from services.tracing import traced
+
+
+def parse_fields(value: Optional[str], model: Type[BaseModel]) -> Optional[FrozenSet[str]]:
+    """
+    `fields=` query value (comma separated field names of model) as a set, or None for the full entity.
+    Raises ValueError naming the unknown fields.
+    """
+    if value is None or not value.strip():
+        return None
+    fields = frozenset(name.strip() for name in value.split(",") if name.strip())
+    unknown = sorted(fields - set(model.model_fields))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields | {"id"}
+
+
+def wants(fields: Optional[FrozenSet[str]], names: Iterable[str]) -> bool:
+    """Whether any of names is requested (always, for a full entity)."""
+    return fields is None or not fields.isdisjoint(names)
+
+
+@lru_cache(maxsize=None)
+def _adapter(model: Type[BaseModel], name: str) -> TypeAdapter:
+    return TypeAdapter(model.model_fields[name].annotation)
+
+
+class PartialEntity:
+    """
+    The requested fields of a model instance. Values are validated against the model's field types and
+    model_dump() dumps them exactly as the full model would; other computed values (e.g. ids the response
+    cache keys on) stay readable as attributes.
+    """
+
+    def __init__(self, model: Type[BaseModel], values: dict, fields: FrozenSet[str]):
+        self.model = model
+        self.fields = fields
+        self.values = {name: _adapter(model, name).validate_python(value) if name in model.model_fields else value
+                       for name, value in values.items()}
+
+    @classmethod
+    def of(cls, entity: BaseModel, fields: FrozenSet[str]) -> "PartialEntity":
+        return cls(type(entity), dict(entity), fields)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["values"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def model_dump(self) -> dict:
+        return {name: _adapter(self.model, name).dump_python(self.values[name])
+                for name in self.model.model_fields if name in self.fields and name in self.values}
+
+
+def sparse(entity: Optional[BaseModel], fields: Optional[FrozenSet[str]]):
+    """entity, or only its requested fields."""
+    if entity is None or fields is None:
+        return entity
+    return PartialEntity.of(entity, fields)
+
+
+async def assemble(model: Type[BaseModel], fixed: dict, tasks: Dict[str, Callable[[], Awaitable]],
+                   fields: Optional[FrozenSet[str]] = None):
+    """
+    Builder tail: run the tasks (field name -> coroutine factory) of the requested fields concurrently and
+    return the model, or a PartialEntity of the requested fields. Tasks of other fields are never started.
+    """
+    wanted = {name: task for name, task in tasks.items() if fields is None or name in fields}
+    values = dict(zip(wanted, await asyncio.gather(
+        *(traced(f"{model.__name__}.{name}", task()) for name, task in wanted.items()))))
+    if fields is None:
+        return model(**fixed, **values)
+    return PartialEntity(model, {**fixed, **values}, fields)
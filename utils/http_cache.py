@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+
+from quart import Response, request
+from werkzeug.http import http_date
+
+
+def payload_etag(payload: bytes) -> str:
+    """Strong ETag (quoted) of a serialized response body."""
+    return '"' + hashlib.sha1(payload).hexdigest() + '"'
+
+
+def epoch_ms_to_datetime(value) -> Optional[datetime]:
+    """`timestamp` field value (epoch milliseconds, as returned by a max aggregation) as a UTC datetime."""
+    if not isinstance(value, (int, float)):
+        return None
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+class HttpCaching:
+    """
+    Conditional GET for the JSON entity routes: ETag / Last-Modified / Cache-Control on every
+    200, and 304 when If-None-Match matches the ETag (or, without If-None-Match, when the
+    document is not newer than If-Modified-Since).
+    """
+
+    def __init__(self, max_age: int = 60, stale_while_revalidate: int = 300):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.not_modified = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.max_age = int(config.get("max_age", self.max_age))
+        self.stale_while_revalidate = int(config.get("stale_while_revalidate", self.stale_while_revalidate))
+
+    @property
+    def cache_control(self) -> str:
+        value = f"public, max-age={self.max_age}"
+        if self.stale_while_revalidate > 0:
+            value += f", stale-while-revalidate={self.stale_while_revalidate}"
+        return value
+
+    def is_not_modified(self, etag: str, last_modified: Optional[datetime] = None) -> bool:
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag.strip('"'))
+        since = request.if_modified_since
+        return since is not None and last_modified is not None and last_modified.replace(microsecond=0) <= since
+
+    def response(self, payload: bytes, etag: Optional[str] = None,
+                 last_modified: Optional[datetime] = None) -> Response:
+        """200 with payload, or an empty 304 when the client already holds this version."""
+        etag = etag or payload_etag(payload)
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if last_modified is not None:
+            headers["Last-Modified"] = http_date(last_modified)
+        if self.is_not_modified(etag, last_modified):
+            self.not_modified += 1
+            return Response(status=304, headers=headers)
+        return Response(payload, mimetype="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        return {"cache_control": self.cache_control, "not_modified": self.not_modified}
+
+
+http_caching = HttpCaching()
@@ -973,6 +973,11 @@ def map_market(brand: str, language_pim: str) -> str:
     return brand
 
 
+def get_market_divisions() -> List[str]:
+  """Division codes ("005", "040", ...) of every market in market_mapping."""
+  return sorted({entry["Market ID"][-3:] for entry in market_mapping if entry.get("Market ID")})
+
+
 def get_epimLang_by_market(market: str) -> str:
   m = market.casefold()
   langs: List[str] = []
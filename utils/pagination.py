@@ -1,3 +1,12 @@
+import base64
+import binascii
+import hashlib
+from typing import Optional
+
+import orjson
+from elasticsearch.exceptions import RequestError
+
+
 def paginate(items, page, page_size):
     start = (page - 1) * page_size
     end = start + page_size
@@ -10,4 +19,93 @@ def extract_pagination(args):
         page, page_size = 1, 10
 
     offset = (page - 1) * page_size
-    return offset, page, page_size
\ No newline at end of file
+    return offset, page, page_size
+
+class InvalidCursor(ValueError):
+    """A cursor token that is malformed or was issued for another listing."""
+
+
+def _cursor_scope(index: str, query: dict, sort: list) -> str:
+    # the listing a cursor belongs to: same index, filters and sort (from/size/limit may change between pages)
+    body = {k: v for k, v in query.items() if k not in ("from", "size", "sort")}
+    return hashlib.sha1(orjson.dumps([index, body, sort], option=orjson.OPT_SORT_KEYS)).hexdigest()[:12]
+
+
+def encode_cursor(position: dict, scope: str) -> str:
+    """Opaque token of an ESConnection.asearch_page position."""
+    raw = orjson.dumps({"p": position["pit"], "a": position["after"], "s": scope})
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _sort_value(value) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def decode_cursor(token: str, scope: str, sort: Optional[list] = None) -> dict:
+    """Position of a token from encode_cursor. The token is not signed: `after` must be sort values (one
+    per `sort` entry, plus the tiebreaker ES adds to point in time pages) and the pit id a string."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = orjson.loads(raw)
+        position = {"pit": state["p"], "after": state["a"]}
+    except (ValueError, TypeError, KeyError, AttributeError, binascii.Error):
+        raise InvalidCursor("Invalid cursor") from None
+    after = position["after"]
+    if state.get("s") != scope or not isinstance(after, list):
+        raise InvalidCursor("Cursor does not belong to this listing")
+    if (not after or not all(_sort_value(value) for value in after)
+            or (sort is not None and len(after) not in (len(sort), len(sort) + 1))
+            or not (position["pit"] is None or isinstance(position["pit"], str))):
+        raise InvalidCursor("Invalid cursor")
+    return position
+
+
+def cursor_meta(limit: int, total: int, next_cursor: Optional[str]) -> dict:
+    """meta of a cursor page: `next` is the cursor of the following page, absent on the last one."""
+    meta = {"limit": limit, "total": total}
+    if next_cursor is not None:
+        meta["next"] = next_cursor
+    return meta
+
+
+class CursorPaging:
+    """
+    Cursor pagination of the list endpoints: point in time + search_after pages (ESConnection.asearch_page)
+    behind an opaque token, so page N costs the same as page 1 instead of ES collecting offset + limit hits.
+    The first page (empty cursor) opens a point in time kept alive `keep_alive` between pages; an expired one
+    is replaced by the live index, so a client may resume a cursor later at the price of snapshot consistency.
+    """
+
+    def __init__(self, keep_alive: str = "2m"):
+        self.keep_alive = keep_alive
+        self.pages = 0
+        self.resumed = 0
+
+    def configure(self, config: Optional[dict]) -> None:
+        config = config or {}
+        self.keep_alive = config.get("keep_alive", self.keep_alive)
+
+    async def page(self, es, index: str, query: dict, sort: list, limit: int, cursor: str) -> tuple:
+        """(ES response, token of the next page or None after the last page). Raises InvalidCursor, also
+        when ES rejects the position of a cursor (sort values of the wrong type for the sort fields)."""
+        scope = _cursor_scope(index, query, sort)
+        if cursor:
+            position = decode_cursor(cursor, scope, sort)
+            self.resumed += 1
+        else:
+            position = {"pit": await es.open_pit(index, self.keep_alive), "after": None}
+        try:
+            response, position = await es.asearch_page(index, query, sort, limit, position["pit"],
+                                                        position["after"], self.keep_alive)
+        except RequestError:
+            if not cursor:
+                raise
+            raise InvalidCursor("Invalid cursor") from None
+        self.pages += 1
+        return response, (encode_cursor(position, scope) if position is not None else None)
+
+    def stats(self) -> dict:
+        return {"keep_alive": self.keep_alive, "pages": self.pages, "resumed": self.resumed}
+
+
+cursor_paging = CursorPaging()
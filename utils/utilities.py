@@ -5,6 +5,14 @@ from collections import defaultdict
 from typing import Tuple, Optional, Any
 import re
 import orjson
+
+# matches "market-005" and "market-005-expired"
+_MARKET_RE = re.compile(r"^market-(\d+)(?:-expired)?$")
+# trailing "[unit]" of a piped attribute value
+_LAST_BRACKET = re.compile(r"\[(.*?)\]\s*$")
+_WHITESPACE = re.compile(r"\s+")
+
+
 def json_response(data, status=200):
     if isinstance(data, BaseModel):
         payload = data.model_dump() if hasattr(data, "model_dump") else data.dict()
@@ -41,15 +49,77 @@ def inject_fallback_sort(original_query: dict, lang: str, base_index: str = "sys
     }
     return indices, final_query
 
+# rank the fallback sort script gives a langIso that is not in the chain
+LANG_RANK_OTHER = 999
+
+
+def build_lang_ranks(lang_chain: list[str]) -> dict[str, int]:
+    """langIso (lowercase) -> rank, as build_lang_sort_script assigns it (first match wins)."""
+    ranks: dict[str, int] = {}
+    for i, lang in enumerate(lang_chain):
+        ranks.setdefault(lang, i)
+    return ranks
+
+
+def split_fallback_queries(original_query: dict, lang: str, base_index: str = "systemair_ds_attributes_",
+                           collapse_field: str = "attributeParentId") -> Optional[list[tuple[str, dict]]]:
+    """
+    One (index, query) per index of the fallback chain, for merge_fallback_hits: no sort script and
+    no collapse, constant scores (so hits keep ES's shard/doc order, as ties under the script sort do)
+    and langIso plus the collapse field as doc values. None when the query pages with `from`.
+    """
+    if original_query.get("from"):
+        return None
+    per_index_query = {key: value for key, value in original_query.items() if key not in ("sort", "collapse")}
+    per_index_query["query"] = {"constant_score": {"filter": original_query.get("query", {"match_all": {}})}}
+    per_index_query["docvalue_fields"] = list(original_query.get("docvalue_fields", [])) + ["langIso", collapse_field]
+    return [(index, per_index_query) for index in build_index_list(base_index, get_fallback_chain(lang))]
+
+
+def merge_fallback_hits(responses: list[dict], lang_chain: list[str], collapse_field: str,
+                        size: int) -> Optional[list[dict]]:
+    """
+    Client-side equivalent of inject_fallback_sort: from the per-index responses of
+    split_fallback_queries (in chain order) keep one hit per collapse key, the one with the highest
+    langIso rank (first hit on ties), ordered by rank descending and then by ES order.
+
+    Returns None when the responses cannot reproduce the collapsed search exactly: an index
+    returned fewer hits than it matched, a hit has no langIso, or two indices share a rank (ES
+    would then interleave their hits by shard).
+    """
+    ranks = build_lang_ranks(lang_chain)
+    winners: dict[Any, tuple] = {}
+    rank_owner: dict[int, int] = {}
+    for position, response in enumerate(responses):
+        hits_info = response.get("hits", {})
+        hits = hits_info.get("hits", [])
+        total = hits_info.get("total")
+        if isinstance(total, dict):
+            total = total.get("value") if total.get("relation", "eq") == "eq" else None
+        if total is None or total > len(hits):
+            return None
+        for order, hit in enumerate(hits):
+            fields = hit.get("fields", {})
+            lang_iso = fields.get("langIso")
+            if not lang_iso:
+                return None
+            rank = ranks.get(str(lang_iso[0]).lower(), LANG_RANK_OTHER)
+            if rank_owner.setdefault(rank, position) != position:
+                return None
+            key_values = fields.get(collapse_field)
+            key = key_values[0] if key_values else None
+            current = winners.get(key)
+            if current is None or rank > current[0]:
+                winners[key] = (rank, position, order, hit)
+    merged = sorted(winners.values(), key=lambda winner: (-winner[0], winner[2]))
+    return [winner[3] for winner in merged[:size]]
+
+
 def shop_statistics(es_docs):
     """
     Return sorted ["MARKET-005", ...] where, for at least one parentId:
       market == 1  AND  expired == 0   (0 or null are false)
     """
-    # matches "market-005" and "market-005-expired"
-
-    _MARKET_RE = re.compile(r"^market-(\d+)(?:-expired)?$")
-
     market_ok = defaultdict(set)  # suffix -> {parentIds with market==1}
     not_expired = defaultdict(set)  # suffix -> {parentIds with expired==0}
     valid_suffixes = set()
@@ -100,7 +170,6 @@ def shop_statistics(es_docs):
 
 
 def parse_piped_value(s: Any) -> Tuple[Any, Optional[str]]:
-    _LAST_BRACKET = re.compile(r"\[(.*?)\]\s*$")
     # Only operate on strings; everything else returned as-is + unit=None
     if not isinstance(s, str):
         return s, None
@@ -113,5 +182,5 @@ def parse_piped_value(s: Any) -> Tuple[Any, Optional[str]]:
     unit = m.group(1)
     base = s[:m.start()]          # drop trailing [...]
     base = base.replace("|", "")  # remove all pipes
-    base = re.sub(r"\s+", " ", base).strip()
+    base = _WHITESPACE.sub(" ", base).strip()
     return base, unit